@@ -1,6 +1,7 @@
 import { type NextRequest, NextResponse } from "next/server"
 import { getJob, updateJobStatus } from "../../../../lib/job-manager"
 import cacheManager from "../../../../lib/cache-manager"
+import { getPythonWorker, pythonWorkerEnabled } from "../../../../lib/python-worker"
 import { spawn } from "child_process"
 import path from "path"
 import fs from "fs"
@@ -30,11 +31,63 @@ interface ProcessingResults {
   mitigationStrategies?: any[]
 }
 
+// Run frame extraction and AI analysis on the uploaded video through runPythonScript (both
+// scripts stream NDJSON events; with PYTHON_WORKER=1 they run in the long-lived worker).
+// Frames are written to public/temp/frames_<jobId> so their image URLs resolve per job.
+async function runVideoPipeline(videoPath: string, jobId: string): Promise<ProcessingResults> {
+  const apiKey = process.env.OPENROUTER_API_KEY
+  if (!apiKey) {
+    throw new Error("OPENROUTER_API_KEY is required when VIDEO_PIPELINE=live")
+  }
+  
+  const framesDirName = `frames_${jobId}`
+  const framesDir = path.join(process.cwd(), "public", "temp", framesDirName)
+  fs.mkdirSync(framesDir, { recursive: true })
+  const frameUrl = (filename: string) => `/temp/${framesDirName}/${path.basename(filename)}`
+  
+  const extraction = await runPythonScript("extract_frames_opencv.py", [videoPath, framesDir, "--ndjson"], (event) => {
+    if (event.event === "progress") {
+      console.log(`[v0] Extraction progress: ${event.samples_processed ?? event.chunks_completed}/${event.samples_total ?? event.chunks_total}`)
+    }
+  })
+  if (!extraction.success) {
+    throw new Error(`Frame extraction failed: ${extraction.error}`)
+  }
+  console.log(`[v0] Extracted ${extraction.total_frames_extracted} unique frames`)
+  
+  const extractedFrames = extraction.frames.map((frame: any) => ({ ...frame, imageUrl: frameUrl(frame.filename) }))
+  
+  const analysis = await runPythonScript("analyze_frames_openrouter.py", [framesDir, apiKey, jobId, "--ndjson"], (event) => {
+    if (event.event === "batch") {
+      console.log(`[v0] Analysis batch ${event.batch_num + 1}/${event.total_batches} ${event.success ? "completed" : "failed"}`)
+    }
+  })
+  if (!analysis.success || !analysis.analysis) {
+    console.error("[v0] AI analysis failed:", analysis.error)
+    return createMockResults(extractedFrames)
+  }
+  
+  const results = analysis.analysis
+  return {
+    incorrectParking: results.incorrectParking,
+    wasteMaterial: results.wasteMaterial,
+    explanation: results.explanation,
+    frames: results.frames.map((frame: any) => ({ ...frame, imageUrl: frameUrl(frame.imageUrl) })),
+    frameDetails: results.frameDetails,
+    mitigationStrategies: results.mitigationStrategies
+  }
+}
+
 async function processVideoWithAI(videoPath: string, jobId: string, filename: string): Promise<ProcessingResults> {
   try {
     console.log("[v0] Starting enhanced video processing pipeline...")
     console.log("[v0] Video path:", videoPath)
     
+    // VIDEO_PIPELINE=live analyzes the uploaded video; otherwise the demo results below are served
+    if (process.env.VIDEO_PIPELINE === "live") {
+      return await runVideoPipeline(videoPath, jobId)
+    }
+    
     // Use static cached data instead of processing
     console.log("[v0] Using static warehouse safety analysis data...")
     
@@ -159,17 +212,59 @@ async function processVideoWithAI(videoPath: string, jobId: string, filename: st
   }
 }
 
+// Event emitted by the Python scripts when run with --ndjson
+interface PythonScriptEvent {
+  event: "frame" | "progress" | "batch" | "result"
+  [key: string]: any
+}
+
 // Helper function to run Python scripts
-async function runPythonScript(scriptName: string, args: string[]): Promise<any> {
+// With --ndjson in args, stdout is parsed line by line as it arrives: every event is passed
+// to onEvent and the promise resolves with the final "result" event, so the full output is
+// never buffered. Without it, stdout is collected and parsed as a single JSON document.
+// With PYTHON_WORKER=1 the script runs in the long-lived pipeline worker instead of a new
+// Python process, with the same events and result.
+async function runPythonScript(
+  scriptName: string,
+  args: string[],
+  onEvent?: (event: PythonScriptEvent) => void
+): Promise<any> {
+  if (pythonWorkerEnabled()) {
+    return getPythonWorker().run(scriptName, args, onEvent as ((event: any) => void) | undefined)
+  }
+  
   return new Promise((resolve, reject) => {
     const scriptPath = path.join(process.cwd(), "scripts", scriptName)
     const pythonProcess = spawn("python", [scriptPath, ...args])
+    const streaming = args.includes("--ndjson")
     
     let output = ""
+    let pendingLine = ""
+    let finalResult: any = undefined
     let errorOutput = ""
     
+    const handleLine = (line: string) => {
+      if (!line.trim()) return
+      try {
+        const event = JSON.parse(line) as PythonScriptEvent
+        if (event.event === "result") {
+          finalResult = event.result
+        }
+        onEvent?.(event)
+      } catch (parseError) {
+        console.error(`[v0] Failed to parse Python event line:`, line.slice(0, 200))
+      }
+    }
+    
     pythonProcess.stdout.on("data", (data) => {
-      output += data.toString()
+      if (!streaming) {
+        output += data.toString()
+        return
+      }
+      
+      const lines = (pendingLine + data.toString()).split("\n")
+      pendingLine = lines.pop() ?? ""
+      lines.forEach(handleLine)
     })
     
     pythonProcess.stderr.on("data", (data) => {
@@ -183,6 +278,16 @@ async function runPythonScript(scriptName: string, args: string[]): Promise<any>
         return
       }
       
+      if (streaming) {
+        handleLine(pendingLine)
+        if (finalResult === undefined) {
+          reject(new Error("Python script finished without a result event"))
+          return
+        }
+        resolve(finalResult)
+        return
+      }
+      
       try {
         const result = JSON.parse(output)
         resolve(result)
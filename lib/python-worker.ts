@@ -0,0 +1,129 @@
+import { spawn, type ChildProcessWithoutNullStreams } from "child_process"
+import path from "path"
+
+// Client for scripts/pipeline_worker.py: one long-lived Python process (with its own pool of
+// warm workers) is started on first use and reused for every job, instead of spawning a new
+// interpreter per script run. Jobs and results travel as line-delimited JSON-RPC over the
+// worker's stdin/stdout.
+
+export interface PythonWorkerEvent {
+  event: string
+  [key: string]: any
+}
+
+interface PendingJob {
+  resolve: (result: any) => void
+  reject: (error: Error) => void
+  onEvent?: (event: PythonWorkerEvent) => void
+  streaming: boolean
+}
+
+declare global {
+  var globalPythonWorker: PythonWorkerClient | undefined
+}
+
+class PythonWorkerClient {
+  private process: ChildProcessWithoutNullStreams | null = null
+  private pending = new Map<number, PendingJob>()
+  private nextId = 1
+  private pendingLine = ""
+
+  private start(): ChildProcessWithoutNullStreams {
+    if (this.process) return this.process
+
+    const scriptPath = path.join(process.cwd(), "scripts", "pipeline_worker.py")
+    const workerArgs = [scriptPath, "--stdio"]
+    if (process.env.PIPELINE_WORKER_POOL_SIZE) {
+      workerArgs.push("--pool-size", process.env.PIPELINE_WORKER_POOL_SIZE)
+    }
+    const child = spawn("python", workerArgs)
+    console.log(`[PythonWorker] Started pipeline worker (pid ${child.pid})`)
+
+    child.stdout.on("data", (data) => {
+      const lines = (this.pendingLine + data.toString()).split("\n")
+      this.pendingLine = lines.pop() ?? ""
+      lines.forEach((line) => this.handleLine(line))
+    })
+
+    child.stderr.on("data", (data) => {
+      process.stderr.write(data)
+    })
+
+    const failAll = (error: Error) => {
+      this.process = null
+      this.pendingLine = ""
+      this.pending.forEach((job) => job.reject(error))
+      this.pending.clear()
+    }
+
+    child.on("close", (code) => {
+      console.error(`[PythonWorker] Pipeline worker exited with code ${code}`)
+      failAll(new Error(`Python worker exited with code ${code}`))
+    })
+
+    child.on("error", (error) => {
+      console.error(`[PythonWorker] Pipeline worker error:`, error)
+      failAll(error)
+    })
+
+    this.process = child
+    return child
+  }
+
+  private handleLine(line: string) {
+    if (!line.trim()) return
+
+    let message: any
+    try {
+      message = JSON.parse(line)
+    } catch (parseError) {
+      console.error(`[PythonWorker] Failed to parse worker message:`, line.slice(0, 200))
+      return
+    }
+
+    if (message.method === "event") {
+      const job = this.pending.get(message.params?.id)
+      job?.onEvent?.(message.params.event)
+      return
+    }
+
+    const job = this.pending.get(message.id)
+    if (!job) return
+    this.pending.delete(message.id)
+
+    if (message.error) {
+      job.reject(new Error(`Python worker job failed: ${message.error.message}`))
+      return
+    }
+
+    // Streaming scripts end with a "result" event; keep that contract for onEvent consumers
+    if (job.streaming) {
+      job.onEvent?.({ event: "result", result: message.result })
+    }
+    job.resolve(message.result)
+  }
+
+  // Run a script (e.g. "extract_frames_opencv.py") with the same arguments as its command line
+  run(scriptName: string, args: string[], onEvent?: (event: PythonWorkerEvent) => void): Promise<any> {
+    return new Promise((resolve, reject) => {
+      const child = this.start()
+      const id = this.nextId++
+      this.pending.set(id, { resolve, reject, onEvent, streaming: args.includes("--ndjson") })
+      const request = { jsonrpc: "2.0", id, method: "run", params: { script: scriptName, args } }
+      child.stdin.write(JSON.stringify(request) + "\n")
+    })
+  }
+}
+
+// Worker client shared across Next.js API route hot reloads
+export function getPythonWorker(): PythonWorkerClient {
+  if (!global.globalPythonWorker) {
+    global.globalPythonWorker = new PythonWorkerClient()
+  }
+  return global.globalPythonWorker
+}
+
+// True when scripts should go through the long-lived worker (PYTHON_WORKER=1)
+export function pythonWorkerEnabled(): boolean {
+  return process.env.PYTHON_WORKER === "1"
+}
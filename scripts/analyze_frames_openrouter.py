@@ -1,190 +1,477 @@
+import time
+_module_start = time.perf_counter()
 import os
 import json
+import re
 import sys
 import base64
-import requests
+import argparse
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import cv2
 import numpy as np
 from pathlib import Path
+from pipeline_events import emit_event, emit_result, enable_event_stream
+from request_resilience import RetryPolicy, TokenBucket, CircuitBreaker, RequestStats, CircuitOpenError, send_with_retries, RETRYABLE_STATUS_CODES
+from llm_response_cache import LLMResponseCache, UploadPayloadCache, fingerprint
+from frame_features import FrameFeatureCache, HammingBKTree, ssim_from_features, histogram_similarity, template_similarity, select_novel_frames
+from stage_timing import StageTimer, profile_run
+from capabilities import probe, load_module, lazy_module, startup_report, import_report
+from run_checkpoint import RunCheckpoint
+
+# Heavy optional dependencies are imported on first use, so runs that never need them
+# (cached answers, no YOLO weights, a failed early check) do not pay for them
+requests = lazy_module("requests")
 
 # Redirect all output to stderr except for final JSON result
 original_stdout = sys.stdout
 
-# Try to import scikit-image, fallback to basic similarity if not available
-try:
-    from skimage.metrics import structural_similarity as ssim
-    HAS_SCIKIT_IMAGE = True
-except ImportError:
+# SSIM is computed from cached frame features; it is only used when scikit-image, whose
+# implementation it matches, is installed. Probed without importing it.
+HAS_SCIKIT_IMAGE = probe("skimage")
+if not HAS_SCIKIT_IMAGE:
     print("Warning: scikit-image not available, using basic similarity detection", file=sys.stderr)
-    HAS_SCIKIT_IMAGE = False
 
-# Try to import YOLO for object detection
-try:
-    import logging
-    # Suppress YOLO startup messages to prevent JSON parsing issues
-    os.environ['YOLO_VERBOSE'] = 'False'
-    logging.getLogger('ultralytics').setLevel(logging.ERROR)
+# Suppress YOLO startup messages to prevent JSON parsing issues
+os.environ['YOLO_VERBOSE'] = 'False'
+logging.getLogger('ultralytics').setLevel(logging.ERROR)
+
+def yolo_available():
+    """
+    Whether YOLO object detection can run: ultralytics is installed and has not failed to
+    import. ultralytics (and torch with it) is only imported when the first model loads.
+    """
+    return probe("ultralytics")
+
+if yolo_available():
+    print("YOLO is available for object detection", file=sys.stderr)
+else:
+    print("Warning: ultralytics not available, YOLO object detection disabled", file=sys.stderr)
+
+# OpenRouter endpoint; override with OPENROUTER_API_URL to point at a local mock server
+OPENROUTER_API_URL = os.environ.get("OPENROUTER_API_URL", "https://openrouter.ai/api/v1/chat/completions")
+
+# Model and sampling parameters for the safety analysis requests
+OPENROUTER_MODEL = "openai/gpt-4o"
+OPENROUTER_REQUEST_PARAMS = {
+    "max_tokens": 2000,
+    "temperature": 0.1,
+    "response_format": {"type": "json_object"}
+}
+
+# Token budget for the batch planner: estimated input tokens per request, expected output
+# tokens per frameDetails entry, and the range max_tokens is chosen from
+DEFAULT_TOKEN_BUDGET = int(os.environ.get("OPENROUTER_TOKEN_BUDGET", "16000"))
+OUTPUT_TOKENS_PER_FRAME = 700
+OUTPUT_TOKENS_OVERHEAD = 300
+MIN_OUTPUT_TOKENS = 2000
+MAX_OUTPUT_TOKENS = 8000
+# Allowance for a frame's line in the YOLO context, which is only known after detection
+YOLO_CONTEXT_TOKENS_PER_FRAME = 150
+
+# Upload preparation: longest image side in pixels (0 keeps the file's size), JPEG quality
+# (0 passes the file through without re-encoding), grid overlay and vision detail level
+DEFAULT_UPLOAD_OPTIONS = {
+    "max_side": 0,
+    "jpeg_quality": 0,
+    "grid_overlay": False,
+    "image_detail": "auto"
+}
+
+# Bytes sent to OpenRouter in this process
+_upload_stats = {"requests": 0, "request_bytes": 0, "image_base64_bytes": 0}
+_upload_stats_lock = threading.Lock()
+
+# Maximum number of LLM batch requests in flight at once
+DEFAULT_MAX_CONCURRENCY = int(os.environ.get("OPENROUTER_MAX_CONCURRENCY", "4"))
+
+# Frame selection budget: most frames sent to the LLM after similarity filtering (0 = no
+# limit), plus the pricing (USD per million tokens) and throughput used to turn time and
+# cost budgets into a frame count
+DEFAULT_FRAME_BUDGET = int(os.environ.get("OPENROUTER_FRAME_BUDGET", "12"))
+OPENROUTER_INPUT_PRICE = float(os.environ.get("OPENROUTER_INPUT_PRICE", "2.5"))
+OPENROUTER_OUTPUT_PRICE = float(os.environ.get("OPENROUTER_OUTPUT_PRICE", "10"))
+OPENROUTER_OUTPUT_TOKENS_PER_SECOND = float(os.environ.get("OPENROUTER_OUTPUT_TOKENS_PER_SECOND", "60"))
+OPENROUTER_REQUEST_LATENCY = float(os.environ.get("OPENROUTER_REQUEST_LATENCY", "3"))
+
+# Request resilience: attempts per request, backoff base (seconds), process-wide request
+# rate (requests/second, 0 = unlimited) and circuit breaker settings
+OPENROUTER_MAX_ATTEMPTS = int(os.environ.get("OPENROUTER_MAX_ATTEMPTS", "4"))
+OPENROUTER_RETRY_BASE_DELAY = float(os.environ.get("OPENROUTER_RETRY_BASE_DELAY", "1.0"))
+OPENROUTER_RATE_LIMIT = float(os.environ.get("OPENROUTER_RATE_LIMIT", "5"))
+OPENROUTER_BREAKER_THRESHOLD = int(os.environ.get("OPENROUTER_BREAKER_THRESHOLD", "5"))
+OPENROUTER_BREAKER_RESET = float(os.environ.get("OPENROUTER_BREAKER_RESET", "30"))
+
+_retry_policy = RetryPolicy(max_attempts=OPENROUTER_MAX_ATTEMPTS, base_delay=OPENROUTER_RETRY_BASE_DELAY)
+_rate_limiter = TokenBucket(OPENROUTER_RATE_LIMIT, capacity=max(1, DEFAULT_MAX_CONCURRENCY))
+_circuit_breaker = CircuitBreaker(failure_threshold=OPENROUTER_BREAKER_THRESHOLD, reset_timeout=OPENROUTER_BREAKER_RESET)
+_request_stats = RequestStats()
+
+# Stage durations and counters for the result's "timings" block
+_stage_timer = StageTimer()
+
+# Pooled HTTP session shared by all batch requests (keep-alive across batches and threads)
+_http_session = None
+_http_session_lock = threading.Lock()
+
+def get_http_session(pool_size=DEFAULT_MAX_CONCURRENCY):
+    """
+    Return the process-wide pooled requests session, creating it on first use
+    """
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=max(1, pool_size))
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _http_session = session
+        return _http_session
+
+# YOLOv11 models used for enhanced detection (15-20% better accuracy);
+# larger models run with progressively lower confidence thresholds
+YOLO_MODEL_CONFIGS = [
+    {"model": "yolo11n.pt", "name": "nano", "conf_scale": 1.0},
+    {"model": "yolo11s.pt", "name": "small", "conf_scale": 0.8},   # Even lower threshold
+    {"model": "yolo11m.pt", "name": "medium", "conf_scale": 0.7}   # Lowest threshold
+]
+
+# Process-level model registry: each weights file is loaded once and kept warm
+_yolo_models = {}
+_yolo_model_errors = {}
+_yolo_model_stats = {}
+
+def _yolo_stats_entry(model_path):
+    return _yolo_model_stats.setdefault(model_path, {
+        "load_time_s": 0.0,
+        "frames": 0,
+        "inference_calls": 0,
+        "total_inference_s": 0.0,
+        "max_inference_s": 0.0
+    })
+
+def get_yolo_model(model_path):
+    """
+    Return a loaded YOLO model from the process-level registry, loading it on first use.
+    A model that failed to load is not retried for the lifetime of the process.
+    """
+    if not yolo_available():
+        return None
+    
+    model = _yolo_models.get(model_path)
+    if model is not None:
+        return model
+    
+    if model_path in _yolo_model_errors:
+        raise RuntimeError(_yolo_model_errors[model_path])
     
-    # Temporarily redirect stdout to stderr during YOLO import
+    try:
+        YOLO = load_module("ultralytics", quiet=True).YOLO
+    except (ImportError, AttributeError) as e:
+        print(f"Warning: YOLO import failed with error: {e}, object detection disabled", file=sys.stderr)
+        raise RuntimeError(f"ultralytics could not be imported: {e}")
+    
+    start_time = time.perf_counter()
+    try:
+        # Temporarily redirect stdout to stderr during model loading
+        sys.stdout = sys.stderr
+        model = YOLO(model_path)
+    except Exception as e:
+        _yolo_model_errors[model_path] = str(e)
+        raise
+    finally:
+        sys.stdout = original_stdout
+    
+    load_time = time.perf_counter() - start_time
+    _yolo_models[model_path] = model
+    _yolo_stats_entry(model_path)["load_time_s"] = load_time
+    print(f"Loaded YOLO model {model_path} in {load_time:.2f}s", file=sys.stderr)
+    return model
+
+def record_yolo_inference(model_path, elapsed, frame_count=1):
+    """
+    Record inference time for a model call covering frame_count frames
+    """
+    stats = _yolo_stats_entry(model_path)
+    stats["frames"] += frame_count
+    stats["inference_calls"] += 1
+    stats["total_inference_s"] += elapsed
+    stats["max_inference_s"] = max(stats["max_inference_s"], elapsed)
+    _stage_timer.record(f"yolo:{model_path}", elapsed)
+
+def get_yolo_model_stats():
+    """
+    Summarise model load times and per-frame inference times for the result JSON
+    """
+    summary = {}
+    for config in YOLO_MODEL_CONFIGS:
+        model_path = config["model"]
+        if model_path not in _yolo_model_stats and model_path not in _yolo_model_errors:
+            continue
+        
+        stats = dict(_yolo_stats_entry(model_path))
+        frames = stats["frames"]
+        stats["mean_inference_per_frame_ms"] = (stats["total_inference_s"] / frames * 1000) if frames else 0.0
+        stats["loaded"] = model_path in _yolo_models
+        if model_path in _yolo_model_errors:
+            stats["error"] = _yolo_model_errors[model_path]
+        summary[config["name"]] = stats
+    
+    return summary
+
+def warm_yolo_models():
+    """
+    Load every configured model up front so the first frame does not pay the load cost
+    """
+    for config in YOLO_MODEL_CONFIGS:
+        try:
+            get_yolo_model(config["model"])
+        except Exception as e:
+            print(f"Could not load YOLO {config['name']} model: {e}", file=sys.stderr)
+
+def _run_yolo_model(model, model_path, sources, conf):
+    """
+    Run one model over a list of image paths or arrays, recording inference time
+    """
+    # Temporarily redirect stdout to stderr during inference
+    inference_start = time.perf_counter()
     sys.stdout = sys.stderr
-    from ultralytics import YOLO
-    sys.stdout = original_stdout
+    try:
+        # Run inference with lower confidence and higher IoU threshold for comprehensive detection
+        results = model(
+            sources,
+            conf=conf,                # Low confidence to catch more objects
+            iou=0.7,                  # High IoU to reduce duplicate detections
+            agnostic_nms=True,        # Class-agnostic NMS
+            max_det=100,              # Allow more detections
+            verbose=False
+        )
+    finally:
+        sys.stdout = original_stdout
+    record_yolo_inference(model_path, time.perf_counter() - inference_start, len(sources))
+    return results
+
+def _run_yolo_chunk(model, model_path, sources, conf):
+    """
+    Yield (offset, result) for a chunk of sources
+    If the chunk fails as a whole (e.g. one image cannot be read), each source is run on its
+    own so only the failing frames go without this model's detections, as they would when
+    detected one image at a time
+    """
+    try:
+        results = _run_yolo_model(model, model_path, sources, conf)
+    except Exception as e:
+        if len(sources) == 1:
+            print(f"YOLO could not process frame: {e}", file=sys.stderr)
+            return
+        print(f"YOLO batch of {len(sources)} frames failed ({e}), retrying frame by frame", file=sys.stderr)
+        for offset, source in enumerate(sources):
+            for _, result in _run_yolo_chunk(model, model_path, [source], conf):
+                yield offset, result
+        return
+    yield from enumerate(results)
+
+def _as_numpy(values):
+    """
+    Convert a torch tensor (on any device) or array-like to a NumPy array
+    """
+    if hasattr(values, "cpu"):
+        values = values.cpu()
+    if hasattr(values, "numpy"):
+        return values.numpy()
+    return np.asarray(values)
+
+def _detections_from_yolo_result(result, class_names, model_name):
+    """
+    Convert a single YOLO result into normalized, filtered detection dicts
+    Normalization and filtering run vectorized over the whole result tensors
+    """
+    boxes = result.boxes
+    if boxes is None or len(boxes) == 0:
+        return []
     
-    HAS_YOLO = True
-    print("YOLO is available for object detection", file=sys.stderr)
-except ImportError:
-    sys.stdout = original_stdout
-    print("Warning: ultralytics not available, YOLO object detection disabled", file=sys.stderr)
-    HAS_YOLO = False
-except Exception as e:
-    sys.stdout = original_stdout
-    print(f"Warning: YOLO import failed with error: {e}, object detection disabled", file=sys.stderr)
-    HAS_YOLO = False
+    # Original image size as seen by the model, used for normalization
+    height, width = result.orig_shape[:2]
+    
+    xyxy = _as_numpy(boxes.xyxy).astype(np.float64).reshape(-1, 4)
+    confidences = _as_numpy(boxes.conf).astype(np.float64).reshape(-1)
+    class_ids = _as_numpy(boxes.cls).astype(np.int64).reshape(-1)
+    
+    # Convert to normalized x, y, w, h format
+    bboxes = np.empty_like(xyxy)
+    bboxes[:, 0] = xyxy[:, 0] / width
+    bboxes[:, 1] = xyxy[:, 1] / height
+    bboxes[:, 2] = (xyxy[:, 2] - xyxy[:, 0]) / width
+    bboxes[:, 3] = (xyxy[:, 3] - xyxy[:, 1]) / height
+    
+    # Apply enhanced filtering
+    keep = realistic_detection_mask(class_ids, bboxes, confidences, class_names)
+    potential_hazard = critical_safety_hazard_mask(class_ids, bboxes, confidences, class_names)
+    
+    table = get_class_rule_table(class_names)
+    detections = []
+    for idx in np.flatnonzero(keep).tolist():
+        class_id = int(class_ids[idx])
+        class_name = table["names"][class_id]
+        x_norm, y_norm, w_norm, h_norm = bboxes[idx].tolist()
+        
+        detections.append({
+            "class_name": class_name,
+            "confidence": float(confidences[idx]),
+            "bbox": {
+                "x": x_norm,
+                "y": y_norm,
+                "w": w_norm,
+                "h": h_norm
+            },
+            "safety_category": table["safety_category"][class_id],
+            "potential_hazard": bool(potential_hazard[idx]),
+            "model_used": model_name,
+            "detection_id": f"{class_name}_{x_norm:.3f}_{y_norm:.3f}"
+        })
+    
+    return detections
 
 def detect_objects_with_yolo(image_path, confidence_threshold=0.10):
     """
     Enhanced YOLO detection with comprehensive object detection
     Uses multiple models and lower thresholds to catch all objects
     """
-    if not HAS_YOLO:
+    if not yolo_available():
         return []
     
+    return detect_objects_with_yolo_batch([image_path], confidence_threshold, batch_size=1)[0]
+
+def detect_objects_with_yolo_batch(frames, confidence_threshold=0.10, batch_size=8):
+    """
+    Batched multi-model YOLO detection across many frames
+    Accepts image paths or in-memory BGR arrays, runs every model over them in chunks
+    of batch_size and returns one detection list per frame in the same order and schema
+    as detect_objects_with_yolo
+    """
+    frame_detections = [[] for _ in frames]
+    if not yolo_available() or not frames:
+        return frame_detections
+    
+    batch_size = max(1, int(batch_size))
+    
     try:
-        detected_objects = []
-        
-        # Try multiple YOLOv11 models for enhanced detection (15-20% better accuracy)
-        model_configs = [
-            {"model": "yolo11n.pt", "name": "nano", "conf": confidence_threshold},
-            {"model": "yolo11s.pt", "name": "small", "conf": confidence_threshold * 0.8},  # Even lower threshold
-            {"model": "yolo11m.pt", "name": "medium", "conf": confidence_threshold * 0.7}   # Lowest threshold
-        ]
-        
-        all_detections = []
-        
-        for config in model_configs:
+        for config in YOLO_MODEL_CONFIGS:
+            conf = confidence_threshold * config["conf_scale"]
             try:
-                print(f"Running YOLO {config['name']} model with confidence {config['conf']:.2f}...", file=sys.stderr)
-                # Suppress YOLO verbose output during model loading
-                import logging
-                logging.getLogger('ultralytics').setLevel(logging.ERROR)
-                
-                # Temporarily redirect stdout to stderr during model loading
-                sys.stdout = sys.stderr
-                model = YOLO(config["model"])
-                sys.stdout = original_stdout
-                
-                # Run inference with lower confidence and higher IoU threshold for comprehensive detection
-                # Temporarily redirect stdout to stderr during inference
-                sys.stdout = sys.stderr
-                results = model(
-                    image_path, 
-                    conf=config["conf"],      # Low confidence to catch more objects
-                    iou=0.7,                  # High IoU to reduce duplicate detections
-                    agnostic_nms=True,        # Class-agnostic NMS
-                    max_det=100,              # Allow more detections
-                    verbose=False
-                )
-                sys.stdout = original_stdout
+                print(f"Running YOLO {config['name']} model with confidence {conf:.2f} on {len(frames)} frame(s), batch size {batch_size}...", file=sys.stderr)
+                model = get_yolo_model(config["model"])
                 
-                for result in results:
-                    boxes = result.boxes
-                    if boxes is not None:
-                        for box in boxes:
-                            # Get bounding box coordinates (xyxy format)
-                            x1, y1, x2, y2 = box.xyxy[0].tolist()
-                            
-                            # Get confidence and class
-                            confidence = float(box.conf[0])
-                            class_id = int(box.cls[0])
-                            class_name = model.names[class_id]
-                            
-                            # Convert to normalized coordinates (0-1)
-                            img = cv2.imread(image_path)
-                            if img is not None:
-                                height, width = img.shape[:2]
-                                
-                                # Convert to normalized x, y, w, h format
-                                x_norm = x1 / width
-                                y_norm = y1 / height
-                                w_norm = (x2 - x1) / width
-                                h_norm = (y2 - y1) / height
-                                
-                                # Classify object type for safety assessment
-                                safety_category = classify_object_for_safety(class_name)
-                                
-                                bbox_position = {
-                                    "x": x_norm,
-                                    "y": y_norm,
-                                    "w": w_norm,
-                                    "h": h_norm
-                                }
-                                
-                                # Apply enhanced filtering
-                                if not is_realistic_detection(class_name, bbox_position, confidence):
-                                    continue  # Skip unrealistic detections
-                                
-                                detection = {
-                                    "class_name": class_name,
-                                    "confidence": confidence,
-                                    "bbox": bbox_position,
-                                    "safety_category": safety_category,
-                                    "potential_hazard": is_critical_safety_hazard(class_name, confidence, bbox_position),
-                                    "model_used": config["name"],
-                                    "detection_id": f"{class_name}_{x_norm:.3f}_{y_norm:.3f}"
-                                }
-                                all_detections.append(detection)
+                model_detection_count = 0
+                for start_idx in range(0, len(frames), batch_size):
+                    batch_sources = list(frames[start_idx:start_idx + batch_size])
+                    for offset, result in _run_yolo_chunk(model, config["model"], batch_sources, conf):
+                        detections = _detections_from_yolo_result(result, model.names, config["name"])
+                        frame_detections[start_idx + offset].extend(detections)
+                        model_detection_count += len(detections)
                 
-                print(f"YOLO {config['name']} detected {len([d for d in all_detections if d['model_used'] == config['name']])} objects", file=sys.stderr)
+                print(f"YOLO {config['name']} detected {model_detection_count} objects", file=sys.stderr)
                 
             except Exception as model_error:
                 print(f"Could not load YOLO {config['name']} model: {model_error}, trying next...", file=sys.stderr)
                 continue
         
         # Remove duplicate detections using distance-based filtering
-        unique_detections = remove_duplicate_detections(all_detections)
+        unique_detections = [remove_duplicate_detections(detections) for detections in frame_detections]
         
-        print(f"Total detections after deduplication: {len(unique_detections)}", file=sys.stderr)
+        print(f"Total detections after deduplication: {sum(len(d) for d in unique_detections)}", file=sys.stderr)
         return unique_detections
         
     except Exception as e:
         print(f"Error in enhanced YOLO detection: {e}", file=sys.stderr)
-        return []
+        return [[] for _ in frames]
+
+def _duplicate_pairs(bboxes, class_ids, distance_threshold, iou_threshold):
+    """
+    Find same-class duplicate pairs among (N, 4) normalized x, y, w, h boxes
+    Boxes are sorted by (class, center x) so each box is only compared with the window of
+    same-class neighbours whose centers are close enough horizontally to be either within
+    distance_threshold or overlapping. Returns symmetric (rows, cols) index arrays.
+    """
+    center_x = bboxes[:, 0] + bboxes[:, 2] / 2
+    center_y = bboxes[:, 1] + bboxes[:, 3] / 2
+    
+    # Boxes i and j can only be duplicates if |dx| < max(distance_threshold, (w_i + w_j) / 2),
+    # which is bounded by each box's own reach
+    reach = np.maximum(distance_threshold, (bboxes[:, 2] + bboxes[:, 2].max()) / 2)
+    
+    # Composite sort key keeps classes in disjoint ranges that a window can never span
+    class_spacing = float(center_x.max() - center_x.min() + 2 * reach.max()) + 1.0
+    sort_key = class_ids * class_spacing + center_x
+    order = np.argsort(sort_key, kind="stable")
+    sorted_key = sort_key[order]
+    sorted_reach = reach[order]
+    
+    window_start = np.searchsorted(sorted_key, sorted_key - sorted_reach, side="left")
+    window_end = np.searchsorted(sorted_key, sorted_key + sorted_reach, side="right")
+    window_size = window_end - window_start
+    
+    rows = np.repeat(np.arange(len(order)), window_size)
+    offsets = np.arange(window_size.sum()) - np.repeat(np.cumsum(window_size) - window_size, window_size)
+    cols = window_start[rows] + offsets
+    rows, cols = order[rows], order[cols]
+    distinct = rows != cols
+    rows, cols = rows[distinct], cols[distinct]
+    
+    distance = np.hypot(center_x[rows] - center_x[cols], center_y[rows] - center_y[cols])
+    
+    x1, y1 = bboxes[:, 0], bboxes[:, 1]
+    x2, y2 = x1 + bboxes[:, 2], y1 + bboxes[:, 3]
+    inter_w = np.clip(np.minimum(x2[rows], x2[cols]) - np.maximum(x1[rows], x1[cols]), 0, None)
+    inter_h = np.clip(np.minimum(y2[rows], y2[cols]) - np.maximum(y1[rows], y1[cols]), 0, None)
+    intersection = inter_w * inter_h
+    area = bboxes[:, 2] * bboxes[:, 3]
+    union = area[rows] + area[cols] - intersection
+    iou = np.divide(intersection, union, out=np.zeros_like(intersection), where=union > 0)
+    
+    duplicate = (distance < distance_threshold) | (iou > iou_threshold)
+    return rows[duplicate], cols[duplicate]
 
-def remove_duplicate_detections(detections, distance_threshold=0.1):
+def remove_duplicate_detections(detections, distance_threshold=0.1, iou_threshold=0.5):
     """
-    Remove duplicate detections based on spatial proximity and class similarity
+    Remove duplicate detections across models with class-aware NMS
+    Same-class detections are duplicates when their centers are within distance_threshold
+    or their IoU exceeds iou_threshold; the highest-confidence detection suppresses its
+    duplicates. Survivors keep their original order.
     """
     if not detections:
         return []
     
-    unique_detections = []
+    # Stack boxes, confidences and class indices into one array
+    class_index = {}
+    stacked = np.array([
+        (d['bbox']['x'], d['bbox']['y'], d['bbox']['w'], d['bbox']['h'], d['confidence'],
+         class_index.setdefault(d['class_name'], len(class_index)))
+        for d in detections
+    ], dtype=np.float64)
+    bboxes = stacked[:, :4]
+    confidences = stacked[:, 4]
+    class_ids = stacked[:, 5]
     
-    for detection in detections:
-        is_duplicate = False
-        
-        for existing in unique_detections:
-            # Check if same class and close proximity
-            if (detection['class_name'] == existing['class_name']):
-                # Calculate center distance
-                center1 = (detection['bbox']['x'] + detection['bbox']['w']/2, 
-                          detection['bbox']['y'] + detection['bbox']['h']/2)
-                center2 = (existing['bbox']['x'] + existing['bbox']['w']/2,
-                          existing['bbox']['y'] + existing['bbox']['h']/2)
-                
-                distance = ((center1[0] - center2[0])**2 + (center1[1] - center2[1])**2)**0.5
-                
-                if distance < distance_threshold:
-                    # Keep the one with higher confidence
-                    if detection['confidence'] > existing['confidence']:
-                        unique_detections.remove(existing)
-                        unique_detections.append(detection)
-                    is_duplicate = True
-                    break
-        
-        if not is_duplicate:
-            unique_detections.append(detection)
+    rows, cols = _duplicate_pairs(bboxes, class_ids, distance_threshold, iou_threshold)
+    
+    # Adjacency lists (CSR layout) of each detection's duplicates
+    pair_order = np.argsort(rows, kind="stable")
+    neighbours = cols[pair_order].tolist()
+    indptr = np.concatenate(([0], np.cumsum(np.bincount(rows, minlength=len(detections))))).tolist()
+    
+    # Greedy suppression in descending confidence order (stable for equal confidences)
+    keep = []
+    suppressed = [False] * len(detections)
+    for idx in np.argsort(-confidences, kind="stable").tolist():
+        if suppressed[idx]:
+            continue
+        keep.append(idx)
+        for neighbour in neighbours[indptr[idx]:indptr[idx + 1]]:
+            suppressed[neighbour] = True
     
-    return unique_detections
+    return [detections[i] for i in sorted(keep)]
 
 def classify_object_for_safety(class_name):
     """
@@ -230,6 +517,48 @@ def get_adaptive_confidence_threshold(class_name, scene_context="warehouse"):
     # Default threshold - more inclusive
     return 0.30
 
+# Only critical hazards that definitely block pathways
+CRITICAL_HAZARD_CLASSES = {
+    # Vehicles - always critical in hallways
+    "vehicles": ["car", "truck", "bus", "motorcycle", "bicycle", "motorbike"],
+    
+    # Large furniture blocking pathways
+    "blocking_furniture": ["table", "desk", "cabinet", "shelf", "couch", "wardrobe"],
+    
+    # Large containers/boxes
+    "large_containers": ["box", "container", "barrel", "bin", "crate", "pallet"],
+    
+    # Equipment that shouldn't be in hallways
+    "equipment": ["ladder", "cart", "trolley", "machine", "forklift"]
+}
+
+def is_critical_hazard_class(class_name):
+    """
+    Check if an object type belongs to one of the critical hazard categories
+    """
+    class_lower = class_name.lower()
+    return any(any(item in class_lower for item in items) for items in CRITICAL_HAZARD_CLASSES.values())
+
+def get_realistic_area_range(class_name):
+    """
+    Get the allowed bounding box area (as fraction of image) for an object type
+    """
+    class_lower = class_name.lower()
+    
+    # Size constraints (as percentage of image): 0.1% to 50%
+    min_area, max_area = 0.001, 0.5
+    
+    # Object-specific size validation
+    if any(vehicle in class_lower for vehicle in ["car", "truck", "bus"]):
+        # Vehicles should be reasonably sized: 1% to 40% of image
+        min_area, max_area = max(min_area, 0.01), min(max_area, 0.4)
+    
+    if "person" in class_lower:
+        # People should be reasonable size: 0.5% to 20% of image
+        min_area, max_area = max(min_area, 0.005), min(max_area, 0.2)
+    
+    return min_area, max_area
+
 def is_critical_safety_hazard(class_name, confidence, bbox_position, base_threshold=0.20):
     """
     Enhanced smart filtering with adaptive confidence thresholds
@@ -241,33 +570,15 @@ def is_critical_safety_hazard(class_name, confidence, bbox_position, base_thresh
     if confidence < effective_threshold:
         return False
     
-    class_lower = class_name.lower()
-    
-    # Only critical hazards that definitely block pathways
-    critical_hazards = {
-        # Vehicles - always critical in hallways
-        "vehicles": ["car", "truck", "bus", "motorcycle", "bicycle", "motorbike"],
-        
-        # Large furniture blocking pathways
-        "blocking_furniture": ["table", "desk", "cabinet", "shelf", "couch", "wardrobe"],
-        
-        # Large containers/boxes
-        "large_containers": ["box", "container", "barrel", "bin", "crate", "pallet"],
-        
-        # Equipment that shouldn't be in hallways
-        "equipment": ["ladder", "cart", "trolley", "machine", "forklift"]
-    }
-    
     # Check if object is in a critical category
-    for category, items in critical_hazards.items():
-        if any(item in class_lower for item in items):
-            # Additional check: object should be in pathway area (center region)
-            center_x = bbox_position.get('x', 0) + bbox_position.get('w', 0) / 2
-            center_y = bbox_position.get('y', 0) + bbox_position.get('h', 0) / 2
-            
-            # Focus on center pathway areas (avoid wall/edge detections)
-            if 0.2 <= center_x <= 0.8 and 0.3 <= center_y <= 0.9:
-                return True
+    if is_critical_hazard_class(class_name):
+        # Additional check: object should be in pathway area (center region)
+        center_x = bbox_position.get('x', 0) + bbox_position.get('w', 0) / 2
+        center_y = bbox_position.get('y', 0) + bbox_position.get('h', 0) / 2
+        
+        # Focus on center pathway areas (avoid wall/edge detections)
+        if 0.2 <= center_x <= 0.8 and 0.3 <= center_y <= 0.9:
+            return True
     
     return False
 
@@ -279,26 +590,10 @@ def is_realistic_detection(class_name, bbox_position, confidence):
     h = bbox_position.get('h', 0)
     area = w * h
     
-    class_lower = class_name.lower()
-    
-    # Size constraints (as percentage of image)
-    if area < 0.001:  # Too small (less than 0.1% of image)
+    min_area, max_area = get_realistic_area_range(class_name)
+    if area < min_area or area > max_area:
         return False
     
-    if area > 0.5:    # Too large (more than 50% of image)
-        return False
-    
-    # Object-specific size validation
-    if any(vehicle in class_lower for vehicle in ["car", "truck", "bus"]):
-        # Vehicles should be reasonably sized
-        if area < 0.01 or area > 0.4:  # 1% to 40% of image
-            return False
-    
-    if "person" in class_lower:
-        # People should be reasonable size
-        if area < 0.005 or area > 0.2:  # 0.5% to 20% of image
-            return False
-    
     # Position validation - avoid extreme edges for main objects
     center_x = bbox_position.get('x', 0) + w / 2
     center_y = bbox_position.get('y', 0) + h / 2
@@ -310,6 +605,69 @@ def is_realistic_detection(class_name, bbox_position, confidence):
     
     return True
 
+# Per-class rule tables for vectorized filtering, keyed by the model's class names
+_class_rule_cache = {}
+
+def get_class_rule_table(class_names):
+    """
+    Build (once per class-name mapping) per-class-id arrays of the filtering rules used by
+    is_realistic_detection and is_critical_safety_hazard, so they can be applied to whole
+    detection tensors at once
+    """
+    names = class_names if isinstance(class_names, dict) else dict(enumerate(class_names))
+    cache_key = tuple(sorted(names.items()))
+    table = _class_rule_cache.get(cache_key)
+    if table is not None:
+        return table
+    
+    size = max(names) + 1 if names else 0
+    table = {
+        "names": [names.get(class_id, str(class_id)) for class_id in range(size)],
+        "min_area": np.zeros(size),
+        "max_area": np.zeros(size),
+        "hazard_threshold": np.zeros(size),
+        "critical": np.zeros(size, dtype=bool)
+    }
+    table["safety_category"] = [classify_object_for_safety(name) for name in table["names"]]
+    for class_id, name in enumerate(table["names"]):
+        table["min_area"][class_id], table["max_area"][class_id] = get_realistic_area_range(name)
+        table["hazard_threshold"][class_id] = get_adaptive_confidence_threshold(name)
+        table["critical"][class_id] = is_critical_hazard_class(name)
+    
+    _class_rule_cache[cache_key] = table
+    return table
+
+def realistic_detection_mask(class_ids, bboxes, confidences, class_names):
+    """
+    Vectorized is_realistic_detection over N detections
+    bboxes is an (N, 4) array of normalized x, y, w, h
+    """
+    table = get_class_rule_table(class_names)
+    area = bboxes[:, 2] * bboxes[:, 3]
+    keep = (area >= table["min_area"][class_ids]) & (area <= table["max_area"][class_ids])
+    
+    # Skip low-confidence objects at very edges (likely partial/cut-off)
+    center_x = bboxes[:, 0] + bboxes[:, 2] / 2
+    center_y = bboxes[:, 1] + bboxes[:, 3] / 2
+    at_edge = (center_x < 0.05) | (center_x > 0.95) | (center_y < 0.05) | (center_y > 0.95)
+    keep &= ~(at_edge & (confidences < 0.7))
+    
+    return keep
+
+def critical_safety_hazard_mask(class_ids, bboxes, confidences, class_names, base_threshold=0.20):
+    """
+    Vectorized is_critical_safety_hazard over N detections
+    bboxes is an (N, 4) array of normalized x, y, w, h
+    """
+    table = get_class_rule_table(class_names)
+    effective_threshold = np.maximum(base_threshold, table["hazard_threshold"][class_ids])
+    
+    center_x = bboxes[:, 0] + bboxes[:, 2] / 2
+    center_y = bboxes[:, 1] + bboxes[:, 3] / 2
+    in_pathway = (center_x >= 0.2) & (center_x <= 0.8) & (center_y >= 0.3) & (center_y <= 0.9)
+    
+    return (confidences >= effective_threshold) & table["critical"][class_ids] & in_pathway
+
 def assess_hazard_severity(class_name, confidence, bbox_position):
     """
     Assess the severity of a confirmed hazard based on type, size, and position
@@ -640,40 +998,37 @@ def calculate_basic_similarity(img1, img2):
     except Exception:
         return 0.0
 
-def calculate_image_similarity(img1_path, img2_path, threshold=0.80):
+def calculate_image_similarity(img1_path, img2_path, threshold=0.80, feature_cache=None):
     """
     Calculate similarity between two images using multiple methods for better detection
     Returns True if images are similar (above threshold)
+    feature_cache (a FrameFeatureCache) lets repeated comparisons reuse decoded frames
     """
     try:
-        # Read images
-        img1 = cv2.imread(img1_path, cv2.IMREAD_GRAYSCALE)
-        img2 = cv2.imread(img2_path, cv2.IMREAD_GRAYSCALE)
+        if feature_cache is None:
+            feature_cache = FrameFeatureCache()
         
-        if img1 is None or img2 is None:
-            return False
+        # Read images (downscaled gray features, decoded once per cache)
+        features1 = feature_cache.get(img1_path)
+        features2 = feature_cache.get(img2_path)
         
-        # Resize to standard size for comparison (smaller for speed)
-        target_size = (160, 120)  # Smaller size for faster comparison
-        img1_resized = cv2.resize(img1, target_size)
-        img2_resized = cv2.resize(img2, target_size)
+        if features1 is None or features2 is None:
+            return False
         
         similarity_scores = []
         
         if HAS_SCIKIT_IMAGE:
             # Use SSIM for structural similarity
-            ssim_score = ssim(img1_resized, img2_resized)
+            ssim_score = ssim_from_features(features1, features2)
             similarity_scores.append(ssim_score)
         
         # Use histogram comparison as additional check
-        hist_score = calculate_basic_similarity(img1_resized, img2_resized)
+        hist_score = histogram_similarity(features1, features2)
         similarity_scores.append(hist_score)
         
         # Use template matching as another check
         try:
-            result = cv2.matchTemplate(img1_resized, img2_resized, cv2.TM_CCOEFF_NORMED)
-            _, max_val, _, _ = cv2.minMaxLoc(result)
-            similarity_scores.append(max_val)
+            similarity_scores.append(template_similarity(features1, features2))
         except:
             pass
         
@@ -762,15 +1117,20 @@ def convert_grid_cells_to_bounding_box(grid_cells_string):
         print(f"Error converting grid cells '{grid_cells_string}': {e}", file=sys.stderr)
         return {"x": 0.1, "y": 0.1, "w": 0.2, "h": 0.2}
 
-def filter_unique_frames(frame_files, frames_dir, similarity_threshold=0.88):
+def filter_unique_frames(frame_files, frames_dir, similarity_threshold=0.88, feature_cache=None):
     """
     Filter out similar frames, keeping only unique ones with improved aggressive filtering
+    feature_cache (a FrameFeatureCache) can be shared with the frame selection that follows
     """
     if not frame_files:
         return []
     
     print(f"Starting frame filtering with threshold {similarity_threshold}", file=sys.stderr)
     
+    # Each frame is decoded once for all of its comparisons
+    if feature_cache is None:
+        feature_cache = FrameFeatureCache()
+    
     # Try intelligent similarity detection first
     try:
         unique_frames = [frame_files[0]]  # Always keep the first frame
@@ -795,7 +1155,9 @@ def filter_unique_frames(frame_files, frames_dir, similarity_threshold=0.88):
             for unique_frame in recent_unique_frames:
                 unique_path = os.path.join(frames_dir, unique_frame)
                 
-                if calculate_image_similarity(current_path, unique_path, similarity_threshold):
+                with _stage_timer.stage("similarity"):
+                    is_similar = calculate_image_similarity(current_path, unique_path, similarity_threshold, feature_cache)
+                if is_similar:
                     print(f"Frame {current_frame} is similar to {unique_frame} (threshold {similarity_threshold}) - skipping", file=sys.stderr)
                     is_unique = False
                     break
@@ -806,101 +1168,600 @@ def filter_unique_frames(frame_files, frames_dir, similarity_threshold=0.88):
                 print(f"Frame {current_frame} is unique - keeping ({len(unique_frames)} total, gap: {i - (last_selected_index - len(unique_frames) + 1)})", file=sys.stderr)
         
         print(f"Intelligent filtering: {len(frame_files)} -> {len(unique_frames)} frames", file=sys.stderr)
-        
-        # If we still have too many frames, apply additional time-based sampling
-        if len(unique_frames) > 12:  # Increased max frames from 8 to 12
-            step = len(unique_frames) // 12
-            sampled_unique = unique_frames[::step][:12]
-            print(f"Additional sampling: {len(unique_frames)} -> {len(sampled_unique)} frames", file=sys.stderr)
-            return sampled_unique
+        print(f"Similarity feature cache: {feature_cache.stats()}", file=sys.stderr)
         
         return unique_frames
         
     except Exception as e:
-        print(f"Error in similarity detection, using time-based sampling: {e}", file=sys.stderr)
-        # Fallback: intelligent time-based sampling
-        total_frames = len(frame_files)
-        if total_frames <= 5:
-            return frame_files  # Keep all if few frames
-        elif total_frames <= 15:
-            step = 3  # Every 3rd frame
-        elif total_frames <= 30:
-            step = 5  # Every 5th frame  
-        else:
-            step = max(4, total_frames // 12)  # Max 12 frames (increased from 8)
+        # Keep every frame; select_frames_for_budget picks the most novel ones within the budget
+        print(f"Error in similarity detection, keeping all {len(frame_files)} frames for budget selection: {e}", file=sys.stderr)
+        return frame_files
+
+def filter_unique_frames_by_hash(frame_files, frames_dir, similarity_threshold=0.88, max_hash_distance=10, feature_cache=None):
+    """
+    Whole-video near-duplicate filtering with a perceptual-hash index
+    Every kept frame's pHash goes into a BK-tree; a new frame is looked up against all kept
+    frames (not just the most recent ones, so revisits of the same aisle are caught) and SSIM
+    only runs to confirm hash hits within max_hash_distance bits
+    """
+    if not frame_files:
+        return []
+    
+    print(f"Starting hash-indexed frame filtering (max distance {max_hash_distance}, SSIM threshold {similarity_threshold})", file=sys.stderr)
+    
+    try:
+        if feature_cache is None:
+            feature_cache = FrameFeatureCache()
+        hash_index = HammingBKTree()
+        unique_frames = []
+        ssim_checks = 0
+        
+        for frame_file in frame_files:
+            features = feature_cache.get(os.path.join(frames_dir, frame_file))
+            if features is None:
+                continue
+            
+            duplicate_of = None
+            for distance, kept_frame in hash_index.search(features["phash"], max_hash_distance):
+                ssim_checks += 1
+                kept_features = feature_cache.get(os.path.join(frames_dir, kept_frame))
+                with _stage_timer.stage("similarity"):
+                    is_similar = ssim_from_features(features, kept_features) > similarity_threshold
+                if is_similar:
+                    duplicate_of = (kept_frame, distance)
+                    break
             
-        sampled_frames = frame_files[::step][:12]  # Cap at 12 frames (increased from 8)
-        print(f"Time-based sampling: selected {len(sampled_frames)} frames from {total_frames} total (step: {step})", file=sys.stderr)
-        return sampled_frames
+            if duplicate_of:
+                print(f"Frame {frame_file} duplicates {duplicate_of[0]} (hash distance {duplicate_of[1]}) - skipping", file=sys.stderr)
+                continue
+            
+            unique_frames.append(frame_file)
+            hash_index.add(features["phash"], frame_file)
+        
+        print(f"Hash-indexed filtering: {len(frame_files)} -> {len(unique_frames)} frames ({ssim_checks} SSIM confirmations)", file=sys.stderr)
+        return unique_frames
+        
+    except Exception as e:
+        print(f"Error in hash-indexed filtering, falling back to recent-frame comparison: {e}", file=sys.stderr)
+        return filter_unique_frames(frame_files, frames_dir, similarity_threshold, feature_cache)
 
-def process_frames_in_batches(frames_data, api_key, batch_size=5, frames_dir=None):
+def emit_batch_event(batch_num, total_batches, batch_frames, batch_yolo_detections, batch_results, frames_dir=None):
+    """
+    Stream one finished LLM batch as an NDJSON event; frames are referenced by file path
+    """
+    emit_event(
+        "batch",
+        batch_num=batch_num,
+        total_batches=total_batches,
+        success=bool(batch_results.get("success")),
+        error=batch_results.get("error"),
+        frames=[
+            {
+                "filename": frame['filename'],
+                "filepath": os.path.join(frames_dir, frame['filename']) if frames_dir else None,
+                "original_index": frame['original_index']
+            } for frame in batch_frames
+        ],
+        frameDetails=batch_results.get("analysis", {}).get("frameDetails", []) if batch_results.get("success") else [],
+        yolo_detections=batch_yolo_detections
+    )
+
+def process_frames_in_batches(frames_data, api_key, batch_size=None, frames_dir=None, yolo_batch_size=8, max_concurrency=DEFAULT_MAX_CONCURRENCY, response_cache=None, token_budget=DEFAULT_TOKEN_BUDGET,
+                              checkpoint=None):
     """
     Process frames in batches with YOLO detection integration
+    Producer/consumer pipeline: the main thread runs YOLO one LLM batch at a time and hands
+    each batch to a pool of up to max_concurrency OpenRouter requests as soon as its
+    detections are ready, so detection of the next batch overlaps the previous batch's HTTP
+    wait. Merged frameDetails keep batch (frame index) order regardless of completion order.
+    With a response_cache, frames answered before are not sent to OpenRouter again.
+    Batches are packed up to token_budget by plan_batches unless batch_size fixes their size.
+    With a checkpoint (RunCheckpoint), each batch's YOLO detections and successful LLM result
+    are saved as they finish, and batches saved by an interrupted run are not redone.
+    Returns (frame_details, yolo_detections, pipeline_timings)
     """
+    pipeline_start = time.perf_counter()
     all_frame_details = []
     all_yolo_detections = []
-    total_batches = (len(frames_data) + batch_size - 1) // batch_size
-    
-    print(f"Processing {len(frames_data)} frames in {total_batches} batches of {batch_size}", file=sys.stderr)
-    
-    # Run YOLO detection on all frames first if available
-    if HAS_YOLO and frames_dir:
-        print("Running YOLO object detection on all frames...", file=sys.stderr)
-        for frame_data in frames_data:
-            frame_path = os.path.join(frames_dir, frame_data['filename'])
-            yolo_detections = detect_objects_with_yolo(frame_path)
-            all_yolo_detections.append(yolo_detections)
-            print(f"YOLO detected {len(yolo_detections)} objects in {frame_data['filename']}", file=sys.stderr)
-    else:
-        # Create empty detections if YOLO not available
-        all_yolo_detections = [[] for _ in frames_data]
-    
-    for batch_num in range(total_batches):
-        start_idx = batch_num * batch_size
-        end_idx = min(start_idx + batch_size, len(frames_data))
-        batch_frames = frames_data[start_idx:end_idx]
-        batch_yolo_detections = all_yolo_detections[start_idx:end_idx]
-        
+    batch_plan = plan_batches(frames_data, token_budget=token_budget, batch_size=batch_size)
+    total_batches = len(batch_plan)
+    batch_sizes = [batch["end"] - batch["start"] for batch in batch_plan]
+    max_concurrency = max(1, min(max_concurrency, total_batches or 1))
+    run_yolo = yolo_available() and frames_dir
+    
+    print(f"Processing {len(frames_data)} frames in {total_batches} batches of sizes {batch_sizes} (up to {max_concurrency} concurrent requests)", file=sys.stderr)
+    
+    timings = {
+        "yolo_warmup_seconds": 0.0,
+        "yolo_seconds": 0.0,
+        "llm_request_seconds": 0.0,
+        "first_request_at": None,
+        "last_response_at": None
+    }
+    timings_lock = threading.Lock()
+    
+    if run_yolo:
+        print("Running YOLO object detection alongside OpenRouter analysis...", file=sys.stderr)
+        warm_start = time.perf_counter()
+        warm_yolo_models()
+        timings["yolo_warmup_seconds"] = time.perf_counter() - warm_start
+    
+    def run_batch(batch_num, start_idx, batch_frames, batch_yolo_detections, max_tokens):
         print(f"Processing batch {batch_num + 1}/{total_batches} ({len(batch_frames)} frames)...", file=sys.stderr)
-        
+        request_start = time.perf_counter()
         try:
-            batch_results = analyze_batch_with_openrouter(batch_frames, api_key, batch_num, start_idx, batch_yolo_detections)
-            if batch_results.get("success"):
-                batch_frame_details = batch_results.get("analysis", {}).get("frameDetails", [])
-                all_frame_details.extend(batch_frame_details)
-                print(f"Batch {batch_num + 1} completed successfully - {len(batch_frame_details)} frames analyzed", file=sys.stderr)
-            else:
-                print(f"Batch {batch_num + 1} failed: {batch_results.get('error', 'Unknown error')}", file=sys.stderr)
-                # Continue with next batch even if one fails
-                
+            if response_cache is not None:
+                return analyze_batch_with_cache(batch_frames, api_key, batch_num, start_idx, batch_yolo_detections, response_cache, max_tokens)
+            return analyze_batch_adaptive(batch_frames, api_key, batch_num, start_idx, batch_yolo_detections, max_tokens)
         except Exception as e:
-            print(f"Error processing batch {batch_num + 1}: {e}", file=sys.stderr)
+            return {"success": False, "error": f"Error processing batch {batch_num + 1}: {e}"}
+        finally:
+            request_end = time.perf_counter()
+            with timings_lock:
+                timings["llm_request_seconds"] += request_end - request_start
+                timings["last_response_at"] = max(timings["last_response_at"] or 0.0, request_end - pipeline_start)
+    
+    batch_results = [None] * total_batches
+    
+    def collect(future, batch):
+        batch_num, start_idx, batch_frames, batch_yolo_detections, _ = batch
+        batch_results[batch_num] = future.result()
+        
+        if batch_results[batch_num].get("success"):
+            frame_count = len(batch_results[batch_num].get("analysis", {}).get("frameDetails", []))
+            print(f"Batch {batch_num + 1} completed successfully - {frame_count} frames analyzed", file=sys.stderr)
+            if checkpoint is not None:
+                with _stage_timer.stage("checkpoint"):
+                    checkpoint.save_batch(frames_data, start_idx, start_idx + len(batch_frames), batch_results[batch_num])
+        else:
+            # Continue with other batches even if one fails
+            print(f"Batch {batch_num + 1} failed: {batch_results[batch_num].get('error', 'Unknown error')}", file=sys.stderr)
+        
+        emit_batch_event(batch_num, total_batches, batch_frames, batch_yolo_detections, batch_results[batch_num], frames_dir)
+    
+    get_http_session(max_concurrency)
+    submitted_batches = []
+    requeued_batches = []
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        pending = {}
+        for batch_num, planned in enumerate(batch_plan):
+            start_idx, end_idx = planned["start"], planned["end"]
+            batch_frames = frames_data[start_idx:end_idx]
+            
+            # Batches finished by an interrupted run are taken from its checkpoint
+            saved_detections = checkpoint.load_yolo(frames_data, start_idx, end_idx) if checkpoint is not None else None
+            saved_result = checkpoint.load_batch(frames_data, start_idx, end_idx) if saved_detections is not None else None
+            if saved_result is not None and saved_detections is not None:
+                print(f"Batch {batch_num + 1}/{total_batches} restored from checkpoint", file=sys.stderr)
+                all_yolo_detections.extend(saved_detections)
+                batch_results[batch_num] = saved_result
+                emit_batch_event(batch_num, total_batches, batch_frames, saved_detections, saved_result, frames_dir)
+                continue
+            
+            # Produce: detect objects for this batch only
+            if saved_detections is not None:
+                print(f"YOLO detections for batch {batch_num + 1} restored from checkpoint", file=sys.stderr)
+                batch_yolo_detections = saved_detections
+            elif run_yolo:
+                yolo_start = time.perf_counter()
+                frame_paths = [os.path.join(frames_dir, frame_data['filename']) for frame_data in batch_frames]
+                batch_yolo_detections = detect_objects_with_yolo_batch(frame_paths, batch_size=yolo_batch_size)
+                timings["yolo_seconds"] += time.perf_counter() - yolo_start
+                for frame_data, yolo_detections in zip(batch_frames, batch_yolo_detections):
+                    print(f"YOLO detected {len(yolo_detections)} objects in {frame_data['filename']}", file=sys.stderr)
+                emit_event("progress", stage="yolo", frames_processed=end_idx, frames_total=len(frames_data))
+            else:
+                # Create empty detections if YOLO not available
+                batch_yolo_detections = [[] for _ in batch_frames]
+            if checkpoint is not None and saved_detections is None:
+                with _stage_timer.stage("checkpoint"):
+                    checkpoint.save_yolo(frames_data, start_idx, end_idx, batch_yolo_detections)
+            all_yolo_detections.extend(batch_yolo_detections)
+            
+            # Consume: the request goes out while the next batch is being detected
+            if timings["first_request_at"] is None:
+                timings["first_request_at"] = time.perf_counter() - pipeline_start
+            batch = (batch_num, start_idx, batch_frames, batch_yolo_detections, planned["max_tokens"])
+            submitted_batches.append(batch)
+            pending[executor.submit(run_batch, *batch)] = batch
+            
+            # Report batches that finished while YOLO was running
+            for future in [future for future in pending if future.done()]:
+                collect(future, pending.pop(future))
+        
+        for future in as_completed(pending):
+            collect(future, pending[future])
+        
+        # Batches that failed on transient errors (after their own retries) get one more
+        # pass once the circuit breaker allows requests again, instead of being dropped
+        requeued_batches = [
+            batch for batch in submitted_batches
+            if not batch_results[batch[0]].get("success") and batch_results[batch[0]].get("retryable")
+        ]
+        if requeued_batches:
+            wait = _circuit_breaker.retry_in()
+            print(f"Requeueing {len(requeued_batches)} failed batches in {wait:.1f}s", file=sys.stderr)
+            time.sleep(wait)
+            pending = {executor.submit(run_batch, *batch): batch for batch in requeued_batches}
+            for future in as_completed(pending):
+                collect(future, pending[future])
+    
+    # Merge in batch order so frameDetails follow frame index order
+    for result in batch_results:
+        if result and result.get("success"):
+            all_frame_details.extend(result.get("analysis", {}).get("frameDetails", []))
+    
+    wall_seconds = time.perf_counter() - pipeline_start
+    llm_span = (timings["last_response_at"] or 0.0) - (timings["first_request_at"] or 0.0)
+    pipeline_timings = {
+        "wall_seconds": round(wall_seconds, 3),
+        "yolo_warmup_seconds": round(timings["yolo_warmup_seconds"], 3),
+        "yolo_seconds": round(timings["yolo_seconds"], 3),
+        "llm_request_seconds": round(timings["llm_request_seconds"], 3),
+        "llm_span_seconds": round(llm_span, 3),
+        "first_request_at": round(timings["first_request_at"] or 0.0, 3),
+        # Time during which YOLO and LLM requests were both in progress
+        "overlap_seconds": round(max(0.0, timings["yolo_warmup_seconds"] + timings["yolo_seconds"] + llm_span - wall_seconds), 3),
+        "max_concurrency": max_concurrency,
+        "token_budget": None if batch_size else token_budget,
+        "batch_sizes": batch_sizes,
+        "batch_splits": sum(result.get("splits", 0) for result in batch_results if result),
+        "requeued_batches": len(requeued_batches),
+        "checkpointed_batches": total_batches - len(submitted_batches),
+        "failed_batches": sum(1 for result in batch_results if result and not result.get("success"))
+    }
+    print(f"Pipeline timings: {pipeline_timings}", file=sys.stderr)
+    
+    return all_frame_details, all_yolo_detections, pipeline_timings
+
+def upload_settings_fingerprint(upload_options):
+    """
+    Fingerprint of the options that change the prepared image bytes
+    """
+    return fingerprint(
+        "upload-v1",
+        upload_options["max_side"],
+        upload_options["jpeg_quality"],
+        upload_options["grid_overlay"]
+    )
+
+def draw_grid_overlay(image):
+    """
+    Draw the 4x3 analysis grid (A1-C4) the system prompt refers to, with cell labels
+    """
+    height, width = image.shape[:2]
+    thickness = max(1, round(min(width, height) / 320))
+    font_scale = max(0.4, min(width, height) / 800)
+    for col in range(1, 4):
+        x = round(col * width / 4)
+        cv2.line(image, (x, 0), (x, height - 1), (255, 255, 0), thickness)
+    for row in range(1, 3):
+        y = round(row * height / 3)
+        cv2.line(image, (0, y), (width - 1, y), (255, 255, 0), thickness)
+    for row, row_name in enumerate("ABC"):
+        for col in range(4):
+            origin = (round(col * width / 4) + 4 * thickness, round(row * height / 3) + round(22 * font_scale))
+            cv2.putText(image, f"{row_name}{col + 1}", origin, cv2.FONT_HERSHEY_SIMPLEX, font_scale, (0, 0, 0), thickness + 2, cv2.LINE_AA)
+            cv2.putText(image, f"{row_name}{col + 1}", origin, cv2.FONT_HERSHEY_SIMPLEX, font_scale, (255, 255, 0), thickness, cv2.LINE_AA)
+    return image
+
+def prepare_upload_image(image_data, upload_options, payload_cache=None):
+    """
+    Produce the JPEG bytes sent to the LLM for one frame
+    The file is passed through untouched unless a resolution cap, JPEG quality or grid
+    overlay is configured; re-encoded payloads are reused from payload_cache when given
+    """
+    max_side = upload_options["max_side"]
+    jpeg_quality = upload_options["jpeg_quality"]
+    if not max_side and not jpeg_quality and not upload_options["grid_overlay"]:
+        return image_data
+    
+    cache_key = None
+    if payload_cache is not None:
+        cache_key = payload_cache.make_key(image_data, upload_settings_fingerprint(upload_options))
+        cached = payload_cache.get(cache_key)
+        if cached is not None:
+            return cached
+    
+    image = cv2.imdecode(np.frombuffer(image_data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        return image_data
+    
+    height, width = image.shape[:2]
+    if max_side and max(width, height) > max_side:
+        scale = max_side / max(width, height)
+        image = cv2.resize(image, (max(1, round(width * scale)), max(1, round(height * scale))), interpolation=cv2.INTER_AREA)
+    if upload_options["grid_overlay"]:
+        image = draw_grid_overlay(image)
+    
+    success, encoded = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality or 95])
+    if not success:
+        return image_data
+    
+    prepared = encoded.tobytes()
+    if payload_cache is not None:
+        payload_cache.put(cache_key, prepared)
+    return prepared
+
+def image_url_payload(frame):
+    """
+    image_url content part for a frame, with the vision detail level when one is set
+    """
+    payload = {"url": f"data:image/jpeg;base64,{frame['image_base64']}"}
+    if frame.get("image_detail", "auto") != "auto":
+        payload["detail"] = frame["image_detail"]
+    return payload
+
+def record_upload(request_bytes, image_bytes):
+    """
+    Count one OpenRouter request body (including retries) towards the job's upload total
+    """
+    with _upload_stats_lock:
+        _upload_stats["requests"] += 1
+        _upload_stats["request_bytes"] += request_bytes
+        _upload_stats["image_base64_bytes"] += image_bytes
+
+def get_request_stats():
+    """
+    Retry, rate-limit and circuit breaker counters for reporting
+    """
+    stats = _request_stats.snapshot()
+    stats["backoff_seconds"] = round(stats["backoff_seconds"], 3)
+    return {
+        **stats,
+        "rate_limit_wait_seconds": round(_rate_limiter.wait_seconds, 3),
+        "circuit_state": _circuit_breaker.state,
+        "circuit_opened": _circuit_breaker.times_opened
+    }
+
+def get_upload_stats():
+    """
+    Copy of the upload counters for reporting
+    """
+    with _upload_stats_lock:
+        return dict(_upload_stats)
+
+def reset_run_stats():
+    """
+    Zero the per-run request, upload, rate-limit and YOLO inference counters so a process
+    that serves several jobs reports each one on its own; loaded models, the HTTP session
+    and the circuit breaker state are kept
+    """
+    _request_stats.reset()
+    _rate_limiter.wait_seconds = 0.0
+    with _upload_stats_lock:
+        for name in _upload_stats:
+            _upload_stats[name] = 0
+    for stats in _yolo_model_stats.values():
+        stats.update(frames=0, inference_calls=0, total_inference_s=0.0, max_inference_s=0.0)
+
+def jpeg_dimensions(data):
+    """
+    Read (width, height) from a JPEG's start-of-frame header without decoding it
+    Returns (None, None) if the header cannot be found
+    """
+    position = 2
+    while position + 9 < len(data):
+        if data[position] != 0xFF:
+            position += 1
             continue
+        marker = data[position + 1]
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7 or marker == 0xFF:
+            position += 1 if marker == 0xFF else 2
+            continue
+        segment_length = int.from_bytes(data[position + 2:position + 4], "big")
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height = int.from_bytes(data[position + 5:position + 7], "big")
+            width = int.from_bytes(data[position + 7:position + 9], "big")
+            return width, height
+        position += 2 + segment_length
+    return None, None
+
+def estimate_image_tokens(width, height, detail="auto"):
+    """
+    Vision input tokens for one image: a flat 85 at low detail; otherwise scaled to fit
+    2048x2048, then the short side to 768, billed as 85 + 170 per 512px tile
+    Unknown sizes are treated as 1280x720
+    """
+    if detail == "low":
+        return 85
+    if not width or not height:
+        width, height = 1280, 720
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    width, height = width * scale, height * scale
+    tiles = int(np.ceil(width / 512)) * int(np.ceil(height / 512))
+    return 85 + 170 * tiles
+
+def estimate_text_tokens(text):
+    """
+    Rough text token count (about 4 characters per token)
+    """
+    return len(text) // 4 + 1
+
+def output_tokens_for_batch(frame_count):
+    """
+    max_tokens for a request covering frame_count frames
+    """
+    return int(min(MAX_OUTPUT_TOKENS, max(MIN_OUTPUT_TOKENS, OUTPUT_TOKENS_OVERHEAD + OUTPUT_TOKENS_PER_FRAME * frame_count)))
+
+def plan_batches(frames_data, token_budget=DEFAULT_TOKEN_BUDGET, batch_size=None):
+    """
+    Pack consecutive frames into requests
+    With batch_size, batches have that fixed size; otherwise frames are added while the
+    estimated input tokens (system prompt plus images plus YOLO context) stay within
+    token_budget and the expected output still fits MAX_OUTPUT_TOKENS.
+    Returns a list of {"start", "end", "max_tokens", "estimated_input_tokens"}
+    """
+    prompt_tokens = estimate_text_tokens(build_system_prompt(0, 0))
+    max_frames_by_output = max(1, (MAX_OUTPUT_TOKENS - OUTPUT_TOKENS_OVERHEAD) // OUTPUT_TOKENS_PER_FRAME)
+    
+    plan = []
+    start = 0
+    while start < len(frames_data):
+        end = start
+        input_tokens = prompt_tokens
+        while end < len(frames_data):
+            frame = frames_data[end]
+            frame_tokens = estimate_image_tokens(frame.get("width"), frame.get("height"), frame.get("image_detail", "auto")) + YOLO_CONTEXT_TOKENS_PER_FRAME
+            count = end - start
+            if batch_size:
+                if count >= batch_size:
+                    break
+            elif count > 0 and (input_tokens + frame_tokens > token_budget or count >= max_frames_by_output):
+                break
+            input_tokens += frame_tokens
+            end += 1
+        plan.append({
+            "start": start,
+            "end": end,
+            "max_tokens": output_tokens_for_batch(end - start),
+            "estimated_input_tokens": input_tokens
+        })
+        start = end
+    return plan
+
+def estimate_analysis_cost(frame_count, width, height, image_detail="auto", token_budget=DEFAULT_TOKEN_BUDGET,
+                           max_concurrency=DEFAULT_MAX_CONCURRENCY):
+    """
+    Estimated wall time (seconds) and price (USD) of analysing frame_count frames of the
+    given upload size: batches as plan_batches would pack them, each taking a fixed request
+    latency plus its expected output at OPENROUTER_OUTPUT_TOKENS_PER_SECOND, max_concurrency
+    at a time
+    """
+    frames = [{"width": width, "height": height, "image_detail": image_detail}] * frame_count
+    plan = plan_batches(frames, token_budget=token_budget)
+    output_tokens = [OUTPUT_TOKENS_OVERHEAD + OUTPUT_TOKENS_PER_FRAME * (batch["end"] - batch["start"]) for batch in plan]
+    request_seconds = [OPENROUTER_REQUEST_LATENCY + tokens / OPENROUTER_OUTPUT_TOKENS_PER_SECOND for tokens in output_tokens]
     
-    return all_frame_details, all_yolo_detections
+    concurrency = max(1, max_concurrency)
+    seconds = sum(max(request_seconds[i:i + concurrency]) for i in range(0, len(request_seconds), concurrency))
+    input_tokens = sum(batch["estimated_input_tokens"] for batch in plan)
+    cost = (input_tokens * OPENROUTER_INPUT_PRICE + sum(output_tokens) * OPENROUTER_OUTPUT_PRICE) / 1_000_000
+    return seconds, cost
 
-def analyze_batch_with_openrouter(batch_frames, api_key, batch_num, start_frame_idx, yolo_detections=None):
+def upload_frame_size(image_path, upload_options):
     """
-    Analyze a single batch of frames with OpenRouter, enhanced with YOLO detection data
+    Size a frame will have once prepared for upload, read from its JPEG header
     """
+    with open(image_path, 'rb') as f:
+        width, height = jpeg_dimensions(f.read())
+    max_side = upload_options.get("max_side")
+    if width and height and max_side and max(width, height) > max_side:
+        scale = max_side / max(width, height)
+        width, height = int(width * scale), int(height * scale)
+    return width, height
+
+def frame_position(filename, default):
+    """
+    Frame number from an extracted frame's name (frame_<n>_<mm>m<ss>s.jpg)
+    """
+    parts = filename.split('_')
     try:
-        # Prepare YOLO context if available
-        yolo_context = ""
-        if yolo_detections and len(yolo_detections) > 0:
-            yolo_summary = []
-            for frame_idx, detections in enumerate(yolo_detections):
-                if detections:
-                    detection_summary = f"Frame {start_frame_idx + frame_idx}: Detected {len(detections)} objects - "
-                    detection_summary += ", ".join([f"{d['class_name']} ({d['confidence']:.2f})" for d in detections])
-                    yolo_summary.append(detection_summary)
-            
-            if yolo_summary:
-                yolo_context = f"\n\nYOLO OBJECT DETECTION RESULTS:\n{chr(10).join(yolo_summary)}\n\nPlease cross-reference these YOLO detections with your visual analysis and provide comprehensive assessment."
+        return int(parts[1])
+    except (IndexError, ValueError):
+        return default
 
-        messages = [
-            {
-                "role": "system",
-                "content": f"""You are an expert warehouse safety inspector with 20+ years of experience. Analyze these images with the precision of a certified safety auditor.
+def select_frames_for_budget(frame_files, frames_dir, feature_cache=None, frame_budget=DEFAULT_FRAME_BUDGET, time_budget=None,
+                             cost_budget=None, upload_options=None, token_budget=DEFAULT_TOKEN_BUDGET,
+                             max_concurrency=DEFAULT_MAX_CONCURRENCY):
+    """
+    Choose which filtered frames are sent to the LLM
+    The frame budget (0 = none), time budget (seconds) and cost budget (USD) are turned into
+    a frame count with estimate_analysis_cost; if fewer frames than that remain, all are
+    kept, otherwise the most novel frames (select_novel_frames over the similarity
+    features) fill the count.
+    Returns (selected_files, report)
+    """
+    upload_options = {**DEFAULT_UPLOAD_OPTIONS, **(upload_options or {})}
+    report = {
+        "method": "all",
+        "candidates": len(frame_files),
+        "frame_budget": frame_budget or None,
+        "time_budget": time_budget,
+        "cost_budget": cost_budget,
+        "limited_by": None
+    }
+    if not frame_files:
+        return [], {**report, "selected": 0}
+    
+    width, height = upload_frame_size(os.path.join(frames_dir, frame_files[0]), upload_options)
+    
+    def estimate(count):
+        return estimate_analysis_cost(count, width, height, upload_options["image_detail"], token_budget, max_concurrency)
+    
+    max_frames = len(frame_files)
+    if frame_budget and frame_budget < max_frames:
+        max_frames = frame_budget
+        report["limited_by"] = "frames"
+    
+    def over_budget(count):
+        seconds, cost = estimate(count)
+        if time_budget is not None and seconds > time_budget:
+            return "time"
+        if cost_budget is not None and cost > cost_budget:
+            return "cost"
+        return None
+    
+    if max_frames > 1 and over_budget(max_frames):
+        # Estimates only grow with the frame count, so binary search for the most frames
+        # that fit (at least one frame is always analysed)
+        low, high = 1, max_frames - 1
+        while low < high:
+            middle = (low + high + 1) // 2
+            if over_budget(middle):
+                high = middle - 1
+            else:
+                low = middle
+        max_frames = low
+        report["limited_by"] = over_budget(max_frames + 1)
+    
+    selected = frame_files
+    if max_frames < len(frame_files):
+        if feature_cache is None:
+            feature_cache = FrameFeatureCache()
+        candidates = []
+        for index, filename in enumerate(frame_files):
+            features = feature_cache.get(os.path.join(frames_dir, filename))
+            if features is not None:
+                candidates.append((filename, features, frame_position(filename, index)))
+        picks = select_novel_frames([candidate[1] for candidate in candidates], [candidate[2] for candidate in candidates], max_frames)
+        selected = [candidates[index][0] for index, _ in picks]
+        report["method"] = "novelty"
+        report["frames"] = [{"filename": candidates[index][0], "novelty": None if novelty is None else round(novelty, 4)} for index, novelty in picks]
+        print(f"Novelty selection: {len(frame_files)} -> {len(selected)} frames (limited by {report['limited_by']} budget)", file=sys.stderr)
+    
+    seconds, cost = estimate(len(selected))
+    report["selected"] = len(selected)
+    report["estimated_seconds"] = round(seconds, 1)
+    report["estimated_cost_usd"] = round(cost, 4)
+    return selected, report
+
+def summarize_yolo_detections(detections):
+    """
+    One-line summary of a frame's YOLO detections as shown to the LLM
+    """
+    return f"Detected {len(detections)} objects - " + ", ".join([f"{d['class_name']} ({d['confidence']:.2f})" for d in detections])
+
+def build_yolo_context(yolo_detections, start_frame_idx):
+    """
+    YOLO results section appended to the system prompt, or "" when nothing was detected
+    """
+    yolo_summary = []
+    for frame_idx, detections in enumerate(yolo_detections or []):
+        if detections:
+            yolo_summary.append(f"Frame {start_frame_idx + frame_idx}: {summarize_yolo_detections(detections)}")
+    
+    if not yolo_summary:
+        return ""
+    return f"\n\nYOLO OBJECT DETECTION RESULTS:\n{chr(10).join(yolo_summary)}\n\nPlease cross-reference these YOLO detections with your visual analysis and provide comprehensive assessment."
+
+def build_system_prompt(batch_num, start_frame_idx, yolo_context=""):
+    """
+    System prompt for one batch of frames
+    """
+    return f"""You are an expert warehouse safety inspector with 20+ years of experience. Analyze these images with the precision of a certified safety auditor.
 
 BATCH INFO: {batch_num + 1}, Frame indices start from {start_frame_idx}
 
@@ -991,6 +1852,21 @@ Respond ONLY in strict JSON format:
 8. NO ASSUMPTIONS: Only report what you can clearly see and verify
 9. EMERGENCY ACCESS: Prioritize issues affecting emergency vehicle access
 10. JSON ONLY: Return valid JSON with all required fields{yolo_context}"""
+
+def analyze_batch_with_openrouter(batch_frames, api_key, batch_num, start_frame_idx, yolo_detections=None, max_tokens=None):
+    """
+    Analyze a single batch of frames with OpenRouter, enhanced with YOLO detection data
+    Truncated or unparseable responses are reported with "retry_split" so the caller can
+    retry the frames in smaller requests
+    """
+    try:
+        # Prepare YOLO context if available
+        yolo_context = build_yolo_context(yolo_detections, start_frame_idx)
+        
+        messages = [
+            {
+                "role": "system",
+                "content": build_system_prompt(batch_num, start_frame_idx, yolo_context)
             },
             {
                 "role": "user",
@@ -1002,38 +1878,71 @@ Respond ONLY in strict JSON format:
                 ] + [
                     {
                         "type": "image_url",
-                        "image_url": {"url": f"data:image/jpeg;base64,{frame['image_base64']}"}
+                        "image_url": image_url_payload(frame)
                     } for frame in batch_frames
                 ]
             }
         ]
         
-        response = requests.post(
-            "https://openrouter.ai/api/v1/chat/completions",
-            headers={
-                "Authorization": f"Bearer {api_key}",
-                "Content-Type": "application/json",
-                "HTTP-Referer": "http://localhost:3000",
-                "X-Title": "Warehouse Safety Inspector"
-            },
-            json={
-                "model": "openai/gpt-4o",
-                "messages": messages,
-                "max_tokens": 2000,
-                "temperature": 0.1,
-                "response_format": {"type": "json_object"}
-            },
-            timeout=120
-        )
+        request_body = json.dumps({
+            "model": OPENROUTER_MODEL,
+            "messages": messages,
+            **OPENROUTER_REQUEST_PARAMS,
+            **({"max_tokens": max_tokens} if max_tokens else {})
+        }).encode("utf-8")
+        image_bytes = sum(len(frame['image_base64']) for frame in batch_frames)
+        
+        def send():
+            record_upload(len(request_body), image_bytes)
+            with _stage_timer.stage("llm_request"):
+                return get_http_session().post(
+                    OPENROUTER_API_URL,
+                    headers={
+                        "Authorization": f"Bearer {api_key}",
+                        "Content-Type": "application/json",
+                        "HTTP-Referer": "http://localhost:3000",
+                        "X-Title": "Warehouse Safety Inspector"
+                    },
+                    data=request_body,
+                    timeout=120
+                )
+        
+        try:
+            response = send_with_retries(send, _retry_policy, _rate_limiter, _circuit_breaker, _request_stats,
+                                         label=f"Batch {batch_num + 1}")
+        except (CircuitOpenError, requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+            return {
+                "success": False,
+                "error": f"OpenRouter request failed: {e}",
+                "retryable": True
+            }
         
         if response.status_code != 200:
             return {
                 "success": False,
-                "error": f"OpenRouter API error: {response.status_code} - {response.text}"
+                "error": f"OpenRouter API error: {response.status_code} - {response.text}",
+                "retryable": response.status_code in RETRYABLE_STATUS_CODES
             }
         
+        parse_start = time.perf_counter()
         result = response.json()
-        ai_analysis = json.loads(result["choices"][0]["message"]["content"])
+        choice = result["choices"][0]
+        if choice.get("finish_reason") == "length":
+            return {
+                "success": False,
+                "error": f"OpenRouter response truncated at max_tokens for {len(batch_frames)} frames",
+                "retry_split": True
+            }
+        try:
+            ai_analysis = json.loads(choice["message"]["content"])
+        except (TypeError, ValueError) as e:
+            return {
+                "success": False,
+                "error": f"Could not parse OpenRouter response as JSON: {e}",
+                "retry_split": True
+            }
+        finally:
+            _stage_timer.record("parse", time.perf_counter() - parse_start, parse_start)
         
         # DEBUG: Print the AI analysis to see what we're getting
         print(f"DEBUG: AI Analysis for batch {batch_num + 1}:", file=sys.stderr)
@@ -1056,10 +1965,195 @@ Respond ONLY in strict JSON format:
             "error": f"Batch analysis error: {str(e)}"
         }
 
-def analyze_frames_with_openrouter(frames_dir, api_key, job_id):
+def analyze_batch_adaptive(batch_frames, api_key, batch_num, start_frame_idx, yolo_detections=None, max_tokens=None):
+    """
+    Analyze a batch, splitting it in half and retrying whenever the response is truncated
+    or cannot be parsed; a single frame is retried once with the largest output allowance
+    """
+    max_tokens = max_tokens or output_tokens_for_batch(len(batch_frames))
+    batch_result = analyze_batch_with_openrouter(batch_frames, api_key, batch_num, start_frame_idx, yolo_detections, max_tokens)
+    if batch_result.get("success") or not batch_result.get("retry_split"):
+        return batch_result
+    
+    if len(batch_frames) == 1:
+        if max_tokens >= MAX_OUTPUT_TOKENS:
+            return batch_result
+        print(f"Batch {batch_num + 1}: {batch_result['error']}; retrying frame {start_frame_idx} with max_tokens={MAX_OUTPUT_TOKENS}", file=sys.stderr)
+        return analyze_batch_with_openrouter(batch_frames, api_key, batch_num, start_frame_idx, yolo_detections, MAX_OUTPUT_TOKENS)
+    
+    middle = len(batch_frames) // 2
+    print(f"Batch {batch_num + 1}: {batch_result['error']}; splitting into {middle} + {len(batch_frames) - middle} frames", file=sys.stderr)
+    yolo_detections = yolo_detections or [[] for _ in batch_frames]
+    halves = [
+        analyze_batch_adaptive(batch_frames[:middle], api_key, batch_num, start_frame_idx, yolo_detections[:middle]),
+        analyze_batch_adaptive(batch_frames[middle:], api_key, batch_num, start_frame_idx + middle, yolo_detections[middle:])
+    ]
+    
+    splits = 1 + sum(half.get("splits", 0) for half in halves)
+    failed = [(name, half) for name, half in zip(("first", "second"), halves) if not half.get("success")]
+    if failed:
+        # The batch only succeeds as a whole: frames of a failed half must not silently drop
+        # out of a batch reported as successful (and then skip the requeue and checkpoints)
+        which = "both halves" if len(failed) == 2 else f"{failed[0][0]} half"
+        return {
+            "success": False,
+            "error": f"Batch {batch_num + 1} split failed in {which}: " + "; ".join(half.get("error", "unknown error") for _, half in failed),
+            "retryable": any(half.get("retryable") for _, half in failed),
+            "retry_split": any(half.get("retry_split") for _, half in failed),
+            "splits": splits
+        }
+    
+    analyses = [half["analysis"] for half in halves]
+    return {
+        "success": True,
+        "analysis": {
+            "incorrectParking": any(analysis.get("incorrectParking") for analysis in analyses),
+            "wasteMaterial": any(analysis.get("wasteMaterial") for analysis in analyses),
+            "overallExplanation": " ".join(analysis.get("overallExplanation", "") for analysis in analyses).strip(),
+            "frameDetails": [detail for analysis in analyses for detail in analysis.get("frameDetails", [])]
+        },
+        "splits": splits
+    }
+
+def frame_cache_context(yolo_detections, image_detail="auto"):
+    """
+    Context fingerprint for one frame's cache entry: prompt template, model, request
+    parameters, vision detail level and the frame's own YOLO summary
+    """
+    return fingerprint(
+        build_system_prompt(0, 0),
+        OPENROUTER_MODEL,
+        json.dumps(OPENROUTER_REQUEST_PARAMS, sort_keys=True),
+        image_detail,
+        summarize_yolo_detections(yolo_detections) if yolo_detections else ""
+    )
+
+# frameDetails fields that describe where a frame sits in this run rather than what it shows
+POSITION_FIELDS = ("frameIndex", "timestamp")
+
+def frame_timestamp_label(frame):
+    """
+    MM:SS label for a frame, from the "XXmXXs" timestamp in its filename
+    """
+    match = re.fullmatch(r"(\d+)m(\d+)s", frame.get("timestamp", ""))
+    return f"{match.group(1)}:{match.group(2)}" if match else frame.get("timestamp", "00:00")
+
+def contiguous_runs(positions):
+    """
+    Split sorted positions into runs of consecutive values: [0, 1, 3] -> [[0, 1], [3]]
+    """
+    runs = []
+    for position in positions:
+        if runs and position == runs[-1][-1] + 1:
+            runs[-1].append(position)
+        else:
+            runs.append([position])
+    return runs
+
+def analyze_batch_with_cache(batch_frames, api_key, batch_num, start_frame_idx, yolo_detections, response_cache, max_tokens=None):
+    """
+    Analyze a batch, reusing cached per-frame answers and only sending the misses to OpenRouter
+    Misses are sent as runs of consecutive frames, each with its own frame numbers, so the
+    prompt and YOLO context refer to the frames' real positions. Cache entries are stored
+    without frameIndex and timestamp, which are filled in from the current frame.
+    Returns the same shape as analyze_batch_with_openrouter, with frameDetails in batch order
+    """
+    yolo_detections = yolo_detections or [[] for _ in batch_frames]
+    keys = [
+        response_cache.make_key(frame['image_base64'], frame_cache_context(detections, frame.get("image_detail", "auto")))
+        for frame, detections in zip(batch_frames, yolo_detections)
+    ]
+    frame_details = [response_cache.get(key) for key in keys]
+    
+    def place(position, detail):
+        detail["frameIndex"] = start_frame_idx + position
+        detail["timestamp"] = frame_timestamp_label(batch_frames[position])
+        return detail
+    
+    for position, detail in enumerate(frame_details):
+        if detail is not None:
+            place(position, detail)
+    
+    missing = [position for position, detail in enumerate(frame_details) if detail is None]
+    if not missing:
+        print(f"Batch {batch_num + 1}: all {len(batch_frames)} frames served from LLM cache", file=sys.stderr)
+        return {"success": True, "analysis": {"frameDetails": frame_details}, "cache_hits": len(batch_frames)}
+    
+    # A full miss is a single run covering the batch, so it goes through the same count
+    # check as a partial one and keeps the batch's token estimate
+    runs = contiguous_runs(missing)
+    if len(missing) < len(batch_frames):
+        print(f"Batch {batch_num + 1}: {len(batch_frames) - len(missing)} frames from LLM cache, sending {len(missing)} in {len(runs)} run(s)", file=sys.stderr)
+    splits = 0
+    for run in runs:
+        run_start, run_end = run[0], run[-1] + 1
+        run_result = analyze_batch_adaptive(batch_frames[run_start:run_end], api_key, batch_num, start_frame_idx + run_start,
+                                            yolo_detections[run_start:run_end],
+                                            max_tokens if len(run) == len(batch_frames) else None)
+        splits += run_result.get("splits", 0)
+        if not run_result.get("success"):
+            return run_result
+        new_details = run_result.get("analysis", {}).get("frameDetails", [])
+        if len(new_details) != len(run):
+            # Answers cannot be matched to frames, and a partial batch must not pass as complete
+            return {
+                "success": False,
+                "error": f"Batch {batch_num + 1}: expected {len(run)} frame details for frames {start_frame_idx + run_start}-{start_frame_idx + run_end - 1}, got {len(new_details)}",
+                "retryable": True,
+                "splits": splits
+            }
+        for position, detail in zip(run, new_details):
+            response_cache.put(keys[position], {name: value for name, value in detail.items() if name not in POSITION_FIELDS})
+            frame_details[position] = place(position, detail)
+    
+    return {
+        "success": True,
+        "analysis": {"frameDetails": frame_details},
+        "cache_hits": len(batch_frames) - len(missing),
+        "splits": splits
+    }
+
+def checkpoint_fingerprint(frames_dir, frame_files, dedup_mode, max_concurrency, token_budget, upload_options,
+                           frame_budget, time_budget, cost_budget):
+    """
+    Fingerprint of everything a run's checkpoints depend on: the frame files (names and
+    sizes), the selection and upload settings, and the prompt, model and YOLO setup
+    """
+    upload_options = {**DEFAULT_UPLOAD_OPTIONS, **(upload_options or {})}
+    frame_sizes = [(filename, os.path.getsize(os.path.join(frames_dir, filename))) for filename in frame_files]
+    return fingerprint(
+        "checkpoint-v1",
+        json.dumps(frame_sizes),
+        dedup_mode,
+        max_concurrency,
+        token_budget,
+        json.dumps(upload_options, sort_keys=True),
+        frame_budget,
+        time_budget,
+        cost_budget,
+        frame_cache_context([], upload_options["image_detail"]),
+        json.dumps(YOLO_MODEL_CONFIGS, sort_keys=True) if yolo_available() else "no-yolo"
+    )
+
+def analyze_frames_with_openrouter(frames_dir, api_key, job_id, dedup_mode="recent", max_concurrency=DEFAULT_MAX_CONCURRENCY, use_llm_cache=True,
+                                   token_budget=DEFAULT_TOKEN_BUDGET, upload_options=None, frame_budget=DEFAULT_FRAME_BUDGET,
+                                   time_budget=None, cost_budget=None, resume=False):
     """
     Analyze extracted frames using OpenRouter GPT-4o API
+    dedup_mode "recent" compares each frame with the last kept frames; "hash" deduplicates
+    across the whole video with a perceptual-hash index
+    max_concurrency caps the number of LLM batch requests in flight
+    use_llm_cache reuses per-frame answers from the on-disk LLM response cache
+    token_budget caps the estimated input tokens packed into one OpenRouter request
+    upload_options overrides DEFAULT_UPLOAD_OPTIONS (max_side, jpeg_quality, grid_overlay,
+    image_detail) for the images sent to OpenRouter
+    frame_budget, time_budget (seconds) and cost_budget (USD) limit how many of the filtered
+    frames are analysed; the most novel frames are kept (see select_frames_for_budget)
+    Stage results are checkpointed in frames_dir; resume reuses the checkpoints of an
+    earlier run with the same frames and settings instead of redoing that work
     """
+    _stage_timer.reset()
+    reset_run_stats()
     try:
         # Find all frame files in the directory
         frame_files = []
@@ -1077,45 +2171,98 @@ def analyze_frames_with_openrouter(frames_dir, api_key, job_id):
             }
         
         print(f"Found {len(frame_files)} frame files to analyze", file=sys.stderr)
+        _stage_timer.count("frames_found", len(frame_files))
         
-        # Step 1: Filter out similar frames with balanced similarity detection
-        print("Step 1: Filtering out similar frames (balanced mode)...", file=sys.stderr)
-        unique_frame_files = filter_unique_frames(frame_files, frames_dir, similarity_threshold=0.88)
+        checkpoint = None
+        try:
+            checkpoint = RunCheckpoint(frames_dir, checkpoint_fingerprint(
+                frames_dir, frame_files, dedup_mode, max_concurrency, token_budget, upload_options,
+                frame_budget, time_budget, cost_budget
+            ), resume=resume)
+        except OSError as e:
+            print(f"Checkpoints disabled: {e}", file=sys.stderr)
         
-        # Additional safety check: if we still have too many frames, force more aggressive sampling
-        if len(unique_frame_files) > 15:
-            print(f"Still {len(unique_frame_files)} frames after filtering - applying additional time-based sampling", file=sys.stderr)
-            step = max(2, len(unique_frame_files) // 10)  # Max 10 frames (increased from 6)
-            unique_frame_files = unique_frame_files[::step][:10]
-            print(f"Final frame count after additional sampling: {len(unique_frame_files)}", file=sys.stderr)
+        selection = checkpoint.load_selection() if checkpoint is not None else None
+        if selection is not None:
+            print("Step 1: Frame selection restored from checkpoint", file=sys.stderr)
+            filtered_count = selection["filtered_count"]
+            unique_frame_files = selection["unique_frame_files"]
+            frame_selection = selection["frame_selection"]
+        else:
+            # Step 1: Filter out similar frames with balanced similarity detection
+            print("Step 1: Filtering out similar frames (balanced mode)...", file=sys.stderr)
+            emit_event("progress", stage="filter", frames_total=len(frame_files))
+            feature_cache = FrameFeatureCache()
+            with _stage_timer.stage("filter"):
+                if dedup_mode == "hash":
+                    filtered_frame_files = filter_unique_frames_by_hash(frame_files, frames_dir, similarity_threshold=0.88, feature_cache=feature_cache)
+                else:
+                    filtered_frame_files = filter_unique_frames(frame_files, frames_dir, similarity_threshold=0.88, feature_cache=feature_cache)
+            filtered_count = len(filtered_frame_files)
+            
+            # Keep the most novel frames that fit the frame, time and cost budget
+            with _stage_timer.stage("select"):
+                unique_frame_files, frame_selection = select_frames_for_budget(
+                    filtered_frame_files, frames_dir, feature_cache, frame_budget=frame_budget, time_budget=time_budget,
+                    cost_budget=cost_budget, upload_options=upload_options, token_budget=token_budget, max_concurrency=max_concurrency
+                )
+            if checkpoint is not None:
+                with _stage_timer.stage("checkpoint"):
+                    checkpoint.save_selection(filtered_count, unique_frame_files, frame_selection)
+        _stage_timer.count("frames_filtered", filtered_count)
+        _stage_timer.count("frames_selected", len(unique_frame_files))
+        print(f"Frame selection: {frame_selection['selected']} of {frame_selection['candidates']} frames, "
+              f"estimated {frame_selection['estimated_seconds']}s and ${frame_selection['estimated_cost_usd']}", file=sys.stderr)
         
-        # Step 2: Convert unique frames to base64
+        # Step 2: Prepare unique frames for upload (optional resize/re-encode/grid) and convert to base64
         print("Step 2: Loading unique frames...", file=sys.stderr)
+        emit_event("progress", stage="load", unique_frames=len(unique_frame_files))
+        upload_options = {**DEFAULT_UPLOAD_OPTIONS, **(upload_options or {})}
+        payload_cache = None
+        if use_llm_cache and upload_options != DEFAULT_UPLOAD_OPTIONS:
+            try:
+                payload_cache = UploadPayloadCache()
+            except OSError as e:
+                print(f"Upload payload cache disabled: {e}", file=sys.stderr)
+        source_bytes = 0
+        prepared_bytes = 0
         frames_data = []
         for idx, filename in enumerate(unique_frame_files):
             filepath = os.path.join(frames_dir, filename)
             try:
-                with open(filepath, 'rb') as f:
-                    image_data = f.read()
+                with open(filepath, 'rb') as f, _stage_timer.stage("load"):
+                    source_data = f.read()
+                    image_data = prepare_upload_image(source_data, upload_options, payload_cache)
+                    source_bytes += len(source_data)
+                    prepared_bytes += len(image_data)
                     image_base64 = base64.b64encode(image_data).decode('utf-8')
                     
                     # Extract timestamp from filename (frame_X_XXmXXs.jpg)
                     parts = filename.replace('.jpg', '').split('_')
                     timestamp = parts[2] if len(parts) > 2 else "00:00"
                     
+                    width, height = jpeg_dimensions(image_data)
+                    
                     frames_data.append({
                         "filename": filename,
                         "timestamp": timestamp,
                         "image_base64": image_base64,
-                        "original_index": idx
+                        "original_index": idx,
+                        "width": width,
+                        "height": height,
+                        "image_detail": upload_options["image_detail"]
                     })
                     
-                print(f"Loaded unique frame: {filename} ({len(image_data)} bytes)", file=sys.stderr)
+                print(f"Loaded unique frame: {filename} ({len(source_data)} bytes, {len(image_data)} bytes to upload)", file=sys.stderr)
                     
             except Exception as e:
                 print(f"Failed to load frame {filename}: {e}", file=sys.stderr)
                 continue
         
+        if payload_cache is not None:
+            payload_cache.evict()
+        print(f"Upload preparation: {source_bytes} source bytes -> {prepared_bytes} bytes to upload", file=sys.stderr)
+        
         if not frames_data:
             return {
                 "success": False,
@@ -1126,10 +2273,23 @@ def analyze_frames_with_openrouter(frames_dir, api_key, job_id):
         
         print(f"Step 3: Processing {len(frames_data)} unique frames in batches with YOLO integration...", file=sys.stderr)
         
-        # Step 3: Process frames in smaller batches for efficiency with YOLO detection
-        batch_size = min(3, max(1, len(frames_data) // 2))  # Dynamic batch size based on frame count
-        print(f"Using batch size: {batch_size} for {len(frames_data)} frames", file=sys.stderr)
-        all_frame_details, all_yolo_detections = process_frames_in_batches(frames_data, api_key, batch_size=batch_size, frames_dir=frames_dir)
+        # Step 3: Process frames in batches packed up to the token budget, with YOLO detection
+        response_cache = None
+        if use_llm_cache:
+            try:
+                response_cache = LLMResponseCache()
+            except OSError as e:
+                print(f"LLM response cache disabled: {e}", file=sys.stderr)
+        all_frame_details, all_yolo_detections, pipeline_timings = process_frames_in_batches(
+            frames_data, api_key, frames_dir=frames_dir, max_concurrency=max_concurrency,
+            response_cache=response_cache, token_budget=token_budget, checkpoint=checkpoint
+        )
+        if response_cache is not None:
+            response_cache.evict()
+            llm_cache_stats = response_cache.stats()
+            print(f"LLM response cache: {llm_cache_stats}", file=sys.stderr)
+        else:
+            llm_cache_stats = {"enabled": False}
         
         # Step 4: Combine results and determine overall safety status with enhanced bounding boxes
         overall_incorrect_parking = False
@@ -1139,6 +2299,7 @@ def analyze_frames_with_openrouter(frames_dir, api_key, job_id):
         comprehensive_mitigations = []
         
         # Create frame objects with enhanced bounding boxes (combining YOLO and AI detections)
+        merge_start = time.perf_counter()
         for frame_idx, frame_detail in enumerate(all_frame_details):
             frame_index = frame_detail.get('frameIndex', 0)
             timestamp = frame_detail.get('timestamp', '00:00')
@@ -1237,6 +2398,7 @@ def analyze_frames_with_openrouter(frames_dir, api_key, job_id):
             "wasteMaterial": overall_waste_material
         }
         comprehensive_mitigations = generate_mitigation_strategies(flat_yolo_detections, ai_analysis_summary)
+        _stage_timer.record("merge", time.perf_counter() - merge_start, merge_start)
         
         combined_explanation = f"Comprehensive analysis of {len(frames_data)} unique frames using combined YOLO object detection and AI grid-based analysis (filtered from {len(frame_files)} total frames). " + "; ".join(all_explanations) if all_explanations else f"Analyzed {len(frames_data)} unique frames - no safety violations detected."
         
@@ -1273,10 +2435,25 @@ def analyze_frames_with_openrouter(frames_dir, api_key, job_id):
             "yolo_detections": total_yolo_objects,
             "hazardous_objects": total_hazardous_objects,
             "method": "Enhanced Detection (YOLO + AI Grid Analysis)",
+            "yolo_model_stats": get_yolo_model_stats(),
+            "pipeline_timings": pipeline_timings,
+            "timings": _stage_timer.summary(),
+            "frame_selection": frame_selection,
+            "checkpoint": checkpoint.stats() if checkpoint is not None else {"enabled": False},
+            "llm_cache": llm_cache_stats,
+            "request_stats": get_request_stats(),
+            "upload": {
+                **upload_options,
+                "source_bytes": source_bytes,
+                "prepared_bytes": prepared_bytes,
+                **get_upload_stats(),
+                "payload_cache": payload_cache.stats() if payload_cache is not None else {"enabled": False}
+            },
             "detection_methods": {
-                "yolo_available": HAS_YOLO,
+                "yolo_available": yolo_available(),
                 "ai_grid_analysis": True,
-                "similarity_filtering": True
+                "similarity_filtering": True,
+                "dedup_mode": dedup_mode
             }
         }
         
@@ -1305,31 +2482,88 @@ def analyze_frames_with_openrouter(frames_dir, api_key, job_id):
             "frames_analyzed": len(frames_data) if 'frames_data' in locals() else 0
         }
 
+def build_arg_parser():
+    """
+    Command-line arguments of this script (also accepted by pipeline_worker.py)
+    """
+    parser = argparse.ArgumentParser(description="Analyze extracted frames with YOLO and OpenRouter")
+    parser.add_argument("frames_dir")
+    parser.add_argument("api_key")
+    parser.add_argument("job_id")
+    parser.add_argument("--ndjson", action="store_true",
+                        help="Stream NDJSON events (progress, batch, result) instead of one JSON document")
+    parser.add_argument("--dedup", choices=["recent", "hash"], default="recent",
+                        help="Compare with recent kept frames, or deduplicate the whole video via a perceptual-hash index")
+    parser.add_argument("--max-concurrency", type=int, default=DEFAULT_MAX_CONCURRENCY,
+                        help="Maximum number of OpenRouter batch requests in flight at once")
+    parser.add_argument("--no-llm-cache", action="store_true",
+                        help="Always send frames to OpenRouter instead of reusing cached answers")
+    parser.add_argument("--token-budget", type=int, default=DEFAULT_TOKEN_BUDGET,
+                        help="Estimated input tokens (prompt + images) packed into one OpenRouter request")
+    parser.add_argument("--upload-max-side", type=int, default=0,
+                        help="Downscale uploaded frames so the longest side is at most this many pixels (0 keeps the size)")
+    parser.add_argument("--upload-quality", type=int, default=0,
+                        help="Re-encode uploaded frames at this JPEG quality (0 sends the files as extracted)")
+    parser.add_argument("--grid-overlay", action="store_true",
+                        help="Draw the A1-C4 analysis grid on uploaded frames")
+    parser.add_argument("--image-detail", choices=["auto", "low", "high"], default="auto",
+                        help="Vision detail level requested for each image")
+    parser.add_argument("--frame-budget", type=int, default=DEFAULT_FRAME_BUDGET,
+                        help="Most frames sent for analysis after similarity filtering, chosen by novelty (0 for no limit)")
+    parser.add_argument("--time-budget", type=float, default=None,
+                        help="Limit frames so the estimated LLM analysis time stays within this many seconds")
+    parser.add_argument("--cost-budget", type=float, default=None,
+                        help="Limit frames so the estimated OpenRouter cost stays within this many US dollars")
+    parser.add_argument("--resume", action="store_true",
+                        help="Reuse the checkpoints of an interrupted run on the same frames instead of redoing finished stages")
+    return parser
+
+def validate_args(args):
+    """
+    Error message for arguments that cannot be run, or None
+    """
+    if not os.path.exists(args.frames_dir):
+        return f"Frames directory does not exist: {args.frames_dir}"
+    if not args.api_key:
+        return "OpenRouter API key is required"
+    return None
+
+def run_from_args(args):
+    """
+    Run the analysis for parsed command-line arguments and return the result dict
+    """
+    return analyze_frames_with_openrouter(args.frames_dir, args.api_key, args.job_id, dedup_mode=args.dedup, max_concurrency=args.max_concurrency,
+                                          use_llm_cache=not args.no_llm_cache, token_budget=args.token_budget,
+                                          upload_options={
+                                              "max_side": args.upload_max_side,
+                                              "jpeg_quality": args.upload_quality,
+                                              "grid_overlay": args.grid_overlay,
+                                              "image_detail": args.image_detail
+                                          },
+                                          frame_budget=args.frame_budget, time_budget=args.time_budget,
+                                          cost_budget=args.cost_budget, resume=args.resume)
+
 if __name__ == "__main__":
-    if len(sys.argv) != 4:
+    startup = startup_report(_module_start)
+    if len(sys.argv) < 4:
         print(json.dumps({
             "success": False, 
-            "error": "Usage: python analyze_frames_openrouter.py <frames_directory> <api_key> <job_id>"
+            "error": "Usage: python analyze_frames_openrouter.py <frames_directory> <api_key> <job_id> [--ndjson] [--dedup recent|hash] [--max-concurrency N] [--no-llm-cache] [--token-budget N] [--upload-max-side PX] [--upload-quality Q] [--grid-overlay] [--image-detail auto|low|high] [--frame-budget N] [--time-budget SECONDS] [--cost-budget USD] [--resume]"
         }))
         sys.exit(1)
     
-    frames_dir = sys.argv[1]
-    api_key = sys.argv[2]
-    job_id = sys.argv[3]
-    
-    if not os.path.exists(frames_dir):
-        print(json.dumps({
-            "success": False,
-            "error": f"Frames directory does not exist: {frames_dir}"
-        }))
-        sys.exit(1)
+    args = build_arg_parser().parse_args()
+    enable_event_stream(args.ndjson)
     
-    if not api_key:
-        print(json.dumps({
+    error = validate_args(args)
+    if error:
+        emit_result({
             "success": False,
-            "error": "OpenRouter API key is required"
-        }))
+            "error": error
+        })
         sys.exit(1)
     
-    result = analyze_frames_with_openrouter(frames_dir, api_key, job_id)
-    print(json.dumps(result))
+    with profile_run(_stage_timer, "analyze_frames_openrouter"):
+        result = run_from_args(args)
+    result["startup"] = {**startup, **import_report()}
+    emit_result(result)
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for cross-model duplicate detection suppression
+Compares the previous O(n^2) pure-Python remove_duplicate_detections against the
+NumPy class-aware NMS on synthetic frames with three models' worth of candidates
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+
+sys.path.append(os.path.dirname(__file__))
+from analyze_frames_openrouter import remove_duplicate_detections
+
+SYNTHETIC_CLASSES = ["person", "car", "truck", "chair", "box", "bottle", "table", "bicycle", "backpack", "bench"]
+MODEL_NAMES = ["nano", "small", "medium"]
+
+def legacy_remove_duplicate_detections(detections, distance_threshold=0.1):
+    """
+    Previous implementation, kept here as the benchmark baseline
+    """
+    if not detections:
+        return []
+
+    unique_detections = []
+
+    for detection in detections:
+        is_duplicate = False
+
+        for existing in unique_detections:
+            # Check if same class and close proximity
+            if (detection['class_name'] == existing['class_name']):
+                # Calculate center distance
+                center1 = (detection['bbox']['x'] + detection['bbox']['w']/2,
+                          detection['bbox']['y'] + detection['bbox']['h']/2)
+                center2 = (existing['bbox']['x'] + existing['bbox']['w']/2,
+                          existing['bbox']['y'] + existing['bbox']['h']/2)
+
+                distance = ((center1[0] - center2[0])**2 + (center1[1] - center2[1])**2)**0.5
+
+                if distance < distance_threshold:
+                    # Keep the one with higher confidence
+                    if detection['confidence'] > existing['confidence']:
+                        unique_detections.remove(existing)
+                        unique_detections.append(detection)
+                    is_duplicate = True
+                    break
+
+        if not is_duplicate:
+            unique_detections.append(detection)
+
+    return unique_detections
+
+def generate_synthetic_frame(rng, boxes_per_model=100):
+    """
+    Generate one frame's candidate detections: every model sees the same objects with
+    jittered boxes and confidences, like the multi-model YOLO pass at a low threshold
+    """
+    class_ids = rng.integers(0, len(SYNTHETIC_CLASSES), boxes_per_model)
+    w = rng.uniform(0.02, 0.3, boxes_per_model)
+    h = rng.uniform(0.02, 0.3, boxes_per_model)
+    x = rng.uniform(0, 1, boxes_per_model) * (1 - w)
+    y = rng.uniform(0, 1, boxes_per_model) * (1 - h)
+
+    detections = []
+    for model_name in MODEL_NAMES:
+        jitter = rng.normal(0, 0.01, (boxes_per_model, 4))
+        confidences = rng.uniform(0.07, 0.95, boxes_per_model)
+        for i in range(boxes_per_model):
+            class_name = SYNTHETIC_CLASSES[class_ids[i]]
+            bbox = {
+                "x": float(np.clip(x[i] + jitter[i, 0], 0, 1)),
+                "y": float(np.clip(y[i] + jitter[i, 1], 0, 1)),
+                "w": float(max(0.005, w[i] + jitter[i, 2])),
+                "h": float(max(0.005, h[i] + jitter[i, 3]))
+            }
+            detections.append({
+                "class_name": class_name,
+                "confidence": float(confidences[i]),
+                "bbox": bbox,
+                "model_used": model_name,
+                "detection_id": f"{class_name}_{bbox['x']:.3f}_{bbox['y']:.3f}"
+            })
+
+    order = rng.permutation(len(detections))
+    return [detections[i] for i in order]
+
+def time_function(func, frames, repeat):
+    """
+    Best-of-repeat wall time for running func over every frame, in seconds
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for detections in frames:
+            func(detections)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def run_benchmark(num_frames=50, boxes_per_model=100, repeat=5, seed=0):
+    """
+    Run both implementations over the same synthetic frames and summarise the results
+    """
+    rng = np.random.default_rng(seed)
+    frames = [generate_synthetic_frame(rng, boxes_per_model) for _ in range(num_frames)]
+
+    legacy_time = time_function(legacy_remove_duplicate_detections, frames, repeat)
+    nms_time = time_function(remove_duplicate_detections, frames, repeat)
+
+    legacy_kept = sum(len(legacy_remove_duplicate_detections(f)) for f in frames)
+    nms_kept = sum(len(remove_duplicate_detections(f)) for f in frames)
+
+    return {
+        "frames": num_frames,
+        "candidates_per_frame": boxes_per_model * len(MODEL_NAMES),
+        "legacy_ms_per_frame": legacy_time / num_frames * 1000,
+        "nms_ms_per_frame": nms_time / num_frames * 1000,
+        "speedup": legacy_time / nms_time if nms_time > 0 else None,
+        "legacy_kept_per_frame": legacy_kept / num_frames,
+        "nms_kept_per_frame": nms_kept / num_frames
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark duplicate detection suppression")
+    parser.add_argument("--frames", type=int, default=50, help="Number of synthetic frames")
+    parser.add_argument("--boxes-per-model", type=int, default=100, help="Candidates per model per frame (max_det)")
+    parser.add_argument("--repeat", type=int, default=5, help="Timing repetitions (best is reported)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    result = run_benchmark(args.frames, args.boxes_per_model, args.repeat, args.seed)
+    print(json.dumps(result, indent=2))
@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""
+Reproducible end-to-end benchmark for the extraction and analysis pipeline
+Generates a synthetic warehouse-like video (racks, floor markings, a moving forklift and
+a pallet that appears partway through each aisle, with cuts between aisles), then times
+the extractor, both similarity filters, the YOLO post-processing on synthetic model
+output and the analysis/merge step against the local mock OpenRouter server. Results are
+written as JSON so runs on different commits can be compared with --compare.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import resource
+import subprocess
+import tempfile
+from types import SimpleNamespace
+import cv2
+import numpy as np
+
+sys.path.append(os.path.dirname(__file__))
+import analyze_frames_openrouter
+from analyze_frames_openrouter import (
+    filter_unique_frames, filter_unique_frames_by_hash, remove_duplicate_detections,
+    _detections_from_yolo_result, analyze_frames_with_openrouter
+)
+from extract_frames_opencv import extract_frames_with_opencv
+from frame_features import FrameFeatureCache
+from mock_openrouter_server import start_mock_server
+from benchmark_dedup import SYNTHETIC_CLASSES
+
+# Seconds of footage per aisle before the synthetic video cuts to the next one
+AISLE_DURATION = 20
+# Distinct sensor-noise patterns cycled through the synthetic video
+NOISE_FIELDS = 8
+
+def generate_warehouse_video(path, duration=60, width=1280, height=720, fps=15, seed=0):
+    """
+    Write a synthetic warehouse hallway video and return its frame count
+    Each aisle has its own rack layout and lighting; a forklift crosses the aisle, a
+    pallet is dropped halfway through, and the camera drifts slightly with sensor noise.
+    """
+    rng = np.random.default_rng(seed)
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+    if not writer.isOpened():
+        raise RuntimeError(f"Could not open video writer for {path}")
+
+    frame_count = int(duration * fps)
+    aisle_frames = int(AISLE_DURATION * fps)
+    background = None
+    # A few precomputed noise fields, cycled, keep generation fast for long videos
+    noise = [(rng.integers(0, 7, (height, width, 3), dtype=np.uint8), rng.integers(0, 7, (height, width, 3), dtype=np.uint8))
+             for _ in range(NOISE_FIELDS)]
+    try:
+        for index in range(frame_count):
+            if index % aisle_frames == 0:
+                background = _draw_aisle(rng, width, height)
+                pallet_at = rng.uniform(0.2, 0.8) * width
+                forklift_speed = rng.uniform(0.3, 0.8) * width / aisle_frames
+
+            local = index % aisle_frames
+            frame = background.copy()
+
+            # Forklift crossing the aisle
+            x = int((local * forklift_speed) % (width + 200)) - 200
+            y = int(height * 0.55)
+            cv2.rectangle(frame, (x, y), (x + 180, y + 120), (0, 170, 230), -1)
+            cv2.rectangle(frame, (x + 120, y - 60), (x + 175, y), (40, 40, 40), 3)
+
+            # Pallet left on the walkway for the second half of the aisle
+            if local > aisle_frames // 2:
+                px = int(pallet_at)
+                cv2.rectangle(frame, (px, int(height * 0.8)), (px + 140, int(height * 0.92)), (60, 110, 150), -1)
+
+            # Camera drift and sensor noise
+            shift = np.float32([[1, 0, rng.integers(-2, 3)], [0, 1, rng.integers(-2, 3)]])
+            frame = cv2.warpAffine(frame, shift, (width, height), borderMode=cv2.BORDER_REFLECT)
+            brighten, darken = noise[index % NOISE_FIELDS]
+            writer.write(cv2.subtract(cv2.add(frame, brighten), darken))
+    finally:
+        writer.release()
+    return frame_count
+
+def _draw_aisle(rng, width, height):
+    """
+    Background for one aisle: floor, racks of boxes on both sides and yellow floor markings
+    """
+    brightness = int(rng.integers(90, 170))
+    frame = np.full((height, width, 3), brightness, dtype=np.uint8)
+    frame[int(height * 0.5):] = (brightness * 0.6, brightness * 0.6, brightness * 0.55)
+
+    for side in (0, 1):
+        x0 = 0 if side == 0 else int(width * 0.7)
+        x1 = int(width * 0.3) if side == 0 else width
+        for shelf in range(4):
+            y = int(height * (0.08 + shelf * 0.11))
+            cv2.rectangle(frame, (x0, y + int(height * 0.09)), (x1, y + int(height * 0.1)), (30, 60, 160), -1)
+            x = x0
+            while x < x1 - 20:
+                box_width = int(rng.integers(30, 90))
+                color = tuple(int(c) for c in rng.integers(40, 220, 3))
+                cv2.rectangle(frame, (x, y + int(rng.integers(0, 20))), (min(x + box_width, x1), y + int(height * 0.09)), color, -1)
+                x += box_width + int(rng.integers(2, 12))
+
+    for offset in (0.35, 0.65):
+        cv2.line(frame, (int(width * offset), height // 2), (int(width * (offset - 0.5) * 2 + width / 2), height), (0, 220, 240), 6)
+    return frame
+
+class SyntheticBoxes:
+    """
+    Stand-in for an ultralytics Boxes object: xyxy, conf and cls arrays with a length
+    """
+
+    def __init__(self, xyxy, conf, cls):
+        self.xyxy = xyxy
+        self.conf = conf
+        self.cls = cls
+
+    def __len__(self):
+        return len(self.conf)
+
+def generate_yolo_results(rng, num_frames, boxes_per_model=100, width=640, height=480):
+    """
+    Synthetic per-frame model output shaped like ultralytics results (boxes, orig_shape)
+    """
+    results = []
+    for _ in range(num_frames):
+        w = rng.uniform(0.02, 0.3, boxes_per_model) * width
+        h = rng.uniform(0.02, 0.3, boxes_per_model) * height
+        x = rng.uniform(0, 1, boxes_per_model) * (width - w)
+        y = rng.uniform(0, 1, boxes_per_model) * (height - h)
+        boxes = SyntheticBoxes(
+            np.stack([x, y, x + w, y + h], axis=1),
+            rng.uniform(0.05, 0.95, boxes_per_model),
+            rng.integers(0, len(SYNTHETIC_CLASSES), boxes_per_model)
+        )
+        results.append(SimpleNamespace(boxes=boxes, orig_shape=(height, width)))
+    return results
+
+def peak_rss_mb():
+    """
+    Peak resident set size of this process and its finished children, in MiB
+    """
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024  # ru_maxrss is bytes on macOS, KiB on Linux
+    return round(max(own, children) / scale, 1)
+
+def git_commit():
+    """
+    Short hash of the checked-out commit, or None outside a git checkout
+    """
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def timed(func, repeat=1):
+    """
+    Best-of-repeat wall time of func(); returns (seconds, last result)
+    """
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def run_benchmark(duration=60, width=1280, height=720, fps=15, workers=1, repeat=1, seed=0,
+                  mock_latency=0.5, yolo_frames=50, work_dir=None):
+    """
+    Run every pipeline stage on one synthetic video and summarise the timings
+    """
+    work_dir = work_dir or tempfile.mkdtemp(prefix="pipeline_bench_")
+    os.makedirs(work_dir, exist_ok=True)
+    video_path = os.path.join(work_dir, "synthetic_warehouse.mp4")
+    frames_dir = os.path.join(work_dir, "frames")
+    stages = {}
+
+    generate_start = time.perf_counter()
+    total_frames = generate_warehouse_video(video_path, duration, width, height, fps, seed)
+    print(f"Generated {total_frames} frames in {time.perf_counter() - generate_start:.1f}s", file=sys.stderr)
+
+    # Extraction
+    def extract():
+        shutil.rmtree(frames_dir, ignore_errors=True)
+        os.makedirs(frames_dir)
+        return extract_frames_with_opencv(video_path, frames_dir, workers=workers, include_base64=False)
+    seconds, extraction = timed(extract, repeat)
+    if not extraction.get("success"):
+        raise RuntimeError(f"Extraction failed: {extraction.get('error')}")
+    stages["extract"] = {
+        "seconds": round(seconds, 3),
+        "video_frames_per_second": round(total_frames / seconds, 1),
+        "frames_extracted": extraction["total_frames_extracted"],
+        "frames_decoded": extraction["video_info"]["frames_decoded"],
+        "timings": extraction.get("timings"),
+        "peak_rss_mb": peak_rss_mb()
+    }
+
+    # Similarity filtering over the extracted frames
+    frame_files = sorted(f for f in os.listdir(frames_dir) if f.startswith("frame_") and f.endswith(".jpg"))
+    for name, filter_func in (("filter_recent", filter_unique_frames), ("filter_hash", filter_unique_frames_by_hash)):
+        seconds, kept = timed(lambda: filter_func(frame_files, frames_dir, similarity_threshold=0.88, feature_cache=FrameFeatureCache()), repeat)
+        stages[name] = {
+            "seconds": round(seconds, 3),
+            "frames_per_second": round(len(frame_files) / seconds, 1) if seconds > 0 else None,
+            "frames_in": len(frame_files),
+            "frames_kept": len(kept),
+            "peak_rss_mb": peak_rss_mb()
+        }
+
+    # YOLO post-processing: tensor conversion, filtering and cross-model duplicate removal
+    rng = np.random.default_rng(seed)
+    model_results = [generate_yolo_results(rng, yolo_frames) for _ in range(3)]
+    class_names = dict(enumerate(SYNTHETIC_CLASSES))
+
+    def postprocess():
+        kept = 0
+        for frame_index in range(yolo_frames):
+            detections = []
+            for model_name, results in zip(("nano", "small", "medium"), model_results):
+                detections.extend(_detections_from_yolo_result(results[frame_index], class_names, model_name))
+            kept += len(remove_duplicate_detections(detections))
+        return kept
+    seconds, kept = timed(postprocess, repeat)
+    stages["yolo_postprocess"] = {
+        "seconds": round(seconds, 3),
+        "frames_per_second": round(yolo_frames / seconds, 1) if seconds > 0 else None,
+        "frames": yolo_frames,
+        "detections_kept": kept,
+        "peak_rss_mb": peak_rss_mb()
+    }
+
+    # Analysis against the mock OpenRouter server: batching, requests and merge
+    server = start_mock_server(latency=mock_latency)
+    original_url = analyze_frames_openrouter.OPENROUTER_API_URL
+    analyze_frames_openrouter.OPENROUTER_API_URL = server.url
+    try:
+        seconds, analysis = timed(lambda: analyze_frames_with_openrouter(frames_dir, "benchmark-key", "benchmark", use_llm_cache=False), repeat)
+    finally:
+        analyze_frames_openrouter.OPENROUTER_API_URL = original_url
+        server.shutdown()
+    if not analysis.get("success"):
+        raise RuntimeError(f"Analysis failed: {analysis.get('error')}")
+    stages["analyze"] = {
+        "seconds": round(seconds, 3),
+        "frames_analyzed": analysis["frames_analyzed"],
+        "mock_latency": mock_latency,
+        "mock_requests": server.request_count,
+        "pipeline_timings": analysis.get("pipeline_timings"),
+        "timings": analysis.get("timings"),
+        "peak_rss_mb": peak_rss_mb()
+    }
+
+    return {
+        "benchmark": "pipeline",
+        "commit": git_commit(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "environment": {
+            "python": platform.python_version(),
+            "opencv": cv2.__version__,
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count()
+        },
+        "config": {
+            "duration": duration,
+            "width": width,
+            "height": height,
+            "fps": fps,
+            "workers": workers,
+            "repeat": repeat,
+            "seed": seed,
+            "mock_latency": mock_latency,
+            "yolo_frames": yolo_frames
+        },
+        "video_frames": total_frames,
+        "stages": stages,
+        "total_seconds": round(sum(stage["seconds"] for stage in stages.values()), 3),
+        "peak_rss_mb": peak_rss_mb()
+    }
+
+def compare_results(current, baseline):
+    """
+    Per-stage time change relative to a baseline result (positive change_pct is slower)
+    """
+    comparison = {}
+    for name, stage in current["stages"].items():
+        previous = baseline.get("stages", {}).get(name)
+        if not previous or not previous.get("seconds"):
+            continue
+        comparison[name] = {
+            "seconds": stage["seconds"],
+            "baseline_seconds": previous["seconds"],
+            "change_pct": round((stage["seconds"] - previous["seconds"]) / previous["seconds"] * 100, 1)
+        }
+    comparison["baseline_commit"] = baseline.get("commit")
+    return comparison
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the extraction and analysis pipeline on a synthetic video")
+    parser.add_argument("--duration", type=float, default=60, help="Synthetic video length in seconds")
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--fps", type=int, default=15)
+    parser.add_argument("--workers", type=int, default=1, help="Extractor worker processes")
+    parser.add_argument("--repeat", type=int, default=1, help="Timing repetitions per stage (best is reported)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mock-latency", type=float, default=0.5, help="Seconds the mock OpenRouter server waits per request")
+    parser.add_argument("--yolo-frames", type=int, default=50, help="Frames of synthetic YOLO output to post-process")
+    parser.add_argument("--work-dir", default=None, help="Directory for the video and frames (default: a new temp dir)")
+    parser.add_argument("--output", default=None, help="Also write the JSON result to this file")
+    parser.add_argument("--compare", default=None, help="Earlier result JSON to report per-stage changes against")
+    args = parser.parse_args()
+
+    result = run_benchmark(args.duration, args.width, args.height, args.fps, args.workers, args.repeat, args.seed,
+                           args.mock_latency, args.yolo_frames, args.work_dir)
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            result["comparison"] = compare_results(result, json.load(f))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+    print(json.dumps(result, indent=2))
@@ -0,0 +1,119 @@
+"""
+Capability probing and lazy imports for slow-to-import optional dependencies
+probe() answers "is this package installed?" from the import system's metadata without
+importing it, load_module() imports on first use (optionally with stdout sent to stderr,
+for packages that print while importing) and lazy_module() returns a proxy that does so on
+first attribute access. Import times and failures are recorded so the scripts can report
+what their cold start actually paid for.
+"""
+
+import os
+import sys
+import time
+import threading
+import importlib
+import importlib.util
+
+_import_times = {}
+_import_errors = {}
+_import_lock = threading.RLock()
+
+def probe(name):
+    """
+    True if module name can be imported, checked without importing it; False once an
+    import of it has failed
+    """
+    if name in _import_errors:
+        return False
+    if name in sys.modules:
+        return True
+    try:
+        return importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
+        return False
+
+def load_module(name, quiet=False):
+    """
+    Import module name once, recording how long it took
+    quiet sends stdout to stderr during the import so nothing corrupts the JSON output.
+    Raises ImportError (also for later calls) if the import fails.
+    """
+    with _import_lock:
+        if name in _import_errors:
+            raise ImportError(_import_errors[name])
+        module = sys.modules.get(name)
+        if module is not None:
+            return module
+
+        start = time.perf_counter()
+        stdout = sys.stdout
+        if quiet:
+            sys.stdout = sys.stderr
+        try:
+            module = importlib.import_module(name)
+        except Exception as e:
+            _import_errors[name] = f"{type(e).__name__}: {e}"
+            raise ImportError(_import_errors[name]) from e
+        finally:
+            sys.stdout = stdout
+
+        _import_times[name] = time.perf_counter() - start
+        print(f"Imported {name} on first use in {_import_times[name]:.2f}s", file=sys.stderr)
+        return module
+
+class LazyModule:
+    """
+    Module proxy that imports the real module on first attribute access
+    """
+
+    def __init__(self, name, quiet=False):
+        self._name = name
+        self._quiet = quiet
+        self._module = None
+
+    def __getattr__(self, attribute):
+        module = self._module
+        if module is None:
+            module = self._module = load_module(self._name, self._quiet)
+        return getattr(module, attribute)
+
+def lazy_module(name, quiet=False):
+    """
+    Stand-in for "import name" that defers the import until the module is used
+    """
+    return LazyModule(name, quiet)
+
+def process_age():
+    """
+    Seconds since this process started (Linux /proc), or None where unavailable
+    """
+    try:
+        with open("/proc/self/stat", "r") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open("/proc/uptime", "r") as f:
+            uptime = float(f.read().split()[0])
+        # Field 22 (starttime) counted from the state field, which is field 3
+        return max(0.0, uptime - int(fields[19]) / os.sysconf("SC_CLK_TCK"))
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+def startup_report(module_start):
+    """
+    Cold-start timings at the point the script is ready to work: process age and time
+    spent importing the script module (from module_start, a perf_counter value)
+    """
+    age = process_age()
+    return {
+        "process_start_to_ready_seconds": round(age, 3) if age is not None else None,
+        "module_import_seconds": round(time.perf_counter() - module_start, 3)
+    }
+
+def import_report():
+    """
+    Lazy imports paid for so far and the ones that failed
+    """
+    with _import_lock:
+        return {
+            "lazy_imports": {name: round(seconds, 3) for name, seconds in _import_times.items()},
+            "import_errors": dict(_import_errors)
+        }
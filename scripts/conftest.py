@@ -0,0 +1,74 @@
+"""
+Shared pytest fixtures for the pipeline tests: a local mock OpenRouter endpoint wired into
+the analysis module, small in-memory frames to send to it and a capture of the NDJSON
+events the analysis emits
+"""
+
+import base64
+
+import cv2
+import numpy as np
+import pytest
+
+import analyze_frames_openrouter as analyzer
+import pipeline_events
+from mock_openrouter_server import start_mock_server
+from request_resilience import RetryPolicy, TokenBucket, CircuitBreaker, RequestStats
+
+@pytest.fixture
+def mock_openrouter(monkeypatch):
+    """
+    Factory that starts a mock server (start_mock_server arguments) and points the analysis
+    module at it
+    The module gets fresh resilience objects for the test: short retry delays, no rate limit
+    and a breaker that only opens after a long failure run; tests can override them.
+    """
+    servers = []
+
+    def start(**options):
+        server = start_mock_server(**options)
+        servers.append(server)
+        monkeypatch.setattr(analyzer, "OPENROUTER_API_URL", server.url)
+        return server
+
+    monkeypatch.setattr(analyzer, "_retry_policy", RetryPolicy(max_attempts=4, base_delay=0.01, max_delay=0.5))
+    monkeypatch.setattr(analyzer, "_rate_limiter", TokenBucket(0))
+    monkeypatch.setattr(analyzer, "_circuit_breaker", CircuitBreaker(failure_threshold=100, reset_timeout=0.05))
+    monkeypatch.setattr(analyzer, "_request_stats", RequestStats())
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+@pytest.fixture
+def frames_data():
+    """
+    24 small distinct frames in the form analyze_frames_with_openrouter loads them
+    """
+    frames = []
+    for index in range(24):
+        color = (index * 37 % 256, index * 91 % 256, index * 53 % 256)
+        success, jpeg = cv2.imencode(".jpg", np.full((48, 64, 3), color, dtype=np.uint8))
+        assert success
+        frames.append({
+            "filename": f"frame_{index}_00m{index:02d}s.jpg",
+            "timestamp": f"00m{index:02d}s",
+            "image_base64": base64.b64encode(jpeg.tobytes()).decode("utf-8"),
+            "original_index": index,
+            "width": 64,
+            "height": 48,
+            "image_detail": "auto"
+        })
+    return frames
+
+@pytest.fixture
+def pipeline_event_log():
+    """
+    List that receives every event emitted while the test runs
+    """
+    events = []
+    pipeline_events.enable_event_stream(True)
+    pipeline_events.set_event_sink(events.append)
+    yield events
+    pipeline_events.set_event_sink(None)
+    pipeline_events.enable_event_stream(False)
@@ -4,16 +4,113 @@ import json
 import sys
 import os
 import tempfile
+import time
+import heapq
+import argparse
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 from pathlib import Path
+from pipeline_events import emit_event, emit_result, enable_event_stream
+from frame_features import compute_frame_features, ssim_from_features, histogram_similarity, template_similarity
+from stage_timing import StageTimer, profile_run
+from capabilities import probe
 
-# Try to import scikit-image, fallback to basic similarity if not available
-try:
-    from skimage.metrics import structural_similarity as ssim
-    HAS_SCIKIT_IMAGE = True
-except ImportError:
+# SSIM is computed from cached frame features; it is only used when scikit-image, whose
+# implementation it matches, is installed. Probed without importing it.
+HAS_SCIKIT_IMAGE = probe("skimage")
+if not HAS_SCIKIT_IMAGE:
     print("Warning: scikit-image not available, using basic similarity detection", file=sys.stderr)
-    HAS_SCIKIT_IMAGE = False
+
+# Stage durations and counters for the result's "timings" block
+_stage_timer = StageTimer()
+
+# Working sizes for the motion check and the similarity checks (width, height)
+MOTION_SIZE = (320, 240)
+SIMILARITY_SIZE = (160, 120)
+
+def build_frame_pyramid(frame):
+    """
+    Preprocess a frame once for the motion and similarity checks
+    Holds the grayscale frame, the 320x240 level (raw and blurred for motion diffing) and
+    the 160x120 similarity features (histogram and SSIM statistics), so a reference frame
+    is prepared only when it is saved rather than on every comparison
+    """
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if len(frame.shape) == 3 else frame
+    
+    # Resize for faster processing, then blur to reduce noise
+    downscaled = cv2.resize(gray, MOTION_SIZE)
+    motion = cv2.GaussianBlur(downscaled, (21, 21), 0)
+    
+    return {
+        "gray": gray,
+        "downscaled": downscaled,
+        "motion": motion,
+        "similarity": compute_frame_features(cv2.resize(gray, SIMILARITY_SIZE))
+    }
+
+def motion_score(pyramid1, pyramid2):
+    """
+    Total area of significant motion between two preprocessed frames
+    """
+    # Calculate absolute difference
+    frame_diff = cv2.absdiff(pyramid1["motion"], pyramid2["motion"])
+    
+    # Threshold the difference
+    _, thresh = cv2.threshold(frame_diff, 25, 255, cv2.THRESH_BINARY)
+    
+    # Find contours
+    contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    
+    # Calculate total motion area
+    return sum(cv2.contourArea(contour) for contour in contours if cv2.contourArea(contour) > 50)
+
+# Motion engines: "diff" compares with the last saved frame; "mog2" and "knn" score each
+# sample against an OpenCV background model learned over the sampled stream
+MOTION_ENGINES = ("diff", "mog2", "knn")
+BACKGROUND_HISTORY = 30  # Samples the background model remembers
+BACKGROUND_WARMUP = 5  # Samples scored with "diff" while the model settles
+
+class BackgroundMotionEngine:
+    """
+    Background-subtraction motion scoring at 320x240
+    Each sample updates the model; the score is the foreground area (shadows and
+    speckle removed) in 320x240 pixels, the same units as the contour-area diff score.
+    Gradual lighting drift and small camera shake are absorbed into the background.
+    """
+
+    def __init__(self, kind="mog2", history=BACKGROUND_HISTORY, warmup=BACKGROUND_WARMUP):
+        if kind == "mog2":
+            self.subtractor = cv2.createBackgroundSubtractorMOG2(history=history, detectShadows=True)
+        elif kind == "knn":
+            self.subtractor = cv2.createBackgroundSubtractorKNN(history=history, detectShadows=True)
+        else:
+            raise ValueError(f"Unknown background motion engine: {kind}")
+        self.kind = kind
+        self.warmup = warmup
+        self.samples = 0
+        self._kernel = np.ones((3, 3), np.uint8)
+
+    def score(self, pyramid):
+        """
+        Update the model with a sample and return its foreground area, or None during warm-up
+        """
+        mask = self.subtractor.apply(cv2.GaussianBlur(pyramid["downscaled"], (5, 5), 0))
+        self.samples += 1
+        if self.samples <= self.warmup:
+            return None
+        
+        # Shadows are marked 127; keep confident foreground only, then drop speckle
+        _, mask = cv2.threshold(mask, 200, 255, cv2.THRESH_BINARY)
+        mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, self._kernel)
+        return float(cv2.countNonZero(mask))
+
+def create_motion_engine(motion_engine):
+    """
+    Background engine for "mog2"/"knn", or None for the default frame diff
+    """
+    if motion_engine == "diff":
+        return None
+    return BackgroundMotionEngine(motion_engine)
 
 def detect_motion(frame1, frame2, threshold=1000):
     """
@@ -24,31 +121,7 @@ def detect_motion(frame1, frame2, threshold=1000):
         if frame1 is None or frame2 is None:
             return 0
         
-        # Convert to grayscale
-        gray1 = cv2.cvtColor(frame1, cv2.COLOR_BGR2GRAY) if len(frame1.shape) == 3 else frame1
-        gray2 = cv2.cvtColor(frame2, cv2.COLOR_BGR2GRAY) if len(frame2.shape) == 3 else frame2
-        
-        # Resize for faster processing
-        gray1 = cv2.resize(gray1, (320, 240))
-        gray2 = cv2.resize(gray2, (320, 240))
-        
-        # Apply Gaussian blur to reduce noise
-        gray1 = cv2.GaussianBlur(gray1, (21, 21), 0)
-        gray2 = cv2.GaussianBlur(gray2, (21, 21), 0)
-        
-        # Calculate absolute difference
-        frame_diff = cv2.absdiff(gray1, gray2)
-        
-        # Threshold the difference
-        _, thresh = cv2.threshold(frame_diff, 25, 255, cv2.THRESH_BINARY)
-        
-        # Find contours
-        contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        
-        # Calculate total motion area
-        motion_area = sum(cv2.contourArea(contour) for contour in contours if cv2.contourArea(contour) > 50)
-        
-        return motion_area
+        return motion_score(build_frame_pyramid(frame1), build_frame_pyramid(frame2))
         
     except Exception as e:
         print(f"Motion detection error: {e}", file=sys.stderr)
@@ -63,12 +136,12 @@ def is_frame_quality_acceptable(frame, brightness_threshold=30, blur_threshold=5
         gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if len(frame.shape) == 3 else frame
         
         # Check brightness (avoid very dark frames)
-        mean_brightness = np.mean(gray)
+        mean_brightness = cv2.mean(gray)[0]
         if mean_brightness < brightness_threshold:
             return False
         
-        # Check blur (using Laplacian variance)
-        blur_score = cv2.Laplacian(gray, cv2.CV_64F).var()
+        # Check blur (using Laplacian variance; meanStdDev avoids NumPy's temporaries)
+        blur_score = cv2.meanStdDev(cv2.Laplacian(gray, cv2.CV_64F))[1][0, 0] ** 2
         if blur_score < blur_threshold:
             return False
         
@@ -78,6 +151,31 @@ def is_frame_quality_acceptable(frame, brightness_threshold=30, blur_threshold=5
         print(f"Quality check error: {e}", file=sys.stderr)
         return True  # Default to accepting frame if check fails
 
+def pyramid_similarity(pyramid1, pyramid2, threshold=0.85):
+    """
+    Similarity check between two preprocessed frames
+    Returns True if the best of SSIM (when scikit-image is available), histogram
+    correlation and template matching is above threshold
+    """
+    features1, features2 = pyramid1["similarity"], pyramid2["similarity"]
+    similarity_scores = []
+    
+    if HAS_SCIKIT_IMAGE:
+        # Structural similarity from the cached statistics (same value as skimage's ssim)
+        similarity_scores.append(ssim_from_features(features1, features2))
+    
+    # Use histogram comparison
+    similarity_scores.append(histogram_similarity(features1, features2))
+    
+    # Use template matching
+    try:
+        similarity_scores.append(template_similarity(features1, features2))
+    except cv2.error:
+        pass
+    
+    # Use the maximum similarity score
+    return max(similarity_scores) > threshold
+
 def calculate_frame_similarity(frame1, frame2, threshold=0.85):
     """
     Enhanced similarity calculation with motion awareness
@@ -87,51 +185,520 @@ def calculate_frame_similarity(frame1, frame2, threshold=0.85):
         if frame1 is None or frame2 is None:
             return False
         
-        # Convert to grayscale for comparison
-        gray1 = cv2.cvtColor(frame1, cv2.COLOR_BGR2GRAY) if len(frame1.shape) == 3 else frame1
-        gray2 = cv2.cvtColor(frame2, cv2.COLOR_BGR2GRAY) if len(frame2.shape) == 3 else frame2
+        return pyramid_similarity(build_frame_pyramid(frame1), build_frame_pyramid(frame2), threshold)
         
-        # Resize to standard size for faster comparison
-        target_size = (160, 120)
-        gray1_resized = cv2.resize(gray1, target_size)
-        gray2_resized = cv2.resize(gray2, target_size)
+    except Exception as e:
+        print(f"Error calculating frame similarity: {e}", file=sys.stderr)
+        return False
+
+def set_reference_frame(state, frame, pyramid=None):
+    """
+    Make frame the reference for later comparisons, keeping its preprocessed pyramid
+    """
+    state["last_saved_frame"] = frame
+    state["reference_pyramid"] = None if frame is None else (pyramid or build_frame_pyramid(frame))
+
+# Sampling strides (in frames) above this use seeking instead of decoding forward;
+# roughly the point where skipping frames costs more than a keyframe seek + re-decode
+SEEK_STRIDE_THRESHOLD = 250
+
+# Sample times are converted back to frame indexes; the epsilon absorbs the float error
+# in time * fps, so a time computed as position / fps maps back to position and not to
+# the frame before it
+FRAME_TIME_EPSILON = 1e-6
+
+def frame_number_at(current_time, fps):
+    """
+    Index of the frame shown at current_time
+    """
+    return int(current_time * fps + FRAME_TIME_EPSILON)
+
+def iter_sample_times(duration, frame_interval):
+    """
+    Yield sample times (seconds) every frame_interval seconds up to the video duration
+    """
+    current_time = 0
+    while current_time < duration:
+        yield current_time
+        current_time += frame_interval
+
+# Adaptive sampling: probe spacing for the scene-change scan, limits on the gap between
+# planned samples, and the cumulative change that triggers a sample when there is no budget
+PROBE_INTERVAL = 0.2
+ADAPTIVE_MIN_INTERVAL = 0.2
+ADAPTIVE_MAX_INTERVAL = 10.0
+ADAPTIVE_CHANGE_THRESHOLD = 0.15
+PROBE_SIZE = (64, 48)
+# Memory for full-resolution probe frames kept during the scan, so planned samples do not
+# have to be decoded a second time. Only the highest-change probes are kept, as those are
+# where the plan places its samples; planned samples that were not kept are decoded again.
+# About ten 1080p frames.
+PROBE_FRAME_CACHE_BYTES = 64 * 1024 * 1024
+
+def probe_signature(frame):
+    """
+    Cheap low-resolution signature of a frame: 64x48 gray thumbnail and 32-bin histogram
+    """
+    gray = cv2.cvtColor(cv2.resize(frame, PROBE_SIZE, interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+    hist = cv2.calcHist([gray], [0], None, [32], [0, 256])
+    cv2.normalize(hist, hist)
+    return gray, hist
+
+def signature_change(signature1, signature2):
+    """
+    Change between two probe signatures in [0, 1]: the larger of the histogram
+    Bhattacharyya distance and the mean absolute thumbnail difference
+    """
+    hist_delta = cv2.compareHist(signature1[1], signature2[1], cv2.HISTCMP_BHATTACHARYYA)
+    pixel_delta = cv2.mean(cv2.absdiff(signature1[0], signature2[0]))[0] / 255
+    return float(min(1.0, max(hist_delta, pixel_delta)))
+
+def _keep_probe_frame(probe_frames, kept, kept_bytes, max_bytes, position, frame, priority):
+    """
+    Add a probe frame to probe_frames, evicting lower-priority frames to stay within
+    max_bytes; the frame itself is dropped if everything kept outranks it
+    Returns the bytes held afterwards
+    """
+    while kept and kept_bytes + frame.nbytes > max_bytes and kept[0][0] < priority:
+        _, evicted = heapq.heappop(kept)
+        kept_bytes -= probe_frames.pop(evicted).nbytes
+    if kept_bytes + frame.nbytes > max_bytes:
+        return kept_bytes
+    probe_frames[position] = frame
+    heapq.heappush(kept, (priority, position))
+    return kept_bytes + frame.nbytes
+
+def scan_scene_changes(cap, fps, probe_interval=PROBE_INTERVAL, scan_stats=None, probe_frames=None,
+                       probe_frame_bytes=PROBE_FRAME_CACHE_BYTES):
+    """
+    Decode the video once, retrieving a low-resolution probe every probe_interval seconds
+    Returns (probe_times, changes) where changes[i] is the change from probe i-1 to i
+    (0 for the first probe)
+    With a probe_frames dict, full-resolution probe frames are kept in it by frame index,
+    within probe_frame_bytes: the first probe, which every plan samples, and then the
+    probes with the largest change, evicting the smallest-change frame when full
+    """
+    stride = max(1, round(fps * probe_interval))
+    probe_times = []
+    changes = []
+    previous = None
+    position = 0
+    kept_bytes = 0
+    kept = []  # Heap of (change, frame index) for the frames in probe_frames
+    scan_start = time.perf_counter()
+    
+    cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+    while cap.grab():
+        if position % stride == 0:
+            ret, frame = cap.retrieve()
+            if ret:
+                signature = probe_signature(frame)
+                probe_times.append(position / fps)
+                changes.append(0.0 if previous is None else signature_change(previous, signature))
+                previous = signature
+                if probe_frames is not None:
+                    priority = changes[-1] if len(changes) > 1 else float("inf")
+                    kept_bytes = _keep_probe_frame(probe_frames, kept, kept_bytes, probe_frame_bytes, position, frame, priority)
+        position += 1
+    
+    if scan_stats is not None:
+        scan_stats["frames_scanned"] = position
+        scan_stats["probes"] = len(probe_times)
+        scan_stats["scan_time"] = time.perf_counter() - scan_start
+        if probe_frames is not None:
+            scan_stats["probe_frames_kept"] = len(probe_frames)
+    return probe_times, changes
+
+def _place_samples(probe_times, cumulative, threshold, min_interval, max_interval):
+    samples = [0]
+    for i in range(1, len(probe_times)):
+        gap = probe_times[i] - probe_times[samples[-1]]
+        if gap < min_interval:
+            continue
+        if cumulative[i] - cumulative[samples[-1]] >= threshold or gap >= max_interval:
+            samples.append(i)
+    return samples
+
+def plan_adaptive_samples(probe_times, changes, frame_budget=None, min_interval=ADAPTIVE_MIN_INTERVAL,
+                          max_interval=ADAPTIVE_MAX_INTERVAL, change_threshold=ADAPTIVE_CHANGE_THRESHOLD):
+    """
+    Choose sample times from the scene-change scan
+    A sample is placed once the change accumulated since the previous sample reaches the
+    threshold, so scene changes are sampled densely and static stretches sparsely (at
+    least every max_interval seconds). With frame_budget, the threshold is searched so
+    the plan has as many samples as possible without exceeding the budget.
+    """
+    if not probe_times:
+        return []
+    
+    # Only change above the video's typical probe-to-probe change (sensor noise, camera
+    # shake, lighting drift) counts towards the next sample
+    changes = np.asarray(changes, dtype=np.float64)
+    cumulative = np.cumsum(np.maximum(0.0, changes - np.median(changes)))
+    if frame_budget:
+        frame_budget = max(1, frame_budget)
+        duration = probe_times[-1] - probe_times[0]
+        # Keep the forced static-stretch samples within budget on their own
+        max_interval = max(max_interval, duration / frame_budget * 1.01)
+        low, high = 0.0, float(cumulative[-1]) + 1e-9
+        best = _place_samples(probe_times, cumulative, high, min_interval, max_interval)
+        for _ in range(40):
+            middle = (low + high) / 2
+            samples = _place_samples(probe_times, cumulative, middle, min_interval, max_interval)
+            if len(samples) <= frame_budget:
+                best, high = samples, middle
+            else:
+                low = middle
+        samples = best[:frame_budget]
+    else:
+        samples = _place_samples(probe_times, cumulative, change_threshold, min_interval, max_interval)
+    
+    return [probe_times[i] for i in samples]
+
+def choose_decode_mode(fps, frame_interval, decode_mode="auto", seek_stride_threshold=SEEK_STRIDE_THRESHOLD):
+    """
+    Resolve "auto" to "sequential" (decode forward once) or "seek" (sparse sampling)
+    """
+    if decode_mode != "auto":
+        return decode_mode
+    
+    stride_frames = frame_interval * fps
+    return "seek" if stride_frames > seek_stride_threshold else "sequential"
+
+def read_sampled_frames(cap, fps, sample_times, decode_mode, decode_stats):
+    """
+    Yield (time, frame) for each sample time; frame is None if it could not be read
+    
+    "sequential" decodes forward once, using grab() to skip frames and retrieve() only on
+    sample points; "seek" sets the position before every sample. decode_stats is updated
+    with the number of frames decoded and the time spent decoding.
+    """
+    if decode_mode == "seek":
+        for current_time in sample_times:
+            decode_start = time.perf_counter()
+            
+            # Set video position to specific frame
+            cap.set(cv2.CAP_PROP_POS_FRAMES, frame_number_at(current_time, fps))
+            ret, frame = cap.read()
+            
+            _stage_timer.record("decode", time.perf_counter() - decode_start, decode_start)
+            decode_stats["decode_time"] += time.perf_counter() - decode_start
+            decode_stats["frames_decoded"] += 1
+            yield current_time, frame if ret else None
+        return
+    
+    sample_times = list(sample_times)
+    position = 0  # Index of the frame the next grab() returns
+    if sample_times and frame_number_at(sample_times[0], fps) > 0:
+        # Time range starting mid-video: seek once, then decode forward
+        position = frame_number_at(sample_times[0], fps)
+        cap.set(cv2.CAP_PROP_POS_FRAMES, position)
+    
+    last_index = -1
+    last_frame = None
+    exhausted = False
+    
+    for current_time in sample_times:
+        frame_number = frame_number_at(current_time, fps)
+        
+        # Sub-frame intervals can map several samples onto the same frame
+        if frame_number == last_index:
+            yield current_time, last_frame
+            continue
         
-        similarity_scores = []
+        frame = None
+        if not exhausted:
+            decode_start = time.perf_counter()
+            ret = True
+            while position <= frame_number:
+                ret = cap.grab()
+                if not ret:
+                    exhausted = True
+                    break
+                position += 1
+                decode_stats["frames_decoded"] += 1
+            
+            if ret:
+                ret, frame = cap.retrieve()
+                if not ret:
+                    frame = None
+            _stage_timer.record("decode", time.perf_counter() - decode_start, decode_start)
+            decode_stats["decode_time"] += time.perf_counter() - decode_start
         
-        if HAS_SCIKIT_IMAGE:
-            # Use SSIM for structural similarity
-            ssim_score = ssim(gray1_resized, gray2_resized)
-            similarity_scores.append(ssim_score)
+        last_index, last_frame = frame_number, frame
+        yield current_time, frame
+
+def read_planned_frames(cap, fps, sample_times, probe_frames, decode_mode, decode_stats):
+    """
+    Yield (time, frame) for adaptive sample times, taking frames kept by the scene-change
+    scan from probe_frames (keyed by frame index) and decoding only the samples it does not hold
+    """
+    missing_times = [current_time for current_time in sample_times if frame_number_at(current_time, fps) not in probe_frames]
+    decoded_frames = read_sampled_frames(cap, fps, missing_times, decode_mode, decode_stats)
+    for current_time in sample_times:
+        frame_number = frame_number_at(current_time, fps)
+        if frame_number in probe_frames:
+            decode_stats["probe_frames_reused"] += 1
+            yield current_time, probe_frames.pop(frame_number)
+        else:
+            yield next(decoded_frames)
+
+def select_sample(frame, current_time, state, similarity_threshold):
+    """
+    Run the quality, motion and similarity checks for one sampled frame
+    Returns (decision, resized_frame, pyramid) with decision one of "unreadable", "poor",
+    "skip" or "save"; state carries the last saved frame with its pyramid, the running
+    similar-frame skip count and the optional background motion engine. The pyramid holds
+    the sample's motion score (None when nothing was compared) and is passed to
+    set_reference_frame when the frame is saved so it is not preprocessed again.
+    """
+    if frame is None:
+        print(f"Could not read frame at {current_time:.1f}s", file=sys.stderr)
+        return "unreadable", None, None
+    
+    # Resize frame to standard size
+    frame = cv2.resize(frame, (640, 480))
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    
+    # Relaxed quality check - only skip extremely poor frames
+    with _stage_timer.stage("quality_check"):
+        acceptable = is_frame_quality_acceptable(gray, brightness_threshold=15, blur_threshold=25)
+    if not acceptable:
+        print(f"Extremely poor quality frame at {current_time:.1f}s - skipping", file=sys.stderr)
+        return "poor", frame, None
+    
+    with _stage_timer.stage("preprocess"):
+        pyramid = build_frame_pyramid(gray)
+    
+    # Background engines see every usable sample, saved or not
+    engine = state.get("motion_engine")
+    score = None
+    if engine is not None:
+        with _stage_timer.stage("motion"):
+            score = engine.score(pyramid)
+    
+    # Intensive analysis mode - more selective but comprehensive
+    should_save = True
+    last_saved_frame = state["last_saved_frame"]
+    if last_saved_frame is not None:
+        reference = state.get("reference_pyramid")
+        if reference is None:
+            reference = build_frame_pyramid(last_saved_frame)
+            state["reference_pyramid"] = reference
         
-        # Use histogram comparison
-        hist1 = cv2.calcHist([gray1_resized], [0], None, [256], [0, 256])
-        hist2 = cv2.calcHist([gray2_resized], [0], None, [256], [0, 256])
-        hist_score = cv2.compareHist(hist1, hist2, cv2.HISTCMP_CORREL)
-        similarity_scores.append(hist_score)
+        # Check motion with lower threshold for more sensitivity
+        if score is None:
+            with _stage_timer.stage("motion"):
+                score = motion_score(reference, pyramid)
+        motion_threshold = 800  # Lower threshold = more sensitive to motion
         
-        # Use template matching
-        try:
-            result = cv2.matchTemplate(gray1_resized, gray2_resized, cv2.TM_CCOEFF_NORMED)
-            _, max_val, _, _ = cv2.minMaxLoc(result)
-            similarity_scores.append(max_val)
-        except:
-            pass
+        if score > motion_threshold:
+            # Motion detected - always save
+            should_save = True
+            print(f"Motion detected ({score}), saving frame at {current_time:.1f}s", file=sys.stderr)
+        else:
+            # Check similarity with stricter threshold (save more frames)
+            with _stage_timer.stage("similarity"):
+                is_similar = pyramid_similarity(reference, pyramid, similarity_threshold + 0.05)
+            if is_similar:
+                # Even for similar frames, save every 3rd one for comprehensive coverage
+                if state["skipped_frames"] % 3 == 2:  # Save every 3rd similar frame
+                    should_save = True
+                    print(f"Periodic save of similar frame at {current_time:.1f}s for comprehensive analysis", file=sys.stderr)
+                else:
+                    should_save = False
+                    state["skipped_frames"] += 1
+                    print(f"Frame at {current_time:.1f}s is similar - skipping {state['skipped_frames']}/3", file=sys.stderr)
+            else:
+                # Different frame - definitely save
+                should_save = True
+    
+    pyramid["motion_score"] = score
+    return ("save" if should_save else "skip"), frame, pyramid
+
+def save_extracted_frame(frame, current_time, frame_count, output_dir, jpeg_bytes=None, include_base64=True):
+    """
+    Encode a selected frame to JPEG once, write that buffer to output_dir and build its
+    result entry (with the same buffer as base64 when include_base64 is set)
+    jpeg_bytes, when given, is an already encoded JPEG of the frame
+    Returns None if the frame could not be saved
+    """
+    # Create filename
+    minutes = int(current_time // 60)
+    seconds = int(current_time % 60)
+    timestamp = f"{minutes:02d}m{seconds:02d}s"
+    filename = f"frame_{frame_count}_{timestamp}.jpg"
+    filepath = os.path.join(output_dir, filename)
+    
+    if jpeg_bytes is None:
+        with _stage_timer.stage("encode"):
+            success, jpeg_bytes = cv2.imencode('.jpg', frame)
+        if not success:
+            return None
+    
+    # Save frame as image
+    write_start = time.perf_counter()
+    try:
+        with open(filepath, 'wb') as f:
+            f.write(jpeg_bytes)
+    except OSError:
+        return None
+    
+    frame_entry = {
+        "time": f"{minutes:02d}:{seconds:02d}",
+        "frame_number": frame_count,
+        "filename": filename,
+        "filepath": filepath,
+        "imageUrl": f"/temp/{filename}"
+    }
+    if include_base64:
+        frame_entry["image_base64"] = base64.b64encode(jpeg_bytes).decode('utf-8')
+    _stage_timer.record("write", time.perf_counter() - write_start, write_start)
+    
+    return frame_entry
+
+# Emit a progress event every this many samples in NDJSON mode
+PROGRESS_EVENT_INTERVAL = 10
+
+def emit_frame_event(frame_entry):
+    """
+    Stream a saved frame as an NDJSON event, referenced by file path rather than base64
+    """
+    emit_event("frame", frame={key: value for key, value in frame_entry.items() if key != "image_base64"})
+
+# Shortest time range worth handing to its own worker process
+MIN_CHUNK_DURATION = 30
+
+def split_sample_times(sample_times, chunk_count):
+    """
+    Split the sample timeline into chunk_count contiguous time ranges
+    """
+    chunk_count = max(1, min(chunk_count, len(sample_times)))
+    bounds = [round(i * len(sample_times) / chunk_count) for i in range(chunk_count + 1)]
+    return [sample_times[bounds[i]:bounds[i + 1]] for i in range(chunk_count)]
+
+def _run_selection_chain(cap, fps, sample_times, decode_mode, similarity_threshold, state, decode_stats, stop_when=None):
+    """
+    Decode and select frames over sample_times, encoding each saved frame to JPEG once
+    Returns one record per sample: time, decision, motion score, skip count after the sample
+    and, for saved frames, the JPEG bytes. stop_when(index, record) can end the run early.
+    """
+    records = []
+    sampled_frames = read_sampled_frames(cap, fps, sample_times, decode_mode, decode_stats)
+    for index, (current_time, frame) in enumerate(sampled_frames):
+        decision, frame, pyramid = select_sample(frame, current_time, state, similarity_threshold)
+        record = {"time": current_time, "decision": decision, "motion_score": pyramid["motion_score"] if pyramid else None}
         
-        # Use the maximum similarity score
-        if similarity_scores:
-            max_similarity = max(similarity_scores)
-            return max_similarity > threshold
+        if decision == "save":
+            with _stage_timer.stage("encode"):
+                success, buffer = cv2.imencode('.jpg', frame)
+            if success:
+                record["jpeg"] = buffer.tobytes()
+                set_reference_frame(state, frame, pyramid)
+            else:
+                record["decision"] = "failed"
+                print(f"Failed to encode frame at {current_time:.1f}s", file=sys.stderr)
         
-        return False
+        record["skipped_frames"] = state["skipped_frames"]
+        records.append(record)
         
-    except Exception as e:
-        print(f"Error calculating frame similarity: {e}", file=sys.stderr)
-        return False
+        if stop_when is not None and stop_when(index, record):
+            break
+    
+    return records
 
-def extract_frames_with_opencv(video_path, output_dir, frame_interval=1, similarity_threshold=0.70):
+def _extract_chunk(video_path, sample_times, fps, decode_mode, similarity_threshold):
+    """
+    Worker process entry point: run the selection chain over one time range with its own
+    VideoCapture, starting from an empty reference frame
+    """
+    # A forked worker inherits the parent's timer; record only this chunk
+    _stage_timer.reset()
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise Exception("Could not open video file")
+    
+    state = {"last_saved_frame": None, "skipped_frames": 0}
+    decode_stats = {"frames_decoded": 0, "decode_time": 0.0, "probe_frames_reused": 0}
+    try:
+        records = _run_selection_chain(cap, fps, sample_times, decode_mode, similarity_threshold, state, decode_stats)
+    finally:
+        cap.release()
+    
+    return {
+        "records": records,
+        "last_saved_frame": state["last_saved_frame"],
+        "decode_stats": decode_stats,
+        "timings": _stage_timer.export()
+    }
+
+def _merge_chunk_results(video_path, fps, chunk_times, chunk_results, decode_mode, similarity_threshold, decode_stats):
+    """
+    Merge per-chunk records in timestamp order into the result of a sequential run
+    
+    Every chunk after the first was processed without the previous chunk's reference frame,
+    so its start is replayed with the carried-over state until the replay saves the same
+    frame as the worker with the same skip count; from there the worker's decisions are
+    identical to a sequential run and are taken as-is.
+    Returns (records, state) where records are the per-sample records of the equivalent
+    sequential run
+    """
+    state = {"last_saved_frame": None, "skipped_frames": 0}
+    records = []
+    replay_cap = None
+    
+    try:
+        for chunk_index, (sample_times, chunk) in enumerate(zip(chunk_times, chunk_results)):
+            worker_records = chunk["records"]
+            for key in decode_stats:
+                decode_stats[key] += chunk["decode_stats"][key]
+            _stage_timer.merge(chunk["timings"])
+            
+            resume_index = 0
+            if chunk_index > 0:
+                print(f"Re-checking chunk boundary at {sample_times[0]:.1f}s", file=sys.stderr)
+                if replay_cap is None:
+                    replay_cap = cv2.VideoCapture(video_path)
+                
+                def converged(index, record):
+                    worker_record = worker_records[index]
+                    return (record["decision"] == "save" and worker_record["decision"] == "save"
+                            and record["skipped_frames"] == worker_record["skipped_frames"])
+                
+                replayed = _run_selection_chain(replay_cap, fps, sample_times, decode_mode, similarity_threshold,
+                                                state, decode_stats, stop_when=converged)
+                records.extend(replayed)
+                
+                resume_index = len(replayed)
+                if resume_index == len(worker_records) and not converged(resume_index - 1, replayed[-1]):
+                    # Whole chunk replayed without converging; replay state is authoritative
+                    continue
+            
+            records.extend(worker_records[resume_index:])
+            if worker_records:
+                state["skipped_frames"] = worker_records[-1]["skipped_frames"]
+            if chunk["last_saved_frame"] is not None:
+                set_reference_frame(state, chunk["last_saved_frame"])
+    finally:
+        if replay_cap is not None:
+            replay_cap.release()
+    
+    return records, state
+
+def extract_frames_with_opencv(video_path, output_dir, frame_interval=1, similarity_threshold=0.70, decode_mode="auto", workers=1, include_base64=True,
+                               motion_engine="diff", sampling="fixed", frame_budget=None):
     """
     Extract frames from video using OpenCV with real-time similarity checking
+    decode_mode is "sequential", "seek" or "auto" (sequential unless sampling is sparse)
+    workers > 1 splits long videos into time ranges decoded in parallel worker processes
+    include_base64=False leaves image_base64 out of the frame entries (files are still written)
+    motion_engine is "diff" (compare with the last saved frame) or "mog2"/"knn" (background
+    subtraction over the sampled stream; runs in a single process)
+    sampling "fixed" samples every frame_interval seconds; "adaptive" first scans low-res
+    probes for scene changes and samples densely where content changes, within frame_budget
+    candidate samples when given
     """
+    _stage_timer.reset()
     try:
         # Open video with OpenCV
         cap = cv2.VideoCapture(video_path)
@@ -148,102 +715,125 @@ def extract_frames_with_opencv(video_path, output_dir, frame_interval=1, similar
         print(f"Video info: {fps} FPS, {total_frames} total frames, {duration:.2f}s duration", file=sys.stderr)
         print(f"Similarity threshold: {similarity_threshold}", file=sys.stderr)
         
+        scan_stats = {}
+        probe_frames = None
+        if sampling == "adaptive":
+            # Scene-change scan, then only the planned candidates go through the checks. Planned
+            # samples are probe times, so the probe frames kept by the scan are reused for them.
+            probe_frames = {}
+            with _stage_timer.stage("scan"):
+                probe_times, changes = scan_scene_changes(cap, fps, scan_stats=scan_stats, probe_frames=probe_frames)
+            sample_times = plan_adaptive_samples(probe_times, changes, frame_budget)
+            planned = {frame_number_at(sample_time, fps) for sample_time in sample_times}
+            for frame_number in [frame_number for frame_number in probe_frames if frame_number not in planned]:
+                del probe_frames[frame_number]
+            average_interval = duration / len(sample_times) if sample_times else frame_interval
+            print(f"Adaptive sampling: {len(sample_times)} candidate samples from {scan_stats['probes']} probes "
+                  f"in {scan_stats['scan_time']:.2f}s, {len(probe_frames)} kept from the scan "
+                  f"(budget {frame_budget or 'none'})", file=sys.stderr)
+            cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            decode_mode = choose_decode_mode(fps, average_interval, decode_mode)
+        else:
+            # Extract frames every frame_interval seconds with similarity checking
+            sample_times = list(iter_sample_times(duration, frame_interval))
+            decode_mode = choose_decode_mode(fps, frame_interval, decode_mode)
+        print(f"Decode mode: {decode_mode}", file=sys.stderr)
+        
         extracted_frames = []
         frame_count = 0
-        last_saved_frame = None
-        skipped_frames = 0
+        decode_stats = {"frames_decoded": 0, "decode_time": 0.0, "probe_frames_reused": 0}
+        state = {"last_saved_frame": None, "skipped_frames": 0, "motion_engine": create_motion_engine(motion_engine)}
+        motion_scores = []
+        print(f"Motion engine: {motion_engine}", file=sys.stderr)
         
-        # Extract frames every frame_interval seconds with similarity checking
-        current_time = 0
-        while current_time < duration:
-            # Calculate frame number for this time
-            frame_number = int(current_time * fps)
-            
-            # Set video position to specific frame
-            cap.set(cv2.CAP_PROP_POS_FRAMES, frame_number)
-            
-            # Read frame
-            ret, frame = cap.read()
-            if not ret:
-                print(f"Could not read frame at {current_time:.1f}s", file=sys.stderr)
-                current_time += frame_interval
-                continue
-            
-            # Resize frame to standard size
-            frame = cv2.resize(frame, (640, 480))
+        chunk_count = min(max(1, workers), max(1, int(duration // MIN_CHUNK_DURATION)))
+        if chunk_count > 1 and state["motion_engine"] is not None:
+            # The background model depends on every earlier sample, so chunks cannot be
+            # processed independently
+            print(f"Motion engine {motion_engine} runs in one process; ignoring workers={workers}", file=sys.stderr)
+            chunk_count = 1
+        if chunk_count > 1 and probe_frames and len(probe_frames) == len(sample_times):
+            # Every sample was kept by the scan; parallel chunks would only decode them again
+            print(f"All {len(sample_times)} samples kept from the scan; ignoring workers={workers}", file=sys.stderr)
+            chunk_count = 1
+        
+        if chunk_count > 1:
+            cap.release()
+            probe_frames = None
+            chunk_times = split_sample_times(sample_times, chunk_count)
+            print(f"Extracting {len(sample_times)} samples in {len(chunk_times)} parallel chunks", file=sys.stderr)
             
-            # Relaxed quality check - only skip extremely poor frames
-            if not is_frame_quality_acceptable(frame, brightness_threshold=15, blur_threshold=25):
-                print(f"Extremely poor quality frame at {current_time:.1f}s - skipping", file=sys.stderr)
-                current_time += frame_interval
-                continue
+            with ProcessPoolExecutor(max_workers=len(chunk_times)) as executor:
+                futures = [
+                    executor.submit(_extract_chunk, video_path, times, fps, decode_mode, similarity_threshold)
+                    for times in chunk_times
+                ]
+                chunk_results = []
+                for future in futures:
+                    chunk_results.append(future.result())
+                    emit_event("progress", stage="extract", chunks_completed=len(chunk_results), chunks_total=len(futures))
             
-            # Intensive analysis mode - more selective but comprehensive
-            should_save = True
-            if last_saved_frame is not None:
-                # Check motion with lower threshold for more sensitivity
-                motion_score = detect_motion(last_saved_frame, frame)
-                motion_threshold = 800  # Lower threshold = more sensitive to motion
-                
-                if motion_score > motion_threshold:
-                    # Motion detected - always save
-                    should_save = True
-                    print(f"Motion detected ({motion_score}), saving frame at {current_time:.1f}s", file=sys.stderr)
+            records, state = _merge_chunk_results(video_path, fps, chunk_times, chunk_results, decode_mode,
+                                                  similarity_threshold, decode_stats)
+            motion_scores = [
+                {"time": record["time"], "score": record["motion_score"]}
+                for record in records if record["motion_score"] is not None
+            ]
+            for record in records:
+                _stage_timer.count(record["decision"])
+                if record["decision"] != "save":
+                    continue
+                current_time = record["time"]
+                frame_entry = save_extracted_frame(None, current_time, frame_count, output_dir,
+                                                   jpeg_bytes=record["jpeg"], include_base64=include_base64)
+                if frame_entry:
+                    frame_entry["motion_score"] = record["motion_score"]
+                    extracted_frames.append(frame_entry)
+                    emit_frame_event(frame_entry)
+                    print(f"Extracted unique frame {frame_count + 1}: {frame_entry['filename']} at {frame_entry['time']}", file=sys.stderr)
+                    frame_count += 1
                 else:
-                    # Check similarity with stricter threshold (save more frames)
-                    is_similar = calculate_frame_similarity(last_saved_frame, frame, similarity_threshold + 0.05)
-                    if is_similar:
-                        # Even for similar frames, save every 3rd one for comprehensive coverage
-                        if skipped_frames % 3 == 2:  # Save every 3rd similar frame
-                            should_save = True
-                            print(f"Periodic save of similar frame at {current_time:.1f}s for comprehensive analysis", file=sys.stderr)
-                        else:
-                            should_save = False
-                            skipped_frames += 1
-                            print(f"Frame at {current_time:.1f}s is similar - skipping {skipped_frames}/3", file=sys.stderr)
-                    else:
-                        # Different frame - definitely save
-                        should_save = True
-            
-            if should_save:
-                # Create filename
-                minutes = int(current_time // 60)
-                seconds = int(current_time % 60)
-                timestamp = f"{minutes:02d}m{seconds:02d}s"
-                filename = f"frame_{frame_count}_{timestamp}.jpg"
-                filepath = os.path.join(output_dir, filename)
+                    print(f"Failed to save frame at {current_time:.1f}s", file=sys.stderr)
+        else:
+            chunk_count = 1
+            if probe_frames is not None:
+                sampled_frames = read_planned_frames(cap, fps, sample_times, probe_frames, decode_mode, decode_stats)
+            else:
+                sampled_frames = read_sampled_frames(cap, fps, sample_times, decode_mode, decode_stats)
+            for sample_index, (current_time, frame) in enumerate(sampled_frames):
+                if sample_index % PROGRESS_EVENT_INTERVAL == 0:
+                    emit_event("progress", stage="extract", samples_processed=sample_index, samples_total=len(sample_times))
                 
-                # Save frame as image
-                success = cv2.imwrite(filepath, frame)
-                if success:
-                    # Convert to base64 for compatibility
-                    _, buffer = cv2.imencode('.jpg', frame)
-                    frame_base64 = base64.b64encode(buffer).decode('utf-8')
-                    
-                    extracted_frames.append({
-                        "time": f"{minutes:02d}:{seconds:02d}",
-                        "frame_number": frame_count,
-                        "filename": filename,
-                        "filepath": filepath,
-                        "image_base64": frame_base64,
-                        "imageUrl": f"/temp/{filename}"
-                    })
+                decision, frame, pyramid = select_sample(frame, current_time, state, similarity_threshold)
+                _stage_timer.count(decision)
+                if pyramid is not None and pyramid["motion_score"] is not None:
+                    motion_scores.append({"time": current_time, "score": pyramid["motion_score"]})
+                if decision != "save":
+                    continue
+                
+                frame_entry = save_extracted_frame(frame, current_time, frame_count, output_dir, include_base64=include_base64)
+                if frame_entry:
+                    frame_entry["motion_score"] = pyramid["motion_score"]
+                    extracted_frames.append(frame_entry)
+                    emit_frame_event(frame_entry)
                     
-                    # Update last saved frame for next comparison
-                    last_saved_frame = frame.copy()
+                    # Update last saved frame (and its preprocessed pyramid) for next comparison
+                    set_reference_frame(state, frame, pyramid)
                     
-                    print(f"Extracted unique frame {frame_count + 1}: {filename} at {minutes:02d}:{seconds:02d}", file=sys.stderr)
+                    print(f"Extracted unique frame {frame_count + 1}: {frame_entry['filename']} at {frame_entry['time']}", file=sys.stderr)
                     frame_count += 1
                 else:
                     print(f"Failed to save frame at {current_time:.1f}s", file=sys.stderr)
             
-            # Move to next interval
-            current_time += frame_interval
+            # Clean up
+            cap.release()
         
-        # Clean up
-        cap.release()
+        skipped_frames = state["skipped_frames"]
+        decode_time = decode_stats["decode_time"]
+        decode_fps = decode_stats["frames_decoded"] / decode_time if decode_time > 0 else 0.0
         
         print(f"Extraction complete: {frame_count} unique frames saved, {skipped_frames} similar frames skipped", file=sys.stderr)
+        print(f"Decoded {decode_stats['frames_decoded']} frames in {decode_time:.2f}s ({decode_fps:.1f} fps, {decode_mode} mode)", file=sys.stderr)
         
         return {
             "success": True,
@@ -251,12 +841,25 @@ def extract_frames_with_opencv(video_path, output_dir, frame_interval=1, similar
             "total_frames_extracted": frame_count,
             "frames_skipped": skipped_frames,
             "similarity_threshold": similarity_threshold,
+            "motion_scores": motion_scores,
+            "timings": _stage_timer.summary(),
             "video_info": {
                 "duration": duration,
                 "fps": fps,
                 "total_frames": total_frames,
                 "frame_interval": frame_interval,
-                "method": "opencv_with_similarity"
+                "method": "opencv_with_similarity",
+                "decode_mode": decode_mode,
+                "frames_decoded": decode_stats["frames_decoded"],
+                "decode_time": decode_time,
+                "probe_frames_reused": decode_stats["probe_frames_reused"],
+                "decode_fps": decode_fps,
+                "parallel_chunks": chunk_count,
+                "motion_engine": motion_engine,
+                "sampling": sampling,
+                "frame_budget": frame_budget,
+                "samples_planned": len(sample_times),
+                **scan_stats
             }
         }
         
@@ -267,17 +870,57 @@ def extract_frames_with_opencv(video_path, output_dir, frame_interval=1, similar
             "frames": []
         }
 
+def build_arg_parser():
+    """
+    Command-line arguments of this script (also accepted by pipeline_worker.py)
+    """
+    parser = argparse.ArgumentParser(description="Extract unique frames from a video with OpenCV")
+    parser.add_argument("video_path")
+    parser.add_argument("output_dir")
+    parser.add_argument("similarity_threshold", nargs="?", type=float, default=0.70)
+    parser.add_argument("--decode-mode", choices=["auto", "sequential", "seek"], default="auto",
+                        help="Decode forward once (sequential), seek per sample, or choose by sampling stride")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Worker processes for parallel chunked extraction of long videos")
+    parser.add_argument("--no-base64", action="store_true",
+                        help="Leave image_base64 out of the JSON output; frames are referenced by filepath")
+    parser.add_argument("--ndjson", action="store_true",
+                        help="Stream NDJSON events (frame, progress, result) instead of one JSON document; implies --no-base64")
+    parser.add_argument("--motion-engine", choices=list(MOTION_ENGINES), default="diff",
+                        help="Frame diff against the last saved frame, or MOG2/KNN background subtraction")
+    parser.add_argument("--sampling", choices=["fixed", "adaptive"], default="fixed",
+                        help="Sample every second, or densely at scene changes and sparsely in static stretches")
+    parser.add_argument("--frame-budget", type=int, default=None,
+                        help="Maximum candidate samples per video in adaptive sampling")
+    return parser
+
+def run_from_args(args):
+    """
+    Run the extraction for parsed command-line arguments and return the result dict
+    """
+    # Ensure output directory exists
+    os.makedirs(args.output_dir, exist_ok=True)
+    
+    return extract_frames_with_opencv(
+        args.video_path,
+        args.output_dir,
+        similarity_threshold=args.similarity_threshold,
+        decode_mode=args.decode_mode,
+        workers=args.workers,
+        include_base64=not (args.no_base64 or args.ndjson),
+        motion_engine=args.motion_engine,
+        sampling=args.sampling,
+        frame_budget=args.frame_budget
+    )
+
 if __name__ == "__main__":
     if len(sys.argv) < 3:
-        print(json.dumps({"success": False, "error": "Usage: python extract_frames_opencv.py <video_file_path> <output_directory> [similarity_threshold]"}))
+        print(json.dumps({"success": False, "error": "Usage: python extract_frames_opencv.py <video_file_path> <output_directory> [similarity_threshold] [--decode-mode MODE] [--workers N] [--no-base64] [--ndjson] [--motion-engine diff|mog2|knn] [--sampling fixed|adaptive] [--frame-budget N]"}))
         sys.exit(1)
     
-    video_path = sys.argv[1]
-    output_dir = sys.argv[2]
-    similarity_threshold = float(sys.argv[3]) if len(sys.argv) > 3 else 0.70
-    
-    # Ensure output directory exists
-    os.makedirs(output_dir, exist_ok=True)
+    args = build_arg_parser().parse_args()
+    enable_event_stream(args.ndjson)
     
-    result = extract_frames_with_opencv(video_path, output_dir, similarity_threshold=similarity_threshold)
-    print(json.dumps(result))
+    with profile_run(_stage_timer, "extract_frames_opencv"):
+        result = run_from_args(args)
+    emit_result(result)
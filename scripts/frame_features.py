@@ -0,0 +1,264 @@
+"""
+Per-run frame feature cache for similarity filtering
+Each frame is decoded from disk once; its downscaled grayscale array, histogram, the
+per-frame SSIM statistics (local means and variances) and 64-bit perceptual hashes are kept
+so that every pairwise comparison only computes the cross terms. HammingBKTree indexes the
+hashes for whole-video near-duplicate lookups, and select_novel_frames picks the most
+diverse subset of frames for a frame budget.
+"""
+
+import sys
+import cv2
+import numpy as np
+
+# Comparison size used by the similarity checks (width, height)
+FEATURE_SIZE = (160, 120)
+
+# SSIM parameters matching skimage.metrics.structural_similarity defaults for uint8 input
+SSIM_WIN_SIZE = 7
+SSIM_K1 = 0.01
+SSIM_K2 = 0.03
+SSIM_DATA_RANGE = 255.0
+
+def _local_mean(values):
+    """
+    Mean over each SSIM window; only the fully-covered interior is used afterwards
+    """
+    return cv2.blur(values, (SSIM_WIN_SIZE, SSIM_WIN_SIZE), borderType=cv2.BORDER_REFLECT)
+
+def _crop(values):
+    pad = (SSIM_WIN_SIZE - 1) // 2
+    return values[pad:-pad, pad:-pad]
+
+def compute_frame_features(gray):
+    """
+    Compute the cached features for a downscaled grayscale frame
+    """
+    gray_float = gray.astype(np.float64)
+    num_pixels = SSIM_WIN_SIZE ** 2
+    cov_norm = num_pixels / (num_pixels - 1)  # Sample covariance, as skimage does by default
+
+    mean = _local_mean(gray_float)
+    variance = cov_norm * (_local_mean(gray_float * gray_float) - mean * mean)
+
+    return {
+        "gray": gray,
+        "gray_float": gray_float,
+        "hist": cv2.calcHist([gray], [0], None, [256], [0, 256]),
+        "ssim_mean": mean,
+        "ssim_variance": variance,
+        "dhash": dhash(gray),
+        "phash": phash(gray)
+    }
+
+def _bits_to_int(bits):
+    value = 0
+    for bit in bits.flatten().tolist():
+        value = (value << 1) | int(bit)
+    return value
+
+def dhash(gray, hash_size=8):
+    """
+    Difference hash: sign of horizontal gradients on a (hash_size+1) x hash_size thumbnail
+    """
+    thumbnail = cv2.resize(gray, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    return _bits_to_int(thumbnail[:, 1:] > thumbnail[:, :-1])
+
+def phash(gray, hash_size=8, highfreq_factor=4):
+    """
+    Perceptual hash: low-frequency DCT coefficients compared with their median
+    """
+    image_size = hash_size * highfreq_factor
+    thumbnail = cv2.resize(gray, (image_size, image_size), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low_freq = cv2.dct(thumbnail)[:hash_size, :hash_size]
+    median = np.median(low_freq.flatten()[1:])  # Exclude the DC term
+    return _bits_to_int(low_freq > median)
+
+def hamming_distance(hash1, hash2):
+    """
+    Number of differing bits between two integer hashes
+    """
+    return bin(hash1 ^ hash2).count("1")
+
+def ssim_from_features(features1, features2):
+    """
+    Mean structural similarity of two frames from their cached statistics
+    Equivalent to skimage.metrics.structural_similarity on the two gray arrays
+    """
+    num_pixels = SSIM_WIN_SIZE ** 2
+    cov_norm = num_pixels / (num_pixels - 1)
+    c1 = (SSIM_K1 * SSIM_DATA_RANGE) ** 2
+    c2 = (SSIM_K2 * SSIM_DATA_RANGE) ** 2
+
+    mean1, mean2 = features1["ssim_mean"], features2["ssim_mean"]
+    covariance = cov_norm * (_local_mean(features1["gray_float"] * features2["gray_float"]) - mean1 * mean2)
+
+    a1 = 2 * mean1 * mean2 + c1
+    a2 = 2 * covariance + c2
+    b1 = mean1 ** 2 + mean2 ** 2 + c1
+    b2 = features1["ssim_variance"] + features2["ssim_variance"] + c2
+
+    return float(_crop((a1 * a2) / (b1 * b2)).mean())
+
+def histogram_similarity(features1, features2):
+    """
+    Histogram correlation of two frames from their cached histograms
+    """
+    return cv2.compareHist(features1["hist"], features2["hist"], cv2.HISTCMP_CORREL)
+
+def template_similarity(features1, features2):
+    """
+    Normalized template-matching score of two same-size cached gray frames
+    """
+    result = cv2.matchTemplate(features1["gray"], features2["gray"], cv2.TM_CCOEFF_NORMED)
+    _, max_val, _, _ = cv2.minMaxLoc(result)
+    return max_val
+
+class FrameFeatureCache:
+    """
+    Decode-once cache of similarity features, keyed by frame path
+    """
+
+    def __init__(self, target_size=FEATURE_SIZE):
+        self.target_size = target_size
+        self._features = {}
+        self.decodes = 0
+        self.hits = 0
+
+    def get(self, image_path):
+        """
+        Return the cached features for a frame, decoding it on first use
+        Returns None if the frame cannot be read
+        """
+        if image_path in self._features:
+            self.hits += 1
+            return self._features[image_path]
+
+        self.decodes += 1
+        gray = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+        features = None
+        if gray is not None:
+            features = compute_frame_features(cv2.resize(gray, self.target_size))
+        else:
+            print(f"Could not read frame for similarity features: {image_path}", file=sys.stderr)
+
+        self._features[image_path] = features
+        return features
+
+    def stats(self):
+        """
+        Decode and hit counts for reporting
+        """
+        return {"frames_decoded": self.decodes, "cache_hits": self.hits}
+
+class HammingBKTree:
+    """
+    BK-tree over integer hashes for Hamming-distance range queries
+    Each node stores (hash, item) and children keyed by their distance to the node, so a
+    query only descends into children whose key is within max_distance of the query's
+    distance to that node (triangle inequality).
+    """
+
+    def __init__(self):
+        self._root = None
+        self.size = 0
+
+    def add(self, hash_value, item):
+        """
+        Insert an item under its hash
+        """
+        node = [hash_value, item, {}]
+        self.size += 1
+        if self._root is None:
+            self._root = node
+            return
+
+        current = self._root
+        while True:
+            distance = hamming_distance(hash_value, current[0])
+            child = current[2].get(distance)
+            if child is None:
+                current[2][distance] = node
+                return
+            current = child
+
+    def search(self, hash_value, max_distance):
+        """
+        Return (distance, item) pairs within max_distance of hash_value, closest first
+        """
+        matches = []
+        if self._root is None:
+            return matches
+
+        pending = [self._root]
+        while pending:
+            node_hash, item, children = pending.pop()
+            distance = hamming_distance(hash_value, node_hash)
+            if distance <= max_distance:
+                matches.append((distance, item))
+
+            for child_distance, child in children.items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    pending.append(child)
+
+        matches.sort(key=lambda match: match[0])
+        return matches
+
+# Novelty selection: thumbnail size of the structure descriptor, histogram bins, and the
+# weight of temporal distance (as a fraction of the video) relative to visual distance
+NOVELTY_THUMBNAIL_SIZE = (32, 24)
+NOVELTY_HISTOGRAM_BINS = 32
+NOVELTY_TEMPORAL_WEIGHT = 0.25
+
+def novelty_descriptor(features):
+    """
+    Compact descriptor of a frame for diversity scoring: a brightness-normalised 32x24
+    thumbnail (unit vector) and the square root of its 32-bin normalised histogram
+    """
+    thumbnail = cv2.resize(features["gray"], NOVELTY_THUMBNAIL_SIZE, interpolation=cv2.INTER_AREA).astype(np.float64).flatten()
+    thumbnail -= thumbnail.mean()
+    norm = np.linalg.norm(thumbnail)
+    thumbnail = thumbnail / norm if norm > 0 else thumbnail
+    
+    hist = features["hist"].flatten().reshape(NOVELTY_HISTOGRAM_BINS, -1).sum(axis=1)
+    hist = np.sqrt(hist / max(hist.sum(), 1.0))
+    return thumbnail, hist
+
+def novelty_distances(descriptors, positions, temporal_weight=NOVELTY_TEMPORAL_WEIGHT):
+    """
+    Pairwise frame distances: structural distance (1 - thumbnail correlation) / 2, plus
+    histogram Hellinger distance, averaged, plus weighted temporal distance between positions
+    """
+    thumbnails = np.array([descriptor[0] for descriptor in descriptors])
+    hists = np.array([descriptor[1] for descriptor in descriptors])
+    structural = (1.0 - np.clip(thumbnails @ thumbnails.T, -1.0, 1.0)) / 2
+    hellinger = np.sqrt(np.clip(1.0 - hists @ hists.T, 0.0, 1.0))
+    
+    positions = np.asarray(positions, dtype=np.float64)
+    span = max(positions.max() - positions.min(), 1.0) if len(positions) else 1.0
+    temporal = np.abs(positions[:, None] - positions[None, :]) / span
+    return (structural + hellinger) / 2 + temporal_weight * temporal
+
+def select_novel_frames(features_list, positions, max_frames, temporal_weight=NOVELTY_TEMPORAL_WEIGHT):
+    """
+    Greedy farthest-point selection of up to max_frames frames
+    The first frame is always kept; each further pick is the frame farthest from everything
+    already picked, so near-duplicates are left out before distinct content and picks spread
+    over the video. Returns [(index, novelty)] in index order, where novelty is the pick's
+    distance to the closest earlier pick (None for the first frame).
+    """
+    if not features_list or max_frames <= 0:
+        return []
+    
+    distances = novelty_distances([novelty_descriptor(features) for features in features_list], positions, temporal_weight)
+    picks = [(0, None)]
+    closest = distances[0].copy()
+    closest[0] = -1.0
+    while len(picks) < min(max_frames, len(features_list)):
+        index = int(np.argmax(closest))
+        picks.append((index, float(closest[index])))
+        closest = np.minimum(closest, distances[index])
+        for picked, _ in picks:
+            closest[picked] = -1.0
+    
+    return sorted(picks)
@@ -0,0 +1,435 @@
+"""
+Durable job queue and scheduler for the video pipeline
+Jobs are stored in a local SQLite database and run in two stages: frame extraction (CPU
+bound decoding) and analysis (YOLO plus network-bound LLM requests). Each stage has its own
+pool of warm worker processes (see pipeline_worker.py) whose size is that stage's
+concurrency cap, so a burst of uploads queues up instead of starting every job at once.
+
+The next job for a free slot is chosen by:
+    1. priority class (high, normal, low), with waiting jobs gaining one class every
+       SCHEDULER_PRIORITY_AGING seconds so low priority work is never starved
+    2. fair share across sites: the site with the fewest jobs running in that stage, then
+       the one served least recently
+    3. submission order
+
+Jobs left running by a scheduler that died are queued again on the next start, up to
+SCHEDULER_MAX_ATTEMPTS attempts. The OpenRouter API key is never stored in the database;
+the scheduler reads it from OPENROUTER_API_KEY or --api-key.
+
+Usage:
+    python job_scheduler.py submit <job_id> <frames_dir> [--video PATH] [--site S] [--priority high|normal|low]
+    python job_scheduler.py run [--extract-workers N] [--analyze-workers N] [--until-idle]
+    python job_scheduler.py status <job_id>
+    python job_scheduler.py metrics
+All commands take --db PATH (default SCHEDULER_DB or pipeline_jobs.sqlite3).
+"""
+
+import os
+import sys
+import json
+import time
+import queue
+import sqlite3
+import argparse
+
+from pipeline_worker import WorkerPool
+
+DEFAULT_DB_PATH = os.environ.get("SCHEDULER_DB", "pipeline_jobs.sqlite3")
+
+PRIORITY_CLASSES = {"high": 0, "normal": 1, "low": 2}
+
+STAGE_SCRIPTS = {"extract": "extract_frames_opencv", "analyze": "analyze_frames_openrouter"}
+
+# Concurrency caps per stage: decoding is CPU bound, analysis mostly waits on the LLM
+DEFAULT_EXTRACT_CONCURRENCY = int(os.environ.get("SCHEDULER_EXTRACT_CONCURRENCY", str(max(1, (os.cpu_count() or 2) // 2))))
+DEFAULT_ANALYZE_CONCURRENCY = int(os.environ.get("SCHEDULER_ANALYZE_CONCURRENCY", "2"))
+
+# Seconds a queued job waits before it is treated as one priority class higher
+PRIORITY_AGING_SECONDS = float(os.environ.get("SCHEDULER_PRIORITY_AGING", "300"))
+
+# Attempts per stage before a job interrupted by a crash is marked failed
+MAX_ATTEMPTS = int(os.environ.get("SCHEDULER_MAX_ATTEMPTS", "3"))
+
+# Seconds between checks for jobs submitted by other processes
+POLL_INTERVAL = 1.0
+
+# Window (seconds) for the wait/run time and throughput metrics
+METRICS_WINDOW = 3600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    site TEXT NOT NULL,
+    priority INTEGER NOT NULL,
+    stage TEXT NOT NULL,
+    state TEXT NOT NULL,
+    video_path TEXT,
+    frames_dir TEXT NOT NULL,
+    extract_args TEXT NOT NULL,
+    analyze_args TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    submitted_at REAL NOT NULL,
+    enqueued_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    extract_summary TEXT,
+    result TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (state, stage, priority, enqueued_at);
+CREATE TABLE IF NOT EXISTS stage_runs (
+    job_id TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    site TEXT NOT NULL,
+    enqueued_at REAL NOT NULL,
+    started_at REAL NOT NULL,
+    finished_at REAL NOT NULL,
+    success INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS stage_runs_finished ON stage_runs (finished_at);
+"""
+
+class JobQueue:
+    """
+    SQLite-backed job queue; safe to use from several processes (submitters and one
+    scheduler) at once
+    """
+
+    def __init__(self, db_path=DEFAULT_DB_PATH):
+        self.db_path = db_path
+        self.db = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(SCHEMA)
+
+    def submit(self, job_id, frames_dir, video_path=None, site="default", priority="normal",
+               extract_args=None, analyze_args=None):
+        """
+        Queue a job; with video_path it starts with frame extraction into frames_dir,
+        otherwise it analyses the frames already in frames_dir
+        """
+        if priority not in PRIORITY_CLASSES:
+            raise ValueError(f"Unknown priority {priority!r}, expected one of {list(PRIORITY_CLASSES)}")
+        now = time.time()
+        self.db.execute(
+            "INSERT INTO jobs (id, site, priority, stage, state, video_path, frames_dir, extract_args, analyze_args,"
+            " submitted_at, enqueued_at) VALUES (?, ?, ?, ?, 'queued', ?, ?, ?, ?, ?, ?)",
+            (job_id, site, PRIORITY_CLASSES[priority], "extract" if video_path else "analyze", video_path, frames_dir,
+             json.dumps(extract_args or []), json.dumps(analyze_args or []), now, now)
+        )
+        return self.get(job_id)
+
+    def get(self, job_id):
+        """
+        Job as a dict (results decoded), or None
+        """
+        row = self.db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["priority"] = next(name for name, value in PRIORITY_CLASSES.items() if value == job["priority"])
+        for column in ("extract_args", "analyze_args", "extract_summary", "result"):
+            if job[column] is not None:
+                job[column] = json.loads(job[column])
+        return job
+
+    def claim_next(self, stage):
+        """
+        Mark the next job for stage as running and return it, or None if none is queued
+        """
+        now = time.time()
+        while True:
+            row = self.db.execute(
+                """
+                SELECT j.id FROM jobs j
+                WHERE j.state = 'queued' AND j.stage = ?
+                ORDER BY
+                    j.priority - CAST((? - j.enqueued_at) / ? AS INTEGER),
+                    (SELECT COUNT(*) FROM jobs r WHERE r.state = 'running' AND r.stage = j.stage AND r.site = j.site),
+                    COALESCE((SELECT MAX(s.started_at) FROM stage_runs s WHERE s.stage = j.stage AND s.site = j.site), 0),
+                    j.enqueued_at
+                LIMIT 1
+                """,
+                (stage, now, PRIORITY_AGING_SECONDS)
+            ).fetchone()
+            if row is None:
+                return None
+            claimed = self.db.execute(
+                "UPDATE jobs SET state = 'running', started_at = ?, attempts = attempts + 1 WHERE id = ? AND state = 'queued'",
+                (now, row["id"])
+            ).rowcount
+            if claimed:
+                return self.get(row["id"])
+
+    def _record_run(self, job, success):
+        self.db.execute(
+            "INSERT INTO stage_runs (job_id, stage, site, enqueued_at, started_at, finished_at, success) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (job["id"], job["stage"], job["site"], job["enqueued_at"], job["started_at"], time.time(), int(success))
+        )
+
+    def complete_stage(self, job, result):
+        """
+        Record a successful stage: extraction moves the job on to analysis, analysis
+        finishes it
+        """
+        self._record_run(job, True)
+        now = time.time()
+        if job["stage"] == "extract":
+            summary = {name: value for name, value in result.items() if name not in ("frames", "timings")}
+            self.db.execute(
+                "UPDATE jobs SET stage = 'analyze', state = 'queued', attempts = 0, enqueued_at = ?, started_at = NULL,"
+                " extract_summary = ? WHERE id = ?",
+                (now, json.dumps(summary), job["id"])
+            )
+        else:
+            self.db.execute(
+                "UPDATE jobs SET state = 'done', finished_at = ?, result = ? WHERE id = ?",
+                (now, json.dumps(result), job["id"])
+            )
+
+    def fail(self, job, error, retry=False):
+        """
+        Record a failed stage; with retry the job is queued again unless it is out of attempts
+        """
+        self._record_run(job, False)
+        if retry and job["attempts"] < MAX_ATTEMPTS:
+            self.db.execute("UPDATE jobs SET state = 'queued', started_at = NULL, error = ? WHERE id = ?",
+                            (error, job["id"]))
+        else:
+            self.db.execute("UPDATE jobs SET state = 'failed', finished_at = ?, error = ? WHERE id = ?",
+                            (time.time(), error, job["id"]))
+
+    def recover_running(self, job_ids=None):
+        """
+        Queue again the jobs a previous scheduler left running, or only those in job_ids;
+        returns how many
+        """
+        where, params = "state = 'running'", ()
+        if job_ids is not None:
+            job_ids = list(job_ids)
+            if not job_ids:
+                return 0
+            where += f" AND id IN ({', '.join('?' * len(job_ids))})"
+            params = tuple(job_ids)
+        failed = self.db.execute(
+            "UPDATE jobs SET state = 'failed', finished_at = ?, error = 'Interrupted too many times'"
+            f" WHERE {where} AND attempts >= ?",
+            (time.time(), *params, MAX_ATTEMPTS)
+        ).rowcount
+        requeued = self.db.execute(f"UPDATE jobs SET state = 'queued', started_at = NULL WHERE {where}", params).rowcount
+        if failed or requeued:
+            print(f"Recovered interrupted jobs: {requeued} queued again, {failed} failed", file=sys.stderr)
+        return requeued
+
+    def metrics(self):
+        """
+        Queue depth by stage, priority and site, running jobs, oldest wait, and recent
+        wait/run times and throughput per stage
+        """
+        now = time.time()
+        priorities = {value: name for name, value in PRIORITY_CLASSES.items()}
+        metrics = {"stages": {}, "sites": {}, "states": {}}
+        for row in self.db.execute("SELECT state, COUNT(*) AS jobs FROM jobs GROUP BY state"):
+            metrics["states"][row["state"]] = row["jobs"]
+
+        for stage in STAGE_SCRIPTS:
+            depth = self.db.execute(
+                "SELECT priority, COUNT(*) AS jobs, MIN(enqueued_at) AS oldest FROM jobs"
+                " WHERE state = 'queued' AND stage = ? GROUP BY priority",
+                (stage,)
+            ).fetchall()
+            running = self.db.execute("SELECT COUNT(*) FROM jobs WHERE state = 'running' AND stage = ?",
+                                      (stage,)).fetchone()[0]
+            recent = self.db.execute(
+                "SELECT COUNT(*) AS runs, SUM(success) AS succeeded, AVG(started_at - enqueued_at) AS wait,"
+                " AVG(finished_at - started_at) AS run FROM stage_runs WHERE stage = ? AND finished_at >= ?",
+                (stage, now - METRICS_WINDOW)
+            ).fetchone()
+            oldest = min((row["oldest"] for row in depth), default=None)
+            metrics["stages"][stage] = {
+                "queued": sum(row["jobs"] for row in depth),
+                "queued_by_priority": {priorities[row["priority"]]: row["jobs"] for row in depth},
+                "running": running,
+                "oldest_queued_seconds": round(now - oldest, 3) if oldest is not None else 0.0,
+                "completed_last_hour": recent["succeeded"] or 0,
+                "failed_last_hour": recent["runs"] - (recent["succeeded"] or 0),
+                "mean_wait_seconds": round(recent["wait"], 3) if recent["wait"] is not None else None,
+                "mean_run_seconds": round(recent["run"], 3) if recent["run"] is not None else None
+            }
+
+        for row in self.db.execute(
+                "SELECT site, SUM(state = 'queued') AS queued, SUM(state = 'running') AS running FROM jobs"
+                " WHERE state IN ('queued', 'running') GROUP BY site"):
+            metrics["sites"][row["site"]] = {"queued": row["queued"], "running": row["running"]}
+        return metrics
+
+    def close(self):
+        self.db.close()
+
+class Scheduler:
+    """
+    Runs queued jobs on one warm worker pool per stage, within each stage's concurrency cap
+    """
+
+    def __init__(self, job_queue, api_key, extract_workers=DEFAULT_EXTRACT_CONCURRENCY,
+                 analyze_workers=DEFAULT_ANALYZE_CONCURRENCY, warm_yolo=False):
+        self.queue = job_queue
+        self.api_key = api_key
+        self.pools = {
+            "extract": WorkerPool(extract_workers),
+            "analyze": WorkerPool(analyze_workers, warm_yolo=warm_yolo)
+        }
+        self.capacity = {stage: pool.pool_size for stage, pool in self.pools.items()}
+        self.running = {stage: {} for stage in self.pools}
+        # Completions arrive on the pools' dispatcher threads; the database is only used
+        # from the scheduler loop
+        self._completions = queue.Queue()
+
+    def _stage_argv(self, job):
+        if job["stage"] == "extract":
+            return [job["video_path"], job["frames_dir"], "--no-base64", *job["extract_args"]]
+        # A retried analysis picks up the checkpoints of the attempt that was interrupted
+        resume = ["--resume"] if job["attempts"] > 1 else []
+        return [job["frames_dir"], self.api_key, job["id"], *job["analyze_args"], *resume]
+
+    def _start(self, job):
+        stage = job["stage"]
+        self.running[stage][job["id"]] = job
+
+        def send(message):
+            if "id" in message:
+                self._completions.put((stage, job["id"], message))
+
+        self.pools[stage].submit(STAGE_SCRIPTS[stage], self._stage_argv(job), job["id"], send)
+        print(f"Started {stage} for job {job['id']} (site {job['site']}, priority {job['priority']})", file=sys.stderr)
+
+    def _finish(self, stage, job_id, message):
+        job = self.running[stage].pop(job_id)
+        if "error" in message:
+            # Worker crashes and similar are retried; the job itself is not at fault
+            self.queue.fail(job, message["error"]["message"], retry=True)
+            print(f"Job {job_id} {stage} error: {message['error']['message']}", file=sys.stderr)
+            return
+
+        result = message["result"]
+        if result.get("success"):
+            self.queue.complete_stage(job, result)
+            print(f"Job {job_id} finished {stage}", file=sys.stderr)
+        else:
+            self.queue.fail(job, result.get("error", f"{stage} failed"))
+            print(f"Job {job_id} {stage} failed: {result.get('error')}", file=sys.stderr)
+
+    def _finish_completed(self):
+        """
+        Record every completion that has already arrived
+        """
+        while True:
+            try:
+                completion = self._completions.get_nowait()
+            except queue.Empty:
+                return
+            self._finish(*completion)
+
+    def _dispatch(self):
+        for stage, capacity in self.capacity.items():
+            while len(self.running[stage]) < capacity:
+                job = self.queue.claim_next(stage)
+                if job is None:
+                    break
+                self._start(job)
+
+    def idle(self):
+        if any(self.running.values()):
+            return False
+        states = self.queue.metrics()["states"]
+        return not states.get("queued") and not states.get("running")
+
+    def run(self, until_idle=False):
+        """
+        Dispatch jobs until interrupted (or, with until_idle, until nothing is left to do)
+        """
+        self.queue.recover_running()
+        for pool in self.pools.values():
+            pool.start()
+        try:
+            while True:
+                self._dispatch()
+                if until_idle and self.idle():
+                    return
+                try:
+                    completion = self._completions.get(timeout=POLL_INTERVAL)
+                except queue.Empty:
+                    continue
+                self._finish(*completion)
+                self._finish_completed()
+        finally:
+            for pool in self.pools.values():
+                pool.shutdown()
+            # Jobs that finished while the pools shut down are recorded first; only the rest
+            # were interrupted and are queued for the next scheduler
+            self._finish_completed()
+            self.queue.recover_running(job_id for running in self.running.values() for job_id in running)
+
+    def metrics(self):
+        """
+        Queue metrics plus the worker pools' state
+        """
+        return {**self.queue.metrics(), "pools": {stage: pool.stats() for stage, pool in self.pools.items()}}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Queue and run video pipeline jobs with priorities and concurrency limits")
+    parser.add_argument("--db", default=DEFAULT_DB_PATH, help="SQLite database holding the job queue")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    submit_parser = commands.add_parser("submit", help="Queue a job")
+    submit_parser.add_argument("job_id")
+    submit_parser.add_argument("frames_dir", help="Frames to analyse, or where frames extracted from --video are written")
+    submit_parser.add_argument("--video", help="Video to extract frames from before the analysis")
+    submit_parser.add_argument("--site", default="default", help="Site the video comes from, for fair sharing")
+    submit_parser.add_argument("--priority", choices=list(PRIORITY_CLASSES), default="normal")
+    submit_parser.add_argument("--extract-args", default="", help="Extra extract_frames_opencv.py arguments, space separated")
+    submit_parser.add_argument("--analyze-args", default="", help="Extra analyze_frames_openrouter.py arguments, space separated")
+
+    run_parser = commands.add_parser("run", help="Run queued jobs")
+    run_parser.add_argument("--extract-workers", type=int, default=DEFAULT_EXTRACT_CONCURRENCY,
+                            help="Frame extraction jobs run at once (0 = one per CPU core)")
+    run_parser.add_argument("--analyze-workers", type=int, default=DEFAULT_ANALYZE_CONCURRENCY,
+                            help="Analysis jobs run at once (0 = one per CPU core)")
+    run_parser.add_argument("--api-key", default=os.environ.get("OPENROUTER_API_KEY", ""),
+                            help="OpenRouter API key (default OPENROUTER_API_KEY)")
+    run_parser.add_argument("--warm-yolo", action="store_true", help="Load the YOLO models before the first analysis")
+    run_parser.add_argument("--until-idle", action="store_true", help="Exit once no jobs are queued or running")
+
+    status_parser = commands.add_parser("status", help="Show one job")
+    status_parser.add_argument("job_id")
+
+    commands.add_parser("metrics", help="Show queue depth and timing metrics")
+    args = parser.parse_args()
+
+    job_queue = JobQueue(args.db)
+    if args.command == "submit":
+        try:
+            job = job_queue.submit(args.job_id, args.frames_dir, video_path=args.video, site=args.site, priority=args.priority,
+                                   extract_args=args.extract_args.split(), analyze_args=args.analyze_args.split())
+        except sqlite3.IntegrityError:
+            print(json.dumps({"success": False, "error": f"Job {args.job_id} already exists"}))
+            sys.exit(1)
+        print(json.dumps({"success": True, "job": job}, indent=2))
+    elif args.command == "run":
+        if not args.api_key:
+            print(json.dumps({"success": False, "error": "OpenRouter API key is required"}))
+            sys.exit(1)
+        scheduler = Scheduler(job_queue, args.api_key, extract_workers=args.extract_workers,
+                              analyze_workers=args.analyze_workers, warm_yolo=args.warm_yolo)
+        try:
+            scheduler.run(until_idle=args.until_idle)
+        except KeyboardInterrupt:
+            pass
+        print(json.dumps({"success": True, "metrics": job_queue.metrics()}, indent=2))
+    elif args.command == "status":
+        job = job_queue.get(args.job_id)
+        print(json.dumps({"success": job is not None, "job": job} if job else
+                         {"success": False, "error": f"Job {args.job_id} not found"}, indent=2))
+    else:
+        print(json.dumps({"success": True, "metrics": job_queue.metrics()}, indent=2))
+    job_queue.close()
@@ -0,0 +1,165 @@
+"""
+Content-addressed on-disk caches for the analysis pipeline
+LLMResponseCache stores one frameDetails object per <key>.json, where the key hashes the
+frame's uploaded JPEG bytes together with a context fingerprint (system prompt, model,
+request parameters and the frame's YOLO summary). Identical frames from a re-uploaded or
+trimmed video therefore reuse earlier answers. UploadPayloadCache stores re-encoded
+upload images keyed by source bytes and encoding settings. Entries are evicted
+least-recently-used first once a cache exceeds its entry or byte limit.
+"""
+
+import os
+import sys
+import json
+import hashlib
+import threading
+
+DEFAULT_CACHE_DIR = os.path.join(os.getcwd(), "cache", "llm-responses")
+DEFAULT_UPLOAD_CACHE_DIR = os.path.join(os.getcwd(), "cache", "upload-payloads")
+DEFAULT_MAX_ENTRIES = 5000
+DEFAULT_MAX_BYTES = 200 * 1024 * 1024
+
+def fingerprint(*parts):
+    """
+    Stable SHA-256 hex digest of the given strings
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+class LLMResponseCache:
+    """
+    LRU file cache of frameDetails keyed by frame content and prompt context
+    Recency is tracked with file modification times, so it persists across runs
+    """
+    SUFFIX = ".json"
+    ENV_PREFIX = "LLM_CACHE"
+    DEFAULT_DIR = DEFAULT_CACHE_DIR
+
+    def __init__(self, cache_dir=None, max_entries=None, max_bytes=None):
+        self.cache_dir = cache_dir or os.environ.get(f"{self.ENV_PREFIX}_DIR", self.DEFAULT_DIR)
+        self.max_entries = max_entries or int(os.environ.get(f"{self.ENV_PREFIX}_MAX_ENTRIES", DEFAULT_MAX_ENTRIES))
+        self.max_bytes = max_bytes or int(float(os.environ.get(f"{self.ENV_PREFIX}_MAX_MB", DEFAULT_MAX_BYTES / (1024 * 1024))) * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def make_key(self, image_base64, context_fingerprint):
+        """
+        Cache key for one frame: hash of its encoded image plus the context fingerprint
+        """
+        return fingerprint(hashlib.sha256(image_base64.encode("ascii")).hexdigest(), context_fingerprint)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}{self.SUFFIX}")
+
+    def _load(self, path):
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _dump(self, path, value):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(value, f)
+
+    def get(self, key):
+        """
+        Return the cached value for a key, or None on a miss
+        """
+        path = self._path(key)
+        try:
+            detail = self._load(path)
+            os.utime(path)  # Mark as recently used
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return detail
+
+    def put(self, key, detail):
+        """
+        Store a value; written to a temporary file and renamed so readers never see a
+        partial entry
+        """
+        path = self._path(key)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            self._dump(temp_path, detail)
+            os.replace(temp_path, path)
+        except OSError as e:
+            print(f"Could not write cache entry {key}: {e}", file=sys.stderr)
+            return
+
+        with self._lock:
+            self.writes += 1
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(self.SUFFIX):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.cache_dir, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+        return entries
+
+    def evict(self):
+        """
+        Delete least-recently-used entries until both limits are met
+        """
+        entries = sorted(self._entries())
+        total_bytes = sum(size for _, size, _ in entries)
+        while entries and (len(entries) > self.max_entries or total_bytes > self.max_bytes):
+            _, size, name = entries.pop(0)
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except OSError:
+                continue
+            total_bytes -= size
+            self.evictions += 1
+
+    def stats(self):
+        """
+        Counters and current size for reporting
+        """
+        entries = self._entries()
+        return {
+            "enabled": True,
+            "hits": self.hits,
+            "misses": self.misses,
+            "writes": self.writes,
+            "evictions": self.evictions,
+            "entries": len(entries),
+            "bytes": sum(size for _, size, _ in entries)
+        }
+
+class UploadPayloadCache(LLMResponseCache):
+    """
+    LRU file cache of prepared upload JPEGs keyed by source bytes and encoding settings
+    """
+    SUFFIX = ".jpg"
+    ENV_PREFIX = "UPLOAD_CACHE"
+    DEFAULT_DIR = DEFAULT_UPLOAD_CACHE_DIR
+
+    def make_key(self, image_data, settings_fingerprint):
+        """
+        Cache key for one source image under the given encoding settings
+        """
+        return fingerprint(hashlib.sha256(image_data).hexdigest(), settings_fingerprint)
+
+    def _load(self, path):
+        with open(path, "rb") as f:
+            return f.read()
+
+    def _dump(self, path, value):
+        with open(path, "wb") as f:
+            f.write(value)
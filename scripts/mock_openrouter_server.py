@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+Local mock of the OpenRouter chat completions endpoint for tests and benchmarks
+Answers every request with a well-formed frameDetails entry per image after a configurable
+latency, plus an optional seeded random jitter so concurrent requests finish out of order. Failures can be injected to exercise the retry layer: the first N requests fail
+with 500 (or another status, e.g. 429), and a seeded fraction of the rest get 429 (with
+Retry-After) or 503. Point the
+analysis script at it by setting OPENROUTER_API_URL, e.g.
+
+    python scripts/mock_openrouter_server.py --port 8765 --latency 2
+    OPENROUTER_API_URL=http://127.0.0.1:8765/api/v1/chat/completions \
+        python scripts/analyze_frames_openrouter.py <frames_dir> test-key job1
+"""
+
+import re
+import sys
+import random
+import json
+import time
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CHAT_COMPLETIONS_PATH = "/api/v1/chat/completions"
+
+def build_mock_analysis(image_count, start_frame_idx):
+    """
+    Build an analysis payload in the schema the system prompt asks for
+    """
+    return {
+        "incorrectParking": False,
+        "wasteMaterial": True,
+        "overallExplanation": f"Mock analysis of {image_count} frames",
+        "frameDetails": [
+            {
+                "frameIndex": start_frame_idx + i,
+                "timestamp": f"00:{(start_frame_idx + i) % 60:02d}",
+                "detailedObservations": "Mock observation of a warehouse aisle",
+                "identifiedObjects": [],
+                "safetyIssues": [
+                    {
+                        "type": "debris",
+                        "severity": "medium",
+                        "confidence": 7,
+                        "reasoning": "Mock reasoning",
+                        "description": "Loose material on the walkway",
+                        "location": "center",
+                        "impact": "Could slow evacuation",
+                        "gridCells": "B2-B3",
+                        "mitigationStrategy": "Clear the walkway",
+                        "urgency": "short-term",
+                        "estimatedCost": "low",
+                        "responsibleParty": "Facilities"
+                    }
+                ],
+                "pathwayClearance": "Partially clear",
+                "emergencyAccess": "Accessible",
+                "recommendedActions": []
+            } for i in range(image_count)
+        ]
+    }
+
+class MockOpenRouterHandler(BaseHTTPRequestHandler):
+    """
+    Handles POSTs to the chat completions path
+    """
+
+    def log_message(self, format, *args):
+        # Keep stdout/stderr quiet; the scripts under test own them
+        pass
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        if self.path != CHAT_COMPLETIONS_PATH:
+            self._send_json(404, {"error": {"message": "Not found"}})
+            return
+
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        request_number = self.server.request_started()
+        try:
+            failure = self.server.pick_failure(request_number)
+            if failure == 429:
+                self._send_json(429, {"error": {"message": "Rate limit exceeded"}},
+                                {"Retry-After": f"{self.server.retry_after:g}"})
+            elif failure:
+                self._send_json(failure, {"error": {"message": "Injected upstream failure"}})
+            else:
+                self._respond(request)
+        finally:
+            self.server.request_finished()
+
+    def _respond(self, request):
+        user_content = request.get("messages", [{}, {}])[1].get("content", [])
+        image_count = sum(1 for part in user_content if part.get("type") == "image_url")
+        prompt_text = " ".join(part.get("text", "") for part in user_content if part.get("type") == "text")
+        match = re.search(r"starting from (\d+)", prompt_text)
+        start_frame_idx = int(match.group(1)) if match else 0
+
+        time.sleep(self.server.latency + self.server.pick_jitter())
+
+        content = json.dumps(build_mock_analysis(image_count, start_frame_idx))
+        finish_reason = "stop"
+        if self.server.max_images and image_count > self.server.max_images:
+            # Simulate a response cut off at max_tokens
+            content = content[:len(content) // 2]
+            finish_reason = "length"
+
+        self._send_json(200, {
+            "id": f"mock-{self.server.request_count}",
+            "model": request.get("model"),
+            "choices": [{"message": {"role": "assistant", "content": content}, "finish_reason": finish_reason}]
+        })
+
+class MockOpenRouterServer(ThreadingHTTPServer):
+    """
+    Threaded mock server that records request counts and peak concurrency
+    """
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.0, max_images=0, fail_first=0, fail_rate=0.0,
+                 rate_limit_rate=0.0, retry_after=1.0, seed=0, latency_jitter=0.0, fail_first_status=500):
+        super().__init__(address, MockOpenRouterHandler)
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.max_images = max_images
+        self.fail_first = fail_first
+        self.fail_first_status = fail_first_status
+        self.fail_rate = fail_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.failures_injected = 0
+        self._rng = random.Random(seed)
+        self.request_count = 0
+        self.active_requests = 0
+        self.peak_concurrency = 0
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}{CHAT_COMPLETIONS_PATH}"
+
+    def request_started(self):
+        with self._lock:
+            self.request_count += 1
+            self.active_requests += 1
+            self.peak_concurrency = max(self.peak_concurrency, self.active_requests)
+            return self.request_count
+
+    def pick_failure(self, request_number):
+        """
+        Status code to fail this request with, or None to answer normally
+        """
+        with self._lock:
+            if request_number <= self.fail_first:
+                status = self.fail_first_status
+            else:
+                roll = self._rng.random()
+                if roll < self.rate_limit_rate:
+                    status = 429
+                elif roll < self.rate_limit_rate + self.fail_rate:
+                    status = 503
+                else:
+                    return None
+            self.failures_injected += 1
+            return status
+
+    def pick_jitter(self):
+        """
+        Extra latency for one response, uniform in [0, latency_jitter]
+        """
+        if self.latency_jitter <= 0:
+            return 0.0
+        with self._lock:
+            return self._rng.uniform(0, self.latency_jitter)
+
+    def request_finished(self):
+        with self._lock:
+            self.active_requests -= 1
+
+def start_mock_server(host="127.0.0.1", port=0, latency=0.0, max_images=0, **failures):
+    """
+    Start a mock server on a background thread; port 0 picks a free port
+    Requests with more than max_images images (if set) get a truncated response;
+    failures takes fail_first, fail_first_status, fail_rate, rate_limit_rate, retry_after and seed, and
+    latency_jitter adds a random extra delay of up to that many seconds per response
+    Returns the server (call shutdown() when done); its endpoint is server.url
+    """
+    server = MockOpenRouterServer((host, port), latency=latency, max_images=max_images, **failures)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local mock OpenRouter endpoint")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds to wait before each response")
+    parser.add_argument("--latency-jitter", type=float, default=0.0,
+                        help="Add a random extra delay of up to this many seconds to each response")
+    parser.add_argument("--max-images", type=int, default=0,
+                        help="Truncate responses (finish_reason=length) for requests with more images than this")
+    parser.add_argument("--fail-first", type=int, default=0, help="Answer the first N requests with HTTP 500")
+    parser.add_argument("--fail-first-status", type=int, default=500, help="Status code for the --fail-first failures")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Fraction of requests answered with HTTP 503")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of requests answered with HTTP 429")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds sent with 429 responses")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the injected failure pattern")
+    args = parser.parse_args()
+
+    server = MockOpenRouterServer(
+        (args.host, args.port), latency=args.latency, max_images=args.max_images, fail_first=args.fail_first,
+        fail_rate=args.fail_rate, rate_limit_rate=args.rate_limit_rate, retry_after=args.retry_after, seed=args.seed,
+        latency_jitter=args.latency_jitter, fail_first_status=args.fail_first_status
+    )
+    print(f"Mock OpenRouter listening on {server.url}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
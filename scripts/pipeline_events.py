@@ -0,0 +1,62 @@
+"""
+NDJSON event stream shared by the pipeline scripts
+When enabled, each script writes one JSON object per line to stdout as work completes
+("frame", "progress" and "batch" events) and finishes with a single "result" event that
+carries the final summary. Large binary payloads are never inlined; frames are referenced
+by file path. A long-lived worker can install an event sink to receive the events itself
+instead of having them written to stdout.
+"""
+
+import json
+import sys
+
+# Keep a handle on the real stdout: the analysis script temporarily points sys.stdout
+# at stderr while third-party libraries print
+_event_stdout = sys.stdout
+_stream_enabled = False
+_event_sink = None
+
+def enable_event_stream(enabled=True):
+    """
+    Switch the process to NDJSON event output
+    """
+    global _stream_enabled
+    _stream_enabled = enabled
+
+def event_stream_enabled():
+    """
+    Check if NDJSON event output is active
+    """
+    return _stream_enabled
+
+def set_event_sink(sink):
+    """
+    Route events to sink(event_dict) instead of stdout; None restores stdout
+    """
+    global _event_sink
+    _event_sink = sink
+
+def emit_event(event, **payload):
+    """
+    Write one event line to stdout and flush it so the consumer sees it immediately
+    No-op unless the event stream is enabled
+    """
+    if not _stream_enabled:
+        return
+
+    if _event_sink is not None:
+        _event_sink({"event": event, **payload})
+        return
+    _event_stdout.write(json.dumps({"event": event, **payload}) + "\n")
+    _event_stdout.flush()
+
+def emit_result(result):
+    """
+    Write the final result: a "result" event in NDJSON mode, otherwise the legacy single
+    JSON document
+    """
+    if _stream_enabled:
+        emit_event("result", result=result)
+    else:
+        _event_stdout.write(json.dumps(result) + "\n")
+        _event_stdout.flush()
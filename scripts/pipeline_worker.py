@@ -0,0 +1,520 @@
+"""
+Long-lived worker for the pipeline scripts
+Starting a Python process per job pays for interpreter start-up, imports (OpenCV, numpy,
+scikit-image, ultralytics), YOLO model loads and new HTTPS connections every time. This
+worker keeps a pool of warm processes instead: each one imports the scripts once, keeps its
+YOLO models and OpenRouter HTTP session, and runs one job at a time. Jobs are submitted as
+line-delimited JSON-RPC 2.0 over stdin/stdout or a local Unix socket, using the same
+arguments as the command line, and their events are streamed back as they happen:
+
+    -> {"jsonrpc": "2.0", "id": 1, "method": "run", "params": {"script": "extract_frames_opencv.py", "args": ["video.mp4", "out", "--ndjson"]}}
+    <- {"jsonrpc": "2.0", "method": "event", "params": {"id": 1, "event": {"event": "frame", ...}}}
+    <- {"jsonrpc": "2.0", "id": 1, "result": {"success": true, ...}}
+
+Events are only sent for jobs whose args include --ndjson, as with the scripts themselves.
+Other methods: "ping", "stats" (pool and queue counters) and "shutdown" (finish running
+jobs, then exit).
+
+Usage: python pipeline_worker.py [--stdio | --socket PATH] [--pool-size N] [--warm-yolo]
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import itertools
+import threading
+import socketserver
+import collections
+import multiprocessing
+import multiprocessing.connection
+
+# Scripts that can be run by the worker; each provides build_arg_parser() and run_from_args()
+WORKER_SCRIPTS = ("extract_frames_opencv", "analyze_frames_openrouter")
+
+# Worker processes in the pool (0 = one per CPU core)
+DEFAULT_POOL_SIZE = int(os.environ.get("PIPELINE_WORKER_POOL_SIZE", "1"))
+
+# A worker that dies is restarted RESTART_BASE_DELAY * 2^(n-1) seconds after its n-th death
+# in a row (at most RESTART_MAX_DELAY); one that dies MAX_WORKER_RESTARTS + 1 times in a row
+# without becoming ready (e.g. a failing import or model warm-up) is not restarted again
+MAX_WORKER_RESTARTS = 5
+RESTART_BASE_DELAY = 0.5
+RESTART_MAX_DELAY = 30.0
+
+# JSON-RPC 2.0 error codes
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+INTERNAL_ERROR = -32603
+WORKER_DIED = -32000
+WORKERS_UNAVAILABLE = -32001
+
+def script_module_name(script):
+    """
+    Module name for a script given as "extract_frames_opencv" or "extract_frames_opencv.py",
+    or None if the worker does not run it
+    """
+    name = os.path.basename(str(script))
+    if name.endswith(".py"):
+        name = name[:-3]
+    return name if name in WORKER_SCRIPTS else None
+
+def _run_job(modules, script, argv, send):
+    """
+    Run one script invocation in this process, sending events through send; returns
+    ("result", result) or ("error", {"code", "message"})
+    """
+    from pipeline_events import enable_event_stream, set_event_sink
+    from stage_timing import profile_run
+
+    module = modules[script]
+    try:
+        args = module.build_arg_parser().parse_args(argv)
+    except SystemExit:
+        # argparse has already printed the usage error to stderr
+        return "error", {"code": INVALID_PARAMS, "message": f"Invalid arguments for {script}: {argv}"}
+
+    validate = getattr(module, "validate_args", None)
+    error = validate(args) if validate is not None else None
+    if error:
+        return "result", {"success": False, "error": error}
+
+    set_event_sink(send)
+    enable_event_stream(args.ndjson)
+    try:
+        with profile_run(module._stage_timer, script):
+            return "result", module.run_from_args(args)
+    except Exception as e:
+        return "error", {"code": INTERNAL_ERROR, "message": f"{type(e).__name__}: {e}"}
+    finally:
+        enable_event_stream(False)
+        set_event_sink(None)
+
+def _worker_main(slot, conn, warm_yolo):
+    """
+    Pool process: warm up, then run the jobs sent over conn until told to stop or the
+    parent goes away (a running job is finished first)
+    """
+    # The scripts' stdout belongs to the JSON protocol; anything printed here goes to stderr
+    os.dup2(2, 1)
+    sys.stdout = sys.stderr
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    start = time.perf_counter()
+    import extract_frames_opencv
+    import analyze_frames_openrouter
+    modules = {"extract_frames_opencv": extract_frames_opencv, "analyze_frames_openrouter": analyze_frames_openrouter}
+    analyze_frames_openrouter.get_http_session()
+    if warm_yolo:
+        analyze_frames_openrouter.warm_yolo_models()
+    conn.send(("ready", None, {"pid": os.getpid(), "warmup_seconds": round(time.perf_counter() - start, 3)}))
+
+    jobs_run = 0
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            return
+        if job is None:
+            return
+
+        key, script, argv = job
+        jobs_run += 1
+        job_start = time.perf_counter()
+        kind, payload = _run_job(modules, script, argv, lambda event: conn.send(("event", key, event)))
+        if kind == "result":
+            payload["worker"] = {
+                "pid": os.getpid(),
+                "slot": slot,
+                "job_number": jobs_run,
+                "job_seconds": round(time.perf_counter() - job_start, 3)
+            }
+        try:
+            conn.send((kind, key, payload))
+        except OSError:
+            # The parent went away while the job ran
+            return
+
+class WorkerPool:
+    """
+    Pool of warm worker processes, each connected to this process by its own pipe
+    Jobs wait in a queue here and are handed to idle workers; results and events are routed
+    back to the send callback given for each job. Workers that die are restarted with
+    exponential backoff; once every worker has exhausted max_restarts, queued and new jobs
+    fail with WORKERS_UNAVAILABLE.
+    """
+
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE, warm_yolo=False, max_restarts=MAX_WORKER_RESTARTS,
+                 restart_base_delay=RESTART_BASE_DELAY, restart_max_delay=RESTART_MAX_DELAY):
+        self.pool_size = pool_size if pool_size > 0 else (os.cpu_count() or 1)
+        self.warm_yolo = warm_yolo
+        self.max_restarts = max_restarts
+        self.restart_base_delay = restart_base_delay
+        self.restart_max_delay = restart_max_delay
+        # Spawned (not forked) workers start clean of this process's threads and can still
+        # fork their own extraction processes
+        self._context = multiprocessing.get_context("spawn")
+        self._lock = threading.Condition()
+        self._keys = itertools.count(1)
+        self._workers = {}
+        self._jobs = {}
+        self._queue = collections.deque()
+        self._stopping = False
+        self.stats_counts = {"submitted": 0, "completed": 0, "failed": 0, "restarts": 0}
+        self._dispatcher = threading.Thread(target=self._dispatch, name="worker-dispatch", daemon=True)
+
+    def start(self):
+        for slot in range(self.pool_size):
+            self._spawn(slot)
+        self._dispatcher.start()
+        print(f"Started {self.pool_size} pipeline worker(s)", file=sys.stderr)
+
+    def _spawn(self, slot):
+        conn, child_conn = self._context.Pipe()
+        process = self._context.Process(target=_worker_main, args=(slot, child_conn, self.warm_yolo),
+                                        name=f"pipeline-worker-{slot}")
+        process.start()
+        child_conn.close()
+        previous = self._workers.get(slot, {})
+        self._workers[slot] = {"process": process, "conn": conn, "ready": False, "job": None,
+                               "warmup_seconds": None, "jobs": previous.get("jobs", 0),
+                               "deaths": previous.get("deaths", 0), "restart_at": None, "gave_up": False}
+
+    def _available(self):
+        """
+        Whether any worker is running or will be restarted (called with the lock held)
+        """
+        return any(not worker["gave_up"] for worker in self._workers.values())
+
+    def _unavailable_error(self):
+        return {"code": WORKERS_UNAVAILABLE,
+                "message": f"No pipeline workers available: every worker died {self.max_restarts + 1} times in a row without starting"}
+
+    def submit(self, script, argv, request_id, send):
+        """
+        Queue script with argv; send(message) receives the JSON-RPC event notifications and
+        the final response for request_id
+        """
+        with self._lock:
+            key = next(self._keys)
+            self._jobs[key] = {"request_id": request_id, "send": send, "submitted": time.time(),
+                               "script": script, "argv": list(argv)}
+            self.stats_counts["submitted"] += 1
+            available = self._available()
+            if available:
+                self._queue.append(key)
+                self._assign()
+            else:
+                self.stats_counts["failed"] += 1
+        if not available:
+            self._finish(key, {"error": self._unavailable_error()})
+        return key
+
+    def _assign(self):
+        """
+        Hand queued jobs to idle workers (called with the lock held)
+        """
+        if self._stopping:
+            return
+        for worker in self._workers.values():
+            if not self._queue:
+                return
+            if not worker["ready"] or worker["job"] is not None:
+                continue
+            key = self._queue.popleft()
+            job = self._jobs[key]
+            try:
+                worker["conn"].send((key, job["script"], job["argv"]))
+            except OSError:
+                # The worker is gone; _dispatch restarts it and the job waits for a live one
+                self._queue.appendleft(key)
+                worker["ready"] = False
+                continue
+            worker["job"] = key
+            worker["jobs"] += 1
+
+    def _finish(self, key, message):
+        with self._lock:
+            job = self._jobs.pop(key, None)
+            self._lock.notify_all()
+        if job is not None:
+            job["send"]({"jsonrpc": "2.0", "id": job["request_id"], **message})
+
+    def _dispatch(self):
+        # After shutdown() the workers' last results are still read until each has exited
+        while True:
+            with self._lock:
+                connections = {worker["conn"]: slot for slot, worker in self._workers.items() if worker["conn"] is not None}
+                restart_times = [worker["restart_at"] for worker in self._workers.values() if worker["restart_at"] is not None]
+            if self._stopping and not connections:
+                return
+            timeout = min([1.0] + [max(0.0, restart_at - time.monotonic()) for restart_at in restart_times])
+            for conn in multiprocessing.connection.wait(list(connections), timeout=timeout):
+                slot = connections[conn]
+                try:
+                    kind, key, payload = conn.recv()
+                except (EOFError, OSError):
+                    self._restart(slot)
+                    continue
+                self._handle(slot, kind, key, payload)
+            for slot, worker in list(self._workers.items()):
+                if worker["conn"] is not None and not worker["process"].is_alive():
+                    self._restart(slot)
+            self._respawn_due()
+
+    def _handle(self, slot, kind, key, payload):
+        if kind == "event":
+            with self._lock:
+                job = self._jobs.get(key)
+            if job is not None:
+                job["send"]({"jsonrpc": "2.0", "method": "event", "params": {"id": job["request_id"], "event": payload}})
+            return
+
+        with self._lock:
+            worker = self._workers[slot]
+            if kind == "ready":
+                worker.update(ready=True, warmup_seconds=payload["warmup_seconds"], deaths=0)
+                print(f"Worker {slot} (pid {payload['pid']}) ready in {payload['warmup_seconds']:.2f}s", file=sys.stderr)
+            else:
+                worker["job"] = None
+                self.stats_counts["completed" if kind == "result" else "failed"] += 1
+            self._assign()
+        if kind != "ready":
+            self._finish(key, {kind: payload})
+
+    def _restart(self, slot):
+        """
+        Fail the job of a worker that died and schedule a replacement after a backoff, or
+        give up on the slot once it has died max_restarts + 1 times in a row; when no slot
+        is left, the queued jobs are failed
+        While shutting down, the worker's connection is only closed: a job it did not finish
+        is left unanswered, as one it never started
+        """
+        abandoned = []
+        with self._lock:
+            worker = self._workers[slot]
+            if worker["conn"] is None:
+                return
+            worker["process"].join(1)
+            worker["conn"].close()
+            if self._stopping:
+                worker["conn"] = None
+                return
+            exit_code = worker["process"].exitcode
+            key = worker["job"]
+            worker.update(conn=None, ready=False, job=None, deaths=worker["deaths"] + 1)
+            if key is not None:
+                self.stats_counts["failed"] += 1
+            if worker["deaths"] > self.max_restarts:
+                worker["gave_up"] = True
+                print(f"Worker {slot} exited with code {exit_code}, {worker['deaths']} times in a row; not restarting it", file=sys.stderr)
+                if not self._available():
+                    abandoned = list(self._queue)
+                    self._queue.clear()
+                    self.stats_counts["failed"] += len(abandoned)
+            else:
+                delay = min(self.restart_max_delay, self.restart_base_delay * 2 ** (worker["deaths"] - 1))
+                worker["restart_at"] = time.monotonic() + delay
+                print(f"Worker {slot} exited with code {exit_code}, restarting in {delay:.1f}s", file=sys.stderr)
+        if key is not None:
+            self._finish(key, {"error": {"code": WORKER_DIED, "message": f"Worker process exited with code {exit_code}"}})
+        for queued in abandoned:
+            self._finish(queued, {"error": self._unavailable_error()})
+
+    def _respawn_due(self):
+        """
+        Start the replacement workers whose backoff has elapsed
+        """
+        with self._lock:
+            now = time.monotonic()
+            for slot, worker in list(self._workers.items()):
+                if worker["restart_at"] is not None and worker["restart_at"] <= now and not self._stopping:
+                    self._spawn(slot)
+                    self.stats_counts["restarts"] += 1
+
+    def stats(self):
+        """
+        Pool, worker and queue counters
+        """
+        with self._lock:
+            now = time.time()
+            waiting = [now - self._jobs[key]["submitted"] for key in self._queue]
+            return {
+                "pool_size": self.pool_size,
+                "workers": [{
+                    "slot": slot,
+                    "pid": worker["process"].pid,
+                    "alive": worker["process"].is_alive(),
+                    "ready": worker["ready"],
+                    "busy": worker["job"] is not None,
+                    "warmup_seconds": worker["warmup_seconds"],
+                    "jobs": worker["jobs"],
+                    "deaths_in_a_row": worker["deaths"],
+                    "restarting": worker["restart_at"] is not None,
+                    "gave_up": worker["gave_up"]
+                } for slot, worker in sorted(self._workers.items())],
+                "queued": len(waiting),
+                "running": sum(1 for worker in self._workers.values() if worker["job"] is not None),
+                "oldest_queued_seconds": round(max(waiting), 3) if waiting else 0.0,
+                **self.stats_counts
+            }
+
+    def drain(self, timeout=None):
+        """
+        Wait until every submitted job has been answered
+        """
+        with self._lock:
+            return self._lock.wait_for(lambda: not self._jobs, timeout)
+
+    def shutdown(self, timeout=10):
+        """
+        Stop the workers once their running jobs are finished (terminating those still busy
+        after timeout); results that arrive meanwhile are still delivered, and queued jobs
+        are left unanswered
+        """
+        self._stopping = True
+        for worker in self._workers.values():
+            if worker["conn"] is None:
+                continue
+            try:
+                worker["conn"].send(None)
+            except OSError:
+                pass
+        for worker in self._workers.values():
+            worker["process"].join(timeout)
+            if worker["process"].is_alive():
+                worker["process"].terminate()
+        if self._dispatcher.is_alive():
+            self._dispatcher.join(timeout)
+
+def handle_message(pool, line, send, on_shutdown):
+    """
+    Handle one JSON-RPC request line; responses and events are passed to send
+    """
+    try:
+        message = json.loads(line)
+    except ValueError as e:
+        send({"jsonrpc": "2.0", "id": None, "error": {"code": PARSE_ERROR, "message": f"Parse error: {e}"}})
+        return
+
+    if not isinstance(message, dict) or not isinstance(message.get("method"), str):
+        send({"jsonrpc": "2.0", "id": None, "error": {"code": INVALID_REQUEST, "message": "Invalid request"}})
+        return
+
+    request_id = message.get("id")
+    method = message["method"]
+    params = message.get("params") or {}
+
+    if method == "run":
+        script = script_module_name(params.get("script", "")) if isinstance(params, dict) else None
+        argv = params.get("args", []) if isinstance(params, dict) else None
+        if script is None or not isinstance(argv, list):
+            send({"jsonrpc": "2.0", "id": request_id, "error": {
+                "code": INVALID_PARAMS,
+                "message": f"params must be {{\"script\": one of {list(WORKER_SCRIPTS)}, \"args\": [...]}}"
+            }})
+            return
+        pool.submit(script, [str(arg) for arg in argv], request_id, send)
+    elif method == "ping":
+        send({"jsonrpc": "2.0", "id": request_id, "result": {"pong": True, "pid": os.getpid()}})
+    elif method == "stats":
+        send({"jsonrpc": "2.0", "id": request_id, "result": pool.stats()})
+    elif method == "shutdown":
+        send({"jsonrpc": "2.0", "id": request_id, "result": {"stopping": True}})
+        on_shutdown()
+    else:
+        send({"jsonrpc": "2.0", "id": request_id, "error": {"code": METHOD_NOT_FOUND, "message": f"Unknown method: {method}"}})
+
+def line_sender(stream):
+    """
+    send() writing one JSON message per line to stream, safe to call from several threads;
+    messages for a client that has gone away are dropped
+    """
+    lock = threading.Lock()
+
+    def send(message):
+        data = json.dumps(message, default=str) + "\n"
+        with lock:
+            try:
+                stream.write(data)
+                stream.flush()
+            except (OSError, ValueError):
+                pass
+
+    return send
+
+def serve_stdio(pool):
+    """
+    Read requests from stdin and write responses to stdout until EOF or "shutdown"
+    """
+    send = line_sender(sys.__stdout__)
+    stop = threading.Event()
+    for line in sys.stdin:
+        if line.strip():
+            handle_message(pool, line, send, stop.set)
+        if stop.is_set():
+            break
+    pool.drain()
+
+def serve_socket(pool, socket_path):
+    """
+    Accept any number of client connections on a Unix socket at socket_path
+    """
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            send = line_sender(io.TextIOWrapper(self.wfile, encoding="utf-8", write_through=True))
+            for line in io.TextIOWrapper(self.rfile, encoding="utf-8", errors="replace"):
+                if line.strip():
+                    handle_message(pool, line, send, stop)
+
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    server = socketserver.ThreadingUnixStreamServer(socket_path, Handler)
+    server.daemon_threads = True
+
+    def stop():
+        def finish():
+            pool.drain()
+            server.shutdown()
+        threading.Thread(target=finish, daemon=True).start()
+
+    print(f"Pipeline worker listening on {socket_path}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the pipeline scripts in a pool of warm worker processes")
+    transport = parser.add_mutually_exclusive_group()
+    transport.add_argument("--stdio", action="store_true",
+                           help="Read JSON-RPC requests from stdin and write responses to stdout (default)")
+    transport.add_argument("--socket", metavar="PATH",
+                           help="Listen for JSON-RPC connections on a Unix socket at PATH")
+    parser.add_argument("--pool-size", type=int, default=DEFAULT_POOL_SIZE,
+                        help="Worker processes running jobs in parallel (0 = one per CPU core)")
+    parser.add_argument("--warm-yolo", action="store_true",
+                        help="Load the YOLO models in every worker before accepting jobs")
+    args = parser.parse_args()
+
+    # stdout carries the protocol in stdio mode; keep stray prints off it
+    sys.stdout = sys.stderr
+
+    pool = WorkerPool(args.pool_size, warm_yolo=args.warm_yolo)
+    pool.start()
+    try:
+        if args.socket:
+            serve_socket(pool, args.socket)
+        else:
+            serve_stdio(pool)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pool.shutdown()
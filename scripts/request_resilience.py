@@ -0,0 +1,264 @@
+"""
+Resilient HTTP request layer for the OpenRouter calls
+send_with_retries wraps a single request with exponential backoff and full jitter,
+honours Retry-After on 429/503 responses, draws from a process-wide token bucket so
+concurrent batches stay under a request rate, and consults a circuit breaker that fails
+fast after repeated failures instead of hammering an unhealthy endpoint.
+"""
+
+import sys
+import time
+import random
+import threading
+from email.utils import parsedate_to_datetime
+
+from capabilities import lazy_module
+
+# Only needed once a request fails; imported on first use
+requests = lazy_module("requests")
+
+# Responses worth retrying: timeouts, rate limiting and transient server errors
+RETRYABLE_STATUS_CODES = {408, 409, 425, 429, 500, 502, 503, 504}
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of sending a request while the circuit breaker is open
+    """
+
+def parse_retry_after(value):
+    """
+    Seconds to wait from a Retry-After header (delta-seconds or HTTP date), or None
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError, IndexError, OverflowError):
+        return None
+
+class RetryPolicy:
+    """
+    Exponential backoff with full jitter: attempt n waits uniform(0, min(max_delay, base_delay * 2^n))
+    """
+
+    def __init__(self, max_attempts=4, base_delay=1.0, max_delay=30.0, rng=None):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._rng = rng or random.Random()
+
+    def delay(self, attempt, retry_after=None):
+        """
+        Delay before retry number attempt (0-based); a server-provided Retry-After wins
+        when it is longer than the backoff
+        """
+        backoff = self._rng.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        if retry_after is not None:
+            return min(self.max_delay, max(backoff, retry_after))
+        return backoff
+
+class TokenBucket:
+    """
+    Thread-safe token bucket limiting requests per second across the process
+    rate <= 0 disables limiting
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = max(1.0, capacity if capacity is not None else rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+        self.wait_seconds = 0.0
+
+    def acquire(self):
+        """
+        Block until a token is available, then take it
+        """
+        if self.rate <= 0 and not self._blocked_until:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self._blocked_until:
+                    wait = self._blocked_until - now
+                elif self.rate <= 0:
+                    return
+                else:
+                    self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                    self._updated = now
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    wait = (1 - self._tokens) / self.rate
+                self.wait_seconds += wait
+            time.sleep(wait)
+
+    def defer(self, seconds):
+        """
+        Hold every caller back for seconds, e.g. after a 429 with Retry-After
+        """
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive failures; after reset_timeout one trial
+    request is let through (half-open) and its outcome closes or re-opens the circuit
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """
+        Check whether a request may be sent now
+        """
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = "half_open"
+                self._trial_in_flight = False
+            if self.state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.consecutive_failures = 0
+            self._trial_in_flight = False
+
+    def release_trial(self):
+        """
+        End a request whose outcome says nothing about endpoint health (a client error):
+        frees the half-open trial slot without changing the state or the failure count
+        """
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            self._trial_in_flight = False
+            if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+                if self.state != "open":
+                    self.times_opened += 1
+                    print(f"Circuit breaker opened after {self.consecutive_failures} consecutive failures", file=sys.stderr)
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+    def retry_in(self):
+        """
+        Seconds until an open circuit allows a trial request
+        """
+        with self._lock:
+            if self.state != "open":
+                return 0.0
+            return max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+class RequestStats:
+    """
+    Thread-safe counters describing retries and failures
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counts = {"requests": 0, "attempts": 0, "retries": 0, "rate_limited": 0, "server_errors": 0,
+                           "network_errors": 0, "circuit_rejections": 0, "failures": 0, "backoff_seconds": 0.0}
+
+    def add(self, name, amount=1):
+        with self._lock:
+            self.counts[name] += amount
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.counts)
+
+def send_with_retries(send, policy, limiter=None, breaker=None, stats=None, label="request"):
+    """
+    Call send() (which performs one HTTP request and returns a requests.Response) until it
+    yields a non-retryable response or attempts run out
+    The last response is returned even if it is an error; network errors are re-raised
+    after the final attempt. Raises CircuitOpenError when the breaker stays open longer
+    than the remaining backoff budget.
+    """
+    stats = stats or RequestStats()
+    stats.add("requests")
+    last_error = None
+    for attempt in range(policy.max_attempts):
+        if breaker is not None:
+            # Wait (without using up an attempt) while the circuit is open or another
+            # request holds the half-open trial, up to max_delay in total
+            waited = 0.0
+            while not breaker.allow():
+                wait = max(breaker.retry_in(), policy.base_delay / 4)
+                if waited + wait > policy.max_delay:
+                    stats.add("circuit_rejections")
+                    stats.add("failures")
+                    raise CircuitOpenError(f"{label}: circuit open, retry in {breaker.retry_in():.1f}s")
+                time.sleep(wait)
+                waited += wait
+            stats.add("backoff_seconds", waited)
+
+        if limiter is not None:
+            limiter.acquire()
+
+        stats.add("attempts")
+        retry_after = None
+        try:
+            response = send()
+        except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+            stats.add("network_errors")
+            last_error = e
+            response = None
+        else:
+            if response.status_code not in RETRYABLE_STATUS_CODES:
+                if breaker is not None:
+                    if 200 <= response.status_code < 300:
+                        breaker.record_success()
+                    else:
+                        # Client errors (bad key, bad payload) say nothing about endpoint health
+                        breaker.release_trial()
+                return response
+            if response.status_code == 429:
+                stats.add("rate_limited")
+            else:
+                stats.add("server_errors")
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            if retry_after is not None and limiter is not None:
+                limiter.defer(retry_after)
+
+        if breaker is not None:
+            breaker.record_failure()
+
+        if attempt + 1 >= policy.max_attempts:
+            stats.add("failures")
+            if response is not None:
+                return response
+            raise last_error
+
+        delay = policy.delay(attempt, retry_after)
+        reason = f"HTTP {response.status_code}" if response is not None else type(last_error).__name__
+        print(f"{label}: {reason}, retry {attempt + 1}/{policy.max_attempts - 1} in {delay:.2f}s", file=sys.stderr)
+        stats.add("retries")
+        stats.add("backoff_seconds", delay)
+        time.sleep(delay)
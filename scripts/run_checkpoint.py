@@ -0,0 +1,156 @@
+"""
+Per-stage checkpoints for resumable analysis runs
+An analysis run writes what each stage produced to <frames_dir>/.checkpoint as it goes: the
+selected unique-frame list, each batch's YOLO detections and each successful batch's LLM
+answer. A run started with resume=True whose settings match (same frames, same options,
+same prompt and models) reuses them and only redoes the work that had not finished, so a
+crash or timeout late in a job does not pay again for earlier YOLO inference and API calls.
+Every file is written to a temporary name, fsynced and renamed into place, so a crash
+mid-write leaves either the previous file or none, never a partial one.
+"""
+
+import os
+import sys
+import json
+import threading
+
+CHECKPOINT_DIR_NAME = ".checkpoint"
+MANIFEST_NAME = "manifest.json"
+
+def write_json_atomic(path, value):
+    """
+    Write value as JSON to path so that readers see either the old file or the complete
+    new one
+    """
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(value, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+def read_json(path):
+    """
+    Parsed JSON from path, or None if it is missing or unreadable
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+class RunCheckpoint:
+    """
+    Checkpoint files of one analysis run in a frames directory
+    run_fingerprint identifies the settings the checkpoints are valid for; with resume
+    they are reused when it matches, otherwise any old checkpoints are discarded.
+    """
+
+    def __init__(self, frames_dir, run_fingerprint, resume=False):
+        self.directory = os.path.join(frames_dir, CHECKPOINT_DIR_NAME)
+        self.run_fingerprint = run_fingerprint
+        self.reused = {"selection": 0, "yolo_batches": 0, "llm_batches": 0}
+        self.writes = 0
+        self.errors = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+        manifest = read_json(os.path.join(self.directory, MANIFEST_NAME))
+        self.resumed = bool(resume and manifest and manifest.get("fingerprint") == run_fingerprint)
+        if resume and not self.resumed:
+            print("No matching checkpoint to resume from; starting a fresh run", file=sys.stderr)
+        if not self.resumed:
+            self._clear()
+            self._write(MANIFEST_NAME, {"fingerprint": run_fingerprint})
+
+    def _clear(self):
+        for name in os.listdir(self.directory):
+            if name.endswith(".json") or name.endswith(".tmp"):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+
+    def _write(self, name, value):
+        try:
+            write_json_atomic(os.path.join(self.directory, name), value)
+            self.writes += 1
+        except (OSError, TypeError, ValueError) as e:
+            # A checkpoint that cannot be written only costs the ability to resume
+            self.errors += 1
+            print(f"Could not write checkpoint {name}: {e}", file=sys.stderr)
+
+    def _read(self, name, frames=None):
+        """
+        Stored value of a checkpoint file, or None if there is none to resume from (or it
+        was written for different frames)
+        """
+        if not self.resumed:
+            return None
+        value = read_json(os.path.join(self.directory, name))
+        if value is None or (frames is not None and value.get("frames") != frames):
+            return None
+        return value
+
+    @staticmethod
+    def _batch_name(kind, frames_data, start, end):
+        return f"{kind}_{start:05d}_{end:05d}.json", [frame["filename"] for frame in frames_data]
+
+    def load_selection(self):
+        """
+        Stored frame selection ({"filtered_count", "unique_frame_files", "frame_selection"}) or None
+        """
+        selection = self._read("selection.json")
+        if selection is not None:
+            self.reused["selection"] += 1
+        return selection
+
+    def save_selection(self, filtered_count, unique_frame_files, frame_selection):
+        self._write("selection.json", {
+            "filtered_count": filtered_count,
+            "unique_frame_files": unique_frame_files,
+            "frame_selection": frame_selection
+        })
+
+    def load_yolo(self, frames_data, start, end):
+        """
+        Stored YOLO detections for the batch of frames_data[start:end], or None
+        """
+        name, frames = self._batch_name("yolo", frames_data[start:end], start, end)
+        stored = self._read(name, frames)
+        if stored is None:
+            return None
+        self.reused["yolo_batches"] += 1
+        return stored["detections"]
+
+    def save_yolo(self, frames_data, start, end, detections):
+        name, frames = self._batch_name("yolo", frames_data[start:end], start, end)
+        self._write(name, {"frames": frames, "detections": detections})
+
+    def load_batch(self, frames_data, start, end):
+        """
+        Stored successful LLM result for the batch of frames_data[start:end], or None
+        """
+        name, frames = self._batch_name("batch", frames_data[start:end], start, end)
+        stored = self._read(name, frames)
+        if stored is None:
+            return None
+        self.reused["llm_batches"] += 1
+        return stored["result"]
+
+    def save_batch(self, frames_data, start, end, result):
+        name, frames = self._batch_name("batch", frames_data[start:end], start, end)
+        self._write(name, {"frames": frames, "result": result})
+
+    def stats(self):
+        return {
+            "enabled": True,
+            "directory": self.directory,
+            "resumed": self.resumed,
+            "reused": dict(self.reused),
+            "writes": self.writes,
+            "errors": self.errors
+        }
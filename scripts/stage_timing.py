@@ -0,0 +1,179 @@
+"""
+Stage timing and profiling for the pipeline scripts
+StageTimer records how long each named stage took and named counters; summary() is
+returned as the "timings" block of a script's result. Stages may be recorded from several
+threads, and timers from worker processes are folded in with merge(). Two environment
+variables turn on deeper profiling for a run:
+
+    PIPELINE_PROFILE=<path>   dump cProfile stats of the main thread (pstats format)
+    PIPELINE_TRACE=<path>     write the recorded stages as a Chrome trace (chrome://tracing, Perfetto)
+
+"{label}" in either path is replaced by the script name, so one setting serves both scripts.
+"""
+
+import os
+import sys
+import json
+import time
+import cProfile
+import threading
+from contextlib import contextmanager
+
+PROFILE_ENV = "PIPELINE_PROFILE"
+TRACE_ENV = "PIPELINE_TRACE"
+
+# Upper bounds (milliseconds) of the duration histogram buckets
+HISTOGRAM_BUCKETS_MS = (1, 5, 10, 50, 100, 500, 1000, 5000)
+
+def _percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def _histogram(durations):
+    buckets = {f"<={bound}ms": 0 for bound in HISTOGRAM_BUCKETS_MS}
+    buckets[f">{HISTOGRAM_BUCKETS_MS[-1]}ms"] = 0
+    for seconds in durations:
+        milliseconds = seconds * 1000
+        for bound in HISTOGRAM_BUCKETS_MS:
+            if milliseconds <= bound:
+                buckets[f"<={bound}ms"] += 1
+                break
+        else:
+            buckets[f">{HISTOGRAM_BUCKETS_MS[-1]}ms"] += 1
+    return {name: count for name, count in buckets.items() if count}
+
+class StageTimer:
+    """
+    Thread-safe per-stage durations and counters, with optional trace events
+    """
+
+    def __init__(self, trace=None):
+        self._lock = threading.Lock()
+        self.trace = bool(os.environ.get(TRACE_ENV)) if trace is None else trace
+        self.reset()
+
+    def reset(self):
+        """
+        Drop everything recorded so far (a new run, or a forked worker process)
+        """
+        with self._lock:
+            self._durations = {}
+            self.counters = {}
+            self._events = []
+            self._origin = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Time the enclosed block as one occurrence of stage name
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start, start)
+
+    def record(self, name, seconds, start=None):
+        """
+        Record one occurrence of a stage that took seconds (started at perf_counter start)
+        """
+        with self._lock:
+            self._durations.setdefault(name, []).append(seconds)
+            if self.trace:
+                start = time.perf_counter() - seconds if start is None else start
+                self._events.append({
+                    "name": name, "ph": "X", "pid": os.getpid(), "tid": threading.get_ident(),
+                    "ts": (start - self._origin) * 1e6, "dur": seconds * 1e6
+                })
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def export(self):
+        """
+        Picklable copy of the raw records, for returning from a worker process
+        """
+        with self._lock:
+            return {
+                "durations": {name: list(values) for name, values in self._durations.items()},
+                "counters": dict(self.counters),
+                "events": list(self._events),
+                "origin": self._origin
+            }
+
+    def merge(self, exported):
+        """
+        Add records exported by another timer (e.g. a worker process)
+        """
+        with self._lock:
+            for name, values in exported["durations"].items():
+                self._durations.setdefault(name, []).extend(values)
+            for name, amount in exported["counters"].items():
+                self.counters[name] = self.counters.get(name, 0) + amount
+            # perf_counter is a system-wide monotonic clock on Linux, so worker events can be
+            # placed on this timer's timeline
+            shift = (exported["origin"] - self._origin) * 1e6
+            self._events.extend({**event, "ts": event["ts"] + shift} for event in exported["events"])
+
+    def summary(self):
+        """
+        Per-stage count, total, mean, min, max, p50, p95 and duration histogram, plus counters
+        """
+        with self._lock:
+            stages = {}
+            for name, values in self._durations.items():
+                ordered = sorted(values)
+                total = sum(ordered)
+                stages[name] = {
+                    "count": len(ordered),
+                    "total_seconds": round(total, 4),
+                    "mean_ms": round(total / len(ordered) * 1000, 3),
+                    "min_ms": round(ordered[0] * 1000, 3),
+                    "max_ms": round(ordered[-1] * 1000, 3),
+                    "p50_ms": round(_percentile(ordered, 0.5) * 1000, 3),
+                    "p95_ms": round(_percentile(ordered, 0.95) * 1000, 3),
+                    "histogram": _histogram(ordered)
+                }
+            return {"stages": stages, "counters": dict(self.counters)}
+
+    def write_trace(self, path):
+        """
+        Write the recorded stages as Chrome trace events
+        """
+        with self._lock:
+            events = list(self._events)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+def _output_path(env_name, label):
+    path = os.environ.get(env_name)
+    return path.replace("{label}", label) if path else None
+
+@contextmanager
+def profile_run(timer, label):
+    """
+    Profile the enclosed run with cProfile and/or write a Chrome trace of timer afterwards,
+    as requested by PIPELINE_PROFILE and PIPELINE_TRACE
+    """
+    profile_path = _output_path(PROFILE_ENV, label)
+    trace_path = _output_path(TRACE_ENV, label)
+    profiler = cProfile.Profile() if profile_path else None
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            try:
+                profiler.dump_stats(profile_path)
+                print(f"Wrote cProfile stats to {profile_path}", file=sys.stderr)
+            except OSError as e:
+                print(f"Could not write cProfile stats to {profile_path}: {e}", file=sys.stderr)
+        if trace_path:
+            try:
+                timer.write_trace(trace_path)
+                print(f"Wrote Chrome trace to {trace_path}", file=sys.stderr)
+            except OSError as e:
+                print(f"Could not write Chrome trace to {trace_path}: {e}", file=sys.stderr)
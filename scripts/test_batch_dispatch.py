@@ -0,0 +1,40 @@
+"""
+Concurrent OpenRouter batch dispatch against the mock server: the thread pool stays within
+max_concurrency, and frameDetails come back in frame order however the batches finish
+"""
+
+import analyze_frames_openrouter as analyzer
+from request_resilience import RetryPolicy
+
+def frame_indexes(frame_details):
+    return [detail["frameIndex"] for detail in frame_details]
+
+def test_dispatch_stays_within_max_concurrency(mock_openrouter, frames_data, pipeline_event_log):
+    server = mock_openrouter(latency=0.05, latency_jitter=0.2, seed=3)
+
+    frame_details, _, timings = analyzer.process_frames_in_batches(frames_data, "test-key", batch_size=2, max_concurrency=3)
+
+    assert server.request_count == 12
+    assert 1 < server.peak_concurrency <= 3
+    assert timings["max_concurrency"] == 3
+    assert timings["failed_batches"] == 0
+
+    # Jittered latency makes batches finish out of order; the merge must not follow suit
+    completed = [event["batch_num"] for event in pipeline_event_log if event["event"] == "batch"]
+    assert sorted(completed) == list(range(12))
+    assert completed != sorted(completed)
+    assert frame_indexes(frame_details) == list(range(len(frames_data)))
+
+def test_requeued_batches_keep_frame_order(mock_openrouter, frames_data, monkeypatch):
+    # One attempt per request, so the injected failures fail their batches and the
+    # requeue pass has to recover them
+    monkeypatch.setattr(analyzer, "_retry_policy", RetryPolicy(max_attempts=1, base_delay=0.01, max_delay=0.5))
+    server = mock_openrouter(latency=0.02, latency_jitter=0.1, fail_first=3, seed=5)
+
+    frame_details, _, timings = analyzer.process_frames_in_batches(frames_data, "test-key", batch_size=2, max_concurrency=3)
+
+    assert timings["requeued_batches"] == 3
+    assert timings["failed_batches"] == 0
+    assert server.request_count == 15
+    assert server.peak_concurrency <= 3
+    assert frame_indexes(frame_details) == list(range(len(frames_data)))
@@ -0,0 +1,76 @@
+"""
+Chunked process-pool extraction must save exactly the frames a sequential run saves
+The synthetic video is a series of static scenes, so every chunk boundary falls inside a
+run of similar frames where a worker starting from an empty reference decides differently
+from the sequential run and the boundary replay has to reconcile the two.
+"""
+
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+import extract_frames_opencv as extractor
+
+FPS = 5
+FRAME_SIZE = (320, 240)
+SCENE_SECONDS = 7
+# Long enough for four chunks of MIN_CHUNK_DURATION
+DURATION = 4 * extractor.MIN_CHUNK_DURATION + 10
+
+def write_scene_video(path, seed=0):
+    """
+    Static blocky scenes of SCENE_SECONDS each with light sensor noise
+    """
+    rng = np.random.default_rng(seed)
+    width, height = FRAME_SIZE
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), FPS, FRAME_SIZE)
+    scene = None
+    try:
+        for index in range(DURATION * FPS):
+            if index % (SCENE_SECONDS * FPS) == 0:
+                blocks = rng.integers(40, 220, (height // 16, width // 16, 3), dtype=np.uint8)
+                scene = cv2.resize(blocks, FRAME_SIZE, interpolation=cv2.INTER_NEAREST)
+            writer.write(cv2.add(scene, rng.integers(0, 4, (height, width, 3), dtype=np.uint8)))
+    finally:
+        writer.release()
+
+@pytest.fixture(scope="module")
+def scene_video(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("video") / "scenes.mp4")
+    write_scene_video(path)
+    return path
+
+def extract(video_path, output_dir, workers):
+    os.makedirs(output_dir)
+    result = extractor.extract_frames_with_opencv(video_path, output_dir, workers=workers, include_base64=False)
+    assert result["success"], result.get("error")
+    return result
+
+def test_chunk_boundaries_need_reconciling(scene_video):
+    """
+    A worker on its own skips similar frames at the start of its chunk that the sequential
+    run saves, so the equivalence below depends on the boundary replay
+    """
+    sample_times = list(extractor.iter_sample_times(DURATION, 1))
+    chunk_times = extractor.split_sample_times(sample_times, 4)
+    sequential = {record["time"]: record["decision"]
+                  for record in extractor._extract_chunk(scene_video, sample_times, FPS, "sequential", 0.70)["records"]}
+
+    mismatched = 0
+    for times in chunk_times[1:]:
+        worker = extractor._extract_chunk(scene_video, times, FPS, "sequential", 0.70)
+        mismatched += sum(record["decision"] != sequential[record["time"]] for record in worker["records"])
+    assert mismatched > 0
+
+def test_parallel_extraction_matches_sequential(scene_video, tmp_path):
+    sequential = extract(scene_video, str(tmp_path / "sequential"), workers=1)
+    parallel = extract(scene_video, str(tmp_path / "parallel"), workers=4)
+
+    assert sequential["video_info"]["parallel_chunks"] == 1
+    assert parallel["video_info"]["parallel_chunks"] == 4
+    assert [frame["time"] for frame in parallel["frames"]] == [frame["time"] for frame in sequential["frames"]]
+    assert [frame["filename"] for frame in parallel["frames"]] == [frame["filename"] for frame in sequential["frames"]]
+    assert parallel["frames_skipped"] == sequential["frames_skipped"]
+    assert sorted(os.listdir(tmp_path / "parallel")) == sorted(os.listdir(tmp_path / "sequential"))
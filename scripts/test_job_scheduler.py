@@ -0,0 +1,75 @@
+"""
+Scheduler shutdown: a job whose worker finishes while the pools shut down is recorded as
+finished, and only jobs that really did not finish are queued again
+"""
+
+import queue
+import time
+
+import cv2
+import numpy as np
+import pytest
+
+from job_scheduler import JobQueue, Scheduler
+
+@pytest.fixture
+def short_video(tmp_path):
+    path = str(tmp_path / "short.mp4")
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), 5, (160, 120))
+    try:
+        for index in range(15):
+            writer.write(np.full((120, 160, 3), index * 15, dtype=np.uint8))
+    finally:
+        writer.release()
+    return path
+
+@pytest.fixture
+def job_queue(tmp_path):
+    job_queue = JobQueue(str(tmp_path / "jobs.sqlite3"))
+    yield job_queue
+    job_queue.close()
+
+def interrupt_scheduler(scheduler, monkeypatch, when):
+    """
+    Make the scheduler loop stop as on Ctrl-C the first time it waits for a completion
+    after when(scheduler) is true
+    """
+    completions = scheduler._completions
+
+    def get(block=True, timeout=None):
+        if block:
+            deadline = time.monotonic() + 30
+            while not when(scheduler):
+                assert time.monotonic() < deadline
+                time.sleep(0.01)
+            raise KeyboardInterrupt
+        return queue.Queue.get(completions, block, timeout)
+
+    monkeypatch.setattr(completions, "get", get)
+
+def test_job_finished_during_shutdown_is_recorded(job_queue, short_video, tmp_path, monkeypatch):
+    job_queue.submit("job", str(tmp_path / "frames"), video_path=short_video)
+    scheduler = Scheduler(job_queue, "test-key", extract_workers=1, analyze_workers=1)
+    # Stop while the extraction is running in its worker
+    interrupt_scheduler(scheduler, monkeypatch, lambda scheduler: scheduler.pools["extract"].stats()["running"])
+
+    with pytest.raises(KeyboardInterrupt):
+        scheduler.run()
+
+    job = job_queue.get("job")
+    assert (job["stage"], job["state"]) == ("analyze", "queued")
+    assert job["extract_summary"]["success"]
+    assert job_queue.metrics()["stages"]["extract"]["completed_last_hour"] == 1
+
+def test_job_not_finished_is_queued_again(job_queue, short_video, tmp_path, monkeypatch):
+    job_queue.submit("job", str(tmp_path / "frames"), video_path=short_video)
+    scheduler = Scheduler(job_queue, "test-key", extract_workers=1, analyze_workers=1)
+    # Stop before any worker is ready, so the job never reaches one
+    interrupt_scheduler(scheduler, monkeypatch, lambda scheduler: True)
+
+    with pytest.raises(KeyboardInterrupt):
+        scheduler.run()
+
+    job = job_queue.get("job")
+    assert (job["stage"], job["state"], job["attempts"]) == ("extract", "queued", 1)
+    assert job_queue.metrics()["stages"]["extract"]["completed_last_hour"] == 0
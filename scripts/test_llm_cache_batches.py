@@ -0,0 +1,68 @@
+"""
+Batches served partly from the LLM response cache: answers land on the right frames, and a
+response with the wrong number of frameDetails fails the batch and is never cached, whether
+the whole batch or only part of it was sent
+"""
+
+import pytest
+
+import analyze_frames_openrouter as analyzer
+from llm_response_cache import LLMResponseCache
+
+def make_frames(names):
+    return [{"filename": name, "image_base64": name.encode().hex(), "timestamp": f"00m{10 + i:02d}s"}
+            for i, name in enumerate(names)]
+
+class CallLog(list):
+    drop_last = False
+
+@pytest.fixture
+def openrouter_calls(monkeypatch):
+    """
+    Stand-in for analyze_batch_with_openrouter that answers with each frame's filename;
+    set drop_last to leave the last frame out of multi-frame answers
+    """
+    calls = CallLog()
+
+    def analyze(batch_frames, api_key, batch_num, start_frame_idx, yolo_detections=None, max_tokens=None):
+        calls.append((start_frame_idx, len(batch_frames)))
+        answered = batch_frames[:-1] if calls.drop_last and len(batch_frames) > 1 else batch_frames
+        return {"success": True, "analysis": {"frameDetails": [
+            {"frameIndex": start_frame_idx + i, "timestamp": "99:99", "observation": frame["filename"]}
+            for i, frame in enumerate(answered)
+        ]}}
+
+    monkeypatch.setattr(analyzer, "analyze_batch_with_openrouter", analyze)
+    return calls
+
+@pytest.fixture
+def response_cache(tmp_path):
+    return LLMResponseCache(cache_dir=str(tmp_path / "llm-cache"))
+
+def test_misses_are_sent_as_runs_at_their_real_positions(openrouter_calls, response_cache):
+    analyzer.analyze_batch_with_cache(make_frames(["b", "d"]), "key", 0, 0, None, response_cache)
+    openrouter_calls.clear()
+
+    result = analyzer.analyze_batch_with_cache(make_frames(["a", "b", "c", "d", "e", "f"]), "key", 1, 10, None, response_cache)
+
+    assert result["success"]
+    assert result["cache_hits"] == 2
+    assert openrouter_calls == [(10, 1), (12, 1), (14, 2)]
+    assert [(d["frameIndex"], d["timestamp"], d["observation"]) for d in result["analysis"]["frameDetails"]] == [
+        (10 + i, f"00:{10 + i}", name) for i, name in enumerate("abcdef")
+    ]
+
+@pytest.mark.parametrize("names, error", [
+    (["x", "y", "z"], "expected 3 frame details for frames 20-22, got 2"),
+    (["x", "y", "cached", "z", "w"], "expected 2 frame details for frames 20-21, got 1"),
+], ids=["full-miss", "partial"])
+def test_wrong_detail_count_fails_and_is_not_cached(openrouter_calls, response_cache, names, error):
+    analyzer.analyze_batch_with_cache(make_frames(["cached"]), "key", 0, 0, None, response_cache)
+    openrouter_calls.drop_last = True
+
+    result = analyzer.analyze_batch_with_cache(make_frames(names), "key", 1, 20, None, response_cache)
+
+    assert not result["success"]
+    assert result["retryable"]
+    assert error in result["error"]
+    assert response_cache.stats()["entries"] == 1
@@ -0,0 +1,102 @@
+"""
+Worker pool restarts: a worker that keeps dying before it is ready is restarted with
+exponential backoff and given up after max_restarts, failing the jobs waiting for it
+"""
+
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+import pipeline_worker
+
+def crash_until_started(slot, conn, warm_yolo):
+    """
+    Worker entry point that exits as a failing import would, CRASH_COUNT_FILE counting the
+    attempts, until CRASH_LIMIT attempts have failed; then it starts as a normal worker
+    """
+    path = os.environ["CRASH_COUNT_FILE"]
+    with open(path, "a") as counter:
+        counter.write(f"{time.monotonic()}\n")
+    with open(path) as counter:
+        attempts = len(counter.readlines())
+    if attempts <= int(os.environ["CRASH_LIMIT"]):
+        sys.exit(3)
+    pipeline_worker._worker_main(slot, conn, warm_yolo)
+
+class Responses:
+    """
+    send() callback collecting the final response for each request id
+    """
+
+    def __init__(self):
+        self.messages = {}
+        self._done = threading.Condition()
+
+    def __call__(self, message):
+        if "method" not in message:
+            with self._done:
+                self.messages[message["id"]] = message
+                self._done.notify_all()
+
+    def wait(self, request_id, timeout=30):
+        with self._done:
+            assert self._done.wait_for(lambda: request_id in self.messages, timeout)
+            return self.messages[request_id]
+
+@pytest.fixture
+def crashing_pool(monkeypatch, tmp_path):
+    pools = []
+
+    def start(crash_limit, **options):
+        monkeypatch.setenv("CRASH_COUNT_FILE", str(tmp_path / "attempts"))
+        monkeypatch.setenv("CRASH_LIMIT", str(crash_limit))
+        monkeypatch.setattr(pipeline_worker, "_worker_main", crash_until_started)
+        pool = pipeline_worker.WorkerPool(pool_size=1, **options)
+        pools.append(pool)
+        pool.start()
+        return pool
+
+    yield start
+    for pool in pools:
+        pool.shutdown()
+
+def attempt_times(tmp_path):
+    return [float(line) for line in (tmp_path / "attempts").read_text().split()]
+
+def test_gives_up_after_max_restarts_and_fails_queued_jobs(crashing_pool, tmp_path):
+    pool = crashing_pool(crash_limit=100, max_restarts=3, restart_base_delay=0.1)
+    responses = Responses()
+    pool.submit("extract_frames_opencv", ["--help"], 1, responses)
+
+    error = responses.wait(1)["error"]
+    assert error["code"] == pipeline_worker.WORKERS_UNAVAILABLE
+
+    # Four starts: the first, then restarts after 0.1, 0.2 and 0.4 seconds
+    times = attempt_times(tmp_path)
+    assert len(times) == 4
+    gaps = [later - earlier for earlier, later in zip(times, times[1:])]
+    assert all(gap >= delay for gap, delay in zip(gaps, (0.1, 0.2, 0.4)))
+
+    stats = pool.stats()
+    assert stats["restarts"] == 3
+    assert stats["workers"][0]["gave_up"]
+
+    # New jobs fail straight away instead of waiting for a worker that will not come
+    pool.submit("extract_frames_opencv", ["--help"], 2, responses)
+    assert responses.wait(2, timeout=1)["error"]["code"] == pipeline_worker.WORKERS_UNAVAILABLE
+    assert len(attempt_times(tmp_path)) == 4
+
+def test_worker_that_starts_after_restarts_runs_jobs(crashing_pool, tmp_path):
+    pool = crashing_pool(crash_limit=2, max_restarts=3, restart_base_delay=0.05)
+    responses = Responses()
+    pool.submit("extract_frames_opencv", ["--bogus"], 1, responses)
+
+    # Reaching the worker at all shows it recovered; the bad arguments are its own answer
+    assert responses.wait(1, timeout=60)["error"]["code"] == pipeline_worker.INVALID_PARAMS
+    stats = pool.stats()
+    assert stats["restarts"] == 2
+    assert stats["workers"][0]["ready"]
+    assert stats["workers"][0]["deaths_in_a_row"] == 0
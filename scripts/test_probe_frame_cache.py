@@ -0,0 +1,79 @@
+"""
+Probe frames kept by the adaptive scene-change scan: keyed by exact frame index, held
+within the byte cap for the highest-change probes, and reused without changing which
+frames are extracted
+"""
+
+import os
+from functools import partial
+
+import cv2
+import numpy as np
+import pytest
+
+import extract_frames_opencv as extractor
+
+FPS = 30000 / 1001
+FRAME_SIZE = (160, 120)
+FRAME_BYTES = FRAME_SIZE[0] * FRAME_SIZE[1] * 3
+
+@pytest.fixture(scope="module")
+def cut_video(tmp_path_factory):
+    """
+    20 seconds of flat scenes with a hard cut every 2.5 seconds and slow brightness drift
+    """
+    path = str(tmp_path_factory.mktemp("video") / "cuts.mp4")
+    rng = np.random.default_rng(1)
+    width, height = FRAME_SIZE
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), FPS, FRAME_SIZE)
+    try:
+        for index in range(round(20 * FPS)):
+            if index % round(2.5 * FPS) == 0:
+                scene = rng.integers(30, 200, (height // 20, width // 20, 3), dtype=np.uint8)
+                scene = cv2.resize(scene, FRAME_SIZE, interpolation=cv2.INTER_NEAREST)
+            writer.write(cv2.add(scene, np.full_like(scene, index % 20)))
+    finally:
+        writer.release()
+    return path
+
+def test_probe_times_map_back_to_their_frames():
+    for fps in (24000 / 1001, 25, 30000 / 1001, 29.97, 59.94, 60):
+        positions = range(0, 200000, 7)
+        assert [extractor.frame_number_at(position / fps, fps) for position in positions] == list(positions)
+
+def test_scan_keeps_first_and_highest_change_probes(cut_video):
+    cap = cv2.VideoCapture(cut_video)
+    probe_frames = {}
+    try:
+        probe_times, changes = extractor.scan_scene_changes(cap, FPS, probe_frames=probe_frames,
+                                                            probe_frame_bytes=9 * FRAME_BYTES)
+    finally:
+        cap.release()
+
+    assert len(probe_frames) == 9
+    assert all(isinstance(frame_number, int) for frame_number in probe_frames)
+    kept = {extractor.frame_number_at(probe_time, FPS): change for probe_time, change in zip(probe_times, changes)}
+    assert 0 in probe_frames
+    # The scene cuts outrank every probe inside a scene
+    kept_changes = [kept[frame_number] for frame_number in probe_frames if frame_number != 0]
+    dropped_changes = [change for frame_number, change in kept.items() if frame_number not in probe_frames]
+    assert min(kept_changes) >= max(dropped_changes)
+
+def test_reused_probe_frames_extract_the_same_frames(cut_video, tmp_path, monkeypatch):
+    def extract(name):
+        output_dir = str(tmp_path / name)
+        os.makedirs(output_dir)
+        result = extractor.extract_frames_with_opencv(cut_video, output_dir, sampling="adaptive")
+        assert result["success"], result.get("error")
+        return result
+
+    scan = extractor.scan_scene_changes
+    monkeypatch.setattr(extractor, "scan_scene_changes", partial(scan, probe_frame_bytes=0))
+    decoded = extract("decoded")
+    monkeypatch.setattr(extractor, "scan_scene_changes", partial(scan, probe_frame_bytes=4 * FRAME_BYTES))
+    partly_kept = extract("partly_kept")
+
+    assert decoded["video_info"]["probe_frames_reused"] == 0
+    assert 0 < partly_kept["video_info"]["probe_frames_reused"] < partly_kept["video_info"]["samples_planned"]
+    assert [frame["time"] for frame in partly_kept["frames"]] == [frame["time"] for frame in decoded["frames"]]
+    assert [frame["image_base64"] for frame in partly_kept["frames"]] == [frame["image_base64"] for frame in decoded["frames"]]
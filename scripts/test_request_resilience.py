@@ -0,0 +1,124 @@
+"""
+The retry layer against the mock OpenRouter server: backoff honours Retry-After, the token
+bucket caps the request rate, the circuit breaker goes open -> half-open -> closed and only
+a 2xx closes it, and batches retried under injected failures keep their frameDetails order
+"""
+
+import threading
+import time
+
+import pytest
+import requests
+
+import analyze_frames_openrouter as analyzer
+from request_resilience import RetryPolicy, TokenBucket, CircuitBreaker, RequestStats, CircuitOpenError, send_with_retries
+
+# Minimal chat completions body the mock answers with an empty frameDetails list
+PAYLOAD = {"model": "mock", "messages": [{"role": "system", "content": ""}, {"role": "user", "content": []}]}
+
+def poster(url):
+    return lambda: requests.post(url, json=PAYLOAD, timeout=5)
+
+def wrong_path(server):
+    # The mock answers any other path with 404 without counting it as a request
+    return server.url.replace("/chat/completions", "/nowhere")
+
+def test_backoff_waits_for_retry_after(mock_openrouter):
+    server = mock_openrouter(fail_first=2, fail_first_status=429, retry_after=0.3)
+    policy = RetryPolicy(max_attempts=4, base_delay=0.001, max_delay=2.0)
+    stats = RequestStats()
+
+    started = time.monotonic()
+    response = send_with_retries(poster(server.url), policy, TokenBucket(0), stats=stats)
+    elapsed = time.monotonic() - started
+
+    assert response.status_code == 200
+    assert server.request_count == 3
+    counts = stats.snapshot()
+    assert counts["rate_limited"] == 2
+    assert counts["retries"] == 2
+    # Backoff alone would be at most a few milliseconds
+    assert counts["backoff_seconds"] >= 0.6
+    assert elapsed >= 0.6
+
+def test_retry_after_holds_back_other_callers(mock_openrouter):
+    server = mock_openrouter(fail_first=1, fail_first_status=429, retry_after=0.3)
+    limiter = TokenBucket(0)
+    policy = RetryPolicy(max_attempts=1)
+
+    assert send_with_retries(poster(server.url), policy, limiter).status_code == 429
+    started = time.monotonic()
+    assert send_with_retries(poster(server.url), policy, limiter).status_code == 200
+
+    assert time.monotonic() - started >= 0.25
+    assert limiter.wait_seconds >= 0.25
+
+def test_token_bucket_caps_request_rate(mock_openrouter):
+    server = mock_openrouter()
+    limiter = TokenBucket(rate=20, capacity=1)
+    policy = RetryPolicy(max_attempts=1)
+    statuses = []
+
+    def send_requests(count):
+        for _ in range(count):
+            statuses.append(send_with_retries(poster(server.url), policy, limiter).status_code)
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=send_requests, args=(7,)) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    assert statuses == [200] * 21
+    assert server.request_count == 21
+    # The first request takes the initial token; the other 20 arrive at 20 per second
+    assert elapsed >= 0.95
+    assert limiter.wait_seconds > 0
+
+def test_breaker_opens_half_opens_and_closes_only_on_success(mock_openrouter):
+    server = mock_openrouter(fail_first=4)
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=0.2)
+    policy = RetryPolicy(max_attempts=1, base_delay=0.01, max_delay=0.05)
+
+    for _ in range(3):
+        assert send_with_retries(poster(server.url), policy, breaker=breaker).status_code == 500
+    assert breaker.state == "open"
+    assert breaker.times_opened == 1
+
+    # Open: fail fast rather than wait out a reset_timeout longer than max_delay
+    with pytest.raises(CircuitOpenError):
+        send_with_retries(poster(server.url), policy, breaker=breaker)
+    assert server.request_count == 3
+
+    # A client error as the half-open trial says nothing about the endpoint
+    time.sleep(0.2)
+    assert send_with_retries(poster(wrong_path(server)), policy, breaker=breaker).status_code == 404
+    assert breaker.state == "half_open"
+    assert breaker.consecutive_failures == 3
+
+    # A failed trial re-opens the circuit straight away
+    assert send_with_retries(poster(server.url), policy, breaker=breaker).status_code == 500
+    assert breaker.state == "open"
+    assert breaker.times_opened == 2
+
+    time.sleep(0.2)
+    assert send_with_retries(poster(server.url), policy, breaker=breaker).status_code == 200
+    assert breaker.state == "closed"
+    assert breaker.consecutive_failures == 0
+    assert server.request_count == 5
+
+def test_retried_batches_keep_frame_order(mock_openrouter, frames_data):
+    server = mock_openrouter(latency=0.01, latency_jitter=0.05, rate_limit_rate=0.2, fail_rate=0.15,
+                             retry_after=0.02, seed=11)
+
+    frame_details, _, timings = analyzer.process_frames_in_batches(frames_data, "test-key", batch_size=2, max_concurrency=3)
+
+    counts = analyzer._request_stats.snapshot()
+    assert server.failures_injected > 0
+    assert counts["rate_limited"] > 0 and counts["server_errors"] > 0
+    assert counts["retries"] > 0
+    assert timings["failed_batches"] == 0
+    assert [detail["frameIndex"] for detail in frame_details] == list(range(len(frames_data)))
+    assert [detail["timestamp"] for detail in frame_details] == [f"00:{index:02d}" for index in range(len(frames_data))]
@@ -0,0 +1,88 @@
+"""
+Batched YOLO detection must give the same detections, in the same order, as running
+detect_objects_with_yolo one image at a time
+Uses a stub model in place of ultralytics so it runs without weights or torch.
+"""
+
+import zlib
+
+import numpy as np
+import pytest
+
+import analyze_frames_openrouter as analyzer
+
+CLASS_NAMES = {0: "person", 1: "car", 2: "truck", 3: "chair", 4: "bottle", 5: "forklift"}
+IMAGE_SHAPE = (480, 640)
+
+class StubBoxes:
+    def __init__(self, xyxy, conf, cls):
+        self.xyxy = xyxy
+        self.conf = conf
+        self.cls = cls
+
+    def __len__(self):
+        return len(self.conf)
+
+class StubResult:
+    def __init__(self, boxes):
+        self.orig_shape = IMAGE_SHAPE
+        self.boxes = boxes
+
+class StubYOLO:
+    """
+    Deterministic boxes per (image, model); images named "missing*" fail to load and take
+    the whole call down with them, as ultralytics does for an unreadable source
+    """
+
+    def __init__(self, model_path):
+        self.model_path = model_path
+        self.names = CLASS_NAMES
+        self.call_sizes = []
+
+    def __call__(self, sources, conf=0.25, **kwargs):
+        self.call_sizes.append(len(sources))
+        results = []
+        for source in sources:
+            if "missing" in source:
+                raise FileNotFoundError(f"{source} does not exist")
+            rng = np.random.default_rng(zlib.crc32(f"{source}:{self.model_path}".encode()))
+            count = int(rng.integers(4, 12))
+            height, width = IMAGE_SHAPE
+            x1 = rng.uniform(0, width * 0.7, count)
+            y1 = rng.uniform(0, height * 0.7, count)
+            x2 = np.minimum(x1 + rng.uniform(40, width * 0.3, count), width)
+            y2 = np.minimum(y1 + rng.uniform(40, height * 0.3, count), height)
+            confidences = rng.uniform(0.2, 0.95, count)
+            classes = rng.integers(0, len(CLASS_NAMES), count).astype(np.float32)
+            keep = confidences >= conf
+            boxes = StubBoxes(np.stack([x1, y1, x2, y2], axis=1)[keep].astype(np.float32),
+                              confidences[keep].astype(np.float32), classes[keep])
+            results.append(StubResult(boxes))
+        return results
+
+@pytest.fixture
+def stub_models(monkeypatch):
+    models = {}
+    monkeypatch.setattr(analyzer, "yolo_available", lambda: True)
+    monkeypatch.setattr(analyzer, "get_yolo_model", lambda model_path: models.setdefault(model_path, StubYOLO(model_path)))
+    return models
+
+# Seven frames: batch_size=3 leaves a trailing partial batch, and the unreadable frame sits
+# in the middle batch
+FRAMES = [f"/frames/frame_{i}_00m{i:02d}s.jpg" for i in range(4)] + ["/frames/missing_frame.jpg"] + \
+         [f"/frames/frame_{i}_00m{i:02d}s.jpg" for i in range(5, 7)]
+
+def test_batched_detection_matches_per_image(stub_models):
+    per_image = [analyzer.detect_objects_with_yolo(frame) for frame in FRAMES]
+    assert per_image[4] == []
+    assert all(per_image[i] for i in range(len(FRAMES)) if i != 4)
+
+    for batch_size in (1, 3, 8):
+        assert analyzer.detect_objects_with_yolo_batch(FRAMES, batch_size=batch_size) == per_image
+
+def test_failed_batch_is_retried_frame_by_frame(stub_models):
+    analyzer.detect_objects_with_yolo_batch(FRAMES, batch_size=3)
+
+    for config in analyzer.YOLO_MODEL_CONFIGS:
+        # [0:3], then the failing [3:6] and its three single-frame retries, then the trailing [6:7]
+        assert stub_models[config["model"]].call_sizes == [3, 3, 1, 1, 1, 1]